@@ -0,0 +1,212 @@
+"""
+入站 HTTP/2 并发流基准
+本地启动一个逐事件延迟输出的 SSE 上游桩与代理，分别以 WSGI 引擎（HTTP/1.1）、
+异步引擎 HTTP/1.1、异步引擎 h2 三种方式并发发起流式请求，
+输出首个事件延迟（TTFB）与整条流耗时的 p50/p95，以及代理接受的入站连接数。
+HTTP/1.1 下每个并发流占用一条 TLS 连接，h2 下全部流复用同一条连接。
+客户端与代理在同一进程内运行，结果用于相对比较。
+
+需要已生成的代理证书（与 MTGA 启动代理时相同的证书路径）。
+
+用法（在 python-src 目录下）：
+    python -m benchmarks.bench_inbound_http2 [--streams 50] [--events 20] [--delay 0.02]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# 与应用入口一致，在导入 modules 之前注入平台（决定证书路径）
+os.environ.setdefault("MTGA_PLATFORM", "tauri")
+
+from modules.proxy.proxy_server import ProxyServer  # noqa: E402
+from modules.runtime.resource_manager import ResourceManager  # noqa: E402
+from modules.runtime.thread_manager import ThreadManager  # noqa: E402
+
+SCENARIOS = (
+    ("wsgi", "wsgi", False),
+    ("asgi-http1.1", "asgi", False),
+    ("asgi-h2", "asgi", True),
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address) -> None:
+        # 代理停止时断开的池化连接，不计入结果
+        pass
+
+
+def _start_upstream(events: int, delay: float) -> ThreadingHTTPServer:
+    chunk = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": {"content": "hello"}, "finish_reason": None}],
+    }
+    event = b"data: " + json.dumps(chunk).encode() + b"\n\n"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            # 代理转发 [DONE] 后即关闭上游响应，结束块可能写入已关闭的连接
+            with contextlib.suppress(ConnectionError):
+                for data in [event] * events + [b"data: [DONE]\n\n"]:
+                    time.sleep(delay)
+                    self.wfile.write(b"%x\r\n%b\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+    server = _UpstreamServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _run_streams(
+    url: str, streams: int, *, http2: bool, auth_key: str
+) -> list[tuple[float, float]]:
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+    body = {"model": "gpt-4o", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+    # 未配置 mtga_auth_key 时代理接受任意 Bearer 令牌
+    headers = {"Authorization": f"Bearer {auth_key or 'bench'}"}
+
+    async with httpx.AsyncClient(
+        http2=http2, verify=False, trust_env=False, limits=limits, timeout=60, headers=headers
+    ) as client:
+
+        async def one() -> tuple[float, float]:
+            started = time.perf_counter()
+            first = 0.0
+            async with client.stream("POST", url, json=body) as response:
+                response.raise_for_status()
+                expected = "HTTP/2" if http2 else "HTTP/1.1"
+                if response.http_version != expected:
+                    raise RuntimeError(f"协商到 {response.http_version}，预期 {expected}")
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and not first:
+                        first = time.perf_counter() - started
+            return first, time.perf_counter() - started
+
+        return await asyncio.gather(*(one() for _ in range(streams)))
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+def _run_scenario(
+    engine: str, http2: bool, *, upstream_port: int, streams: int, rounds: int
+) -> dict[str, float]:
+    port = _free_port()
+    config = {
+        "api_url": f"http://127.0.0.1:{upstream_port}",
+        "model_id": "gpt-4o",
+        "api_key": "bench",
+        "proxy_engine": engine,
+        "server_http2": http2,
+        "server_workers": streams,
+        "server_queue_size": streams,
+        "admission_max_concurrent": streams,
+        "upstream_pool_size": streams,
+        "upstream_prewarm": 0,
+    }
+    proxy = ProxyServer(config, lambda _message: None, thread_manager=ThreadManager())
+    if proxy.engine != engine or not proxy.start(host="127.0.0.1", port=port):
+        raise SystemExit(f"{engine} 代理启动失败")
+    url = f"https://127.0.0.1:{port}/v1/chat/completions"
+    auth_key = proxy.app_layer.auth.mtga_auth_key
+    try:
+        samples: list[tuple[float, float]] = []
+        for _ in range(rounds):
+            samples += asyncio.run(_run_streams(url, streams, http2=http2, auth_key=auth_key))
+    finally:
+        proxy.stop()
+    # 入站连接数在连接关闭时记录，停止后读取
+    counters = proxy.get_stats().get("counters") or {}
+    ttfb = [first for first, _ in samples]
+    total = [elapsed for _, elapsed in samples]
+    return {
+        "ttfb_p50": statistics.median(ttfb) * 1000,
+        "ttfb_p95": _percentile(ttfb, 0.95) * 1000,
+        "total_p50": statistics.median(total) * 1000,
+        "total_p95": _percentile(total, 0.95) * 1000,
+        "connections": counters.get("inbound_connections", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="入站 HTTP/2 并发流基准")
+    parser.add_argument("--streams", type=int, default=50, help="并发流数量")
+    parser.add_argument("--events", type=int, default=20, help="每条流的事件数")
+    parser.add_argument("--delay", type=float, default=0.02, help="上游事件间隔（秒）")
+    parser.add_argument("--rounds", type=int, default=3, help="每种方式重复的轮数")
+    args = parser.parse_args()
+
+    resource_manager = ResourceManager()
+    if not all(
+        os.path.exists(path)
+        for path in (resource_manager.get_cert_file(), resource_manager.get_key_file())
+    ):
+        raise SystemExit("代理证书不存在，请先在 MTGA 中生成证书")
+
+    upstream = _start_upstream(args.events, args.delay)
+    upstream_port = upstream.server_address[1]
+    print(
+        f"并发流 {args.streams}，每流 {args.events} 个事件，事件间隔 {args.delay * 1000:.0f} ms，"
+        f"{args.rounds} 轮，单位: ms"
+    )
+    print(
+        f"{'scenario':>14} {'ttfb_p50':>9} {'ttfb_p95':>9} {'total_p50':>10} "
+        f"{'total_p95':>10} {'conns':>6}"
+    )
+    try:
+        for name, engine, http2 in SCENARIOS:
+            result = _run_scenario(
+                engine,
+                http2,
+                upstream_port=upstream_port,
+                streams=args.streams,
+                rounds=args.rounds,
+            )
+            print(
+                f"{name:>14} {result['ttfb_p50']:>9.1f} {result['ttfb_p95']:>9.1f} "
+                f"{result['total_p50']:>10.1f} {result['total_p95']:>10.1f} "
+                f"{result['connections']:>6}"
+            )
+    finally:
+        upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
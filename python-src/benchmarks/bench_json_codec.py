@@ -0,0 +1,117 @@
+"""
+JSON 编解码微基准
+读取 debug_mode 下记录的 SSE 原始日志（logs/sse_*.log），逐事件对比各后端的解码与编码耗时，
+并校验解码结果与 json.loads 一致、dumps 输出与 json.dumps(ensure_ascii=False) 逐字节一致。
+未指定日志时使用内置的合成流。
+
+用法（在 python-src 目录下）：
+    python -m benchmarks.bench_json_codec [logs/sse_xxx.log ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+
+from modules.proxy.proxy_json import JsonCodec, available_json_codecs
+from modules.proxy.proxy_sse import SseFramer
+
+
+def _synthetic_stream(events: int) -> bytes:
+    parts: list[bytes] = []
+    for index in range(events):
+        payload = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": f"第 {index} 个 token, hello world"},
+                    "logprobs": None,
+                    "finish_reason": None,
+                }
+            ],
+        }
+        parts.append(b"data: " + json.dumps(payload, ensure_ascii=False).encode() + b"\n\n")
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def _extract_payloads(raw: bytes) -> list[bytes]:
+    framer = SseFramer()
+    payloads: list[bytes] = []
+    for event in [*framer.feed(raw), framer.flush()]:
+        for line in event.splitlines():
+            if line.startswith(b"data:"):
+                data = line[5:].strip()
+                if data and data != b"[DONE]":
+                    payloads.append(data)
+    return payloads
+
+
+def _per_item_ns(func: Callable[[object], object], items: list, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            func(item)
+    return (time.perf_counter() - started) / (rounds * len(items)) * 1e9
+
+
+def _check_compat(codec: JsonCodec, payloads: list[bytes], objects: list) -> None:
+    for payload, obj in zip(payloads, objects, strict=True):
+        if codec.loads(payload) != obj:
+            raise RuntimeError(f"{codec.name} 解码结果与 json.loads 不一致: {payload!r}")
+        if codec.dumps(obj) != json.dumps(obj, ensure_ascii=False):
+            raise RuntimeError(f"{codec.name} dumps 输出与标准库不一致: {payload!r}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON 编解码微基准")
+    parser.add_argument("logs", nargs="*", help="SSE 原始日志文件")
+    parser.add_argument("--rounds", type=int, default=20, help="每个后端重复的轮数")
+    parser.add_argument("--events", type=int, default=2000, help="合成流的事件数")
+    args = parser.parse_args()
+
+    if args.logs:
+        raw = b""
+        for path in args.logs:
+            with open(path, "rb") as f:
+                raw += f.read()
+                if not raw.endswith(b"\n\n"):
+                    raw += b"\n\n"
+        source = ", ".join(args.logs)
+    else:
+        raw = _synthetic_stream(args.events)
+        source = f"合成流 {args.events} 个事件"
+
+    payloads = _extract_payloads(raw)
+    if not payloads:
+        raise SystemExit("日志中没有可解析的 data 事件")
+    objects = [json.loads(payload) for payload in payloads]
+    request_body = {
+        "model": "gpt-4o",
+        "stream": True,
+        "messages": [{"role": "user", "content": obj} for obj in objects[:200]],
+    }
+
+    print(f"数据: {source}，事件 {len(payloads)} 个，单位: ns/事件")
+    print(f"{'backend':>10} {'loads':>10} {'dumps':>10} {'dumps_body':>12}")
+    baseline_dumps = _per_item_ns(
+        lambda obj: json.dumps(obj, ensure_ascii=False), objects, args.rounds
+    )
+    print(f"{'(stdlib)':>10} {'':>10} {baseline_dumps:>10.0f} {'':>12}")
+    for codec in available_json_codecs():
+        _check_compat(codec, payloads, objects)
+        loads_ns = _per_item_ns(codec.loads, payloads, args.rounds)
+        dumps_ns = _per_item_ns(codec.dumps, objects, args.rounds)
+        body_ns = _per_item_ns(codec.dumps_body, [request_body], args.rounds * 10)
+        print(f"{codec.name:>10} {loads_ns:>10.0f} {dumps_ns:>10.0f} {body_ns:>12.0f}")
+    print("dumps_body 为单个 200 条消息请求体的编码耗时")
+
+
+if __name__ == "__main__":
+    main()
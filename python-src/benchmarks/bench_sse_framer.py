@@ -0,0 +1,96 @@
+"""
+SSE 分帧微基准
+对比旧的 bytes 拼接切分与 SseFramer：
+    小事件    事件数固定，上游单次 chunk 逐步变大，输出每个事件的平均耗时；
+              SseFramer 的单事件成本应基本不随 chunk 增大而变化
+    大事件    一个很长的 tool_call 参数事件按不同 chunk 大小分段到达，输出切出该事件的总耗时
+
+用法（在 python-src 目录下）：
+    python -m benchmarks.bench_sse_framer
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from collections.abc import Callable, Iterable
+
+from modules.proxy.proxy_sse import SseFramer
+
+EVENT = b'data: {"choices":[{"delta":{"content":"hello"}}]}\n\n'
+CHUNK_SIZES = (len(EVENT), 256, 4 * 1024, 64 * 1024, 1024 * 1024)
+LARGE_EVENT = (
+    b'data: {"choices":[{"delta":{"tool_calls":[{"index":0,"function":{"arguments":"'
+    + b"x" * (4 * 1024 * 1024)
+    + b'"}}]}}]}\n\n'
+)
+LARGE_CHUNK_SIZES = (4 * 1024, 64 * 1024, len(LARGE_EVENT))
+
+
+def _legacy_split_events(buffer: bytes) -> tuple[list[bytes], bytes]:
+    events: list[bytes] = []
+    while True:
+        sep = buffer.find(b"\n\n")
+        if sep == -1:
+            break
+        events.append(buffer[:sep])
+        buffer = buffer[sep + 2 :]
+    return events, buffer
+
+
+def legacy_split(chunks: Iterable[bytes]) -> int:
+    """原 extract_sse_events 的切分方式：每次拼接并复制剩余缓冲区。"""
+    count = 0
+    buffer = b""
+    for chunk in chunks:
+        events, buffer = _legacy_split_events(buffer + chunk)
+        count += len(events)
+    return count
+
+
+def framer_split(chunks: Iterable[bytes]) -> int:
+    framer = SseFramer()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    return count
+
+
+def _chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def _measure(func: Callable[[Iterable[bytes]], int], chunks: list[bytes], events: int) -> float:
+    started = time.perf_counter()
+    count = func(chunks)
+    elapsed = time.perf_counter() - started
+    if count != events:
+        raise RuntimeError(f"{func.__name__} 事件数不符: {count} != {events}")
+    return elapsed / events * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE 分帧微基准")
+    parser.add_argument("--events", type=int, default=40_000, help="每轮的事件数")
+    args = parser.parse_args()
+
+    data = EVENT * args.events
+    print(f"事件数 {args.events}，单事件 {len(EVENT)} 字节，单位: ns/事件")
+    print(f"{'chunk':>10} {'legacy':>12} {'framer':>12}")
+    for size in CHUNK_SIZES:
+        chunks = _chunked(data, size)
+        legacy = _measure(legacy_split, chunks, args.events)
+        framer = _measure(framer_split, chunks, args.events)
+        print(f"{size:>10} {legacy:>12.0f} {framer:>12.0f}")
+
+    print(f"\n单个大事件 {len(LARGE_EVENT)} 字节，单位: ms")
+    print(f"{'chunk':>10} {'legacy':>12} {'framer':>12}")
+    for size in LARGE_CHUNK_SIZES:
+        chunks = _chunked(LARGE_EVENT, size)
+        legacy = _measure(legacy_split, chunks, 1) / 1e6
+        framer = _measure(framer_split, chunks, 1) / 1e6
+        print(f"{size:>10} {legacy:>12.1f} {framer:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -74,11 +74,19 @@ class ProxyUiCoordinator:
                 log=self._deps.log,
                 stop_proxy_instance=self.stop_proxy_instance,
                 start_proxy_instance=self.start_proxy_instance,
+                reload_proxy_instance=self.reload_proxy_instance,
             ),
             success_message=success_message,
             hosts_modified=hosts_modified,
         )
 
+    def reload_proxy_instance(self, config: dict[str, Any]) -> OperationResult:
+        return proxy_orchestration.reload_proxy_instance_result(
+            config=config,
+            get_proxy_instance=self._deps.get_proxy_instance,
+            log=self._deps.log,
+        )
+
     def stop_proxy_instance(
         self, reason: str = "stop", show_idle_message: bool = False
     ) -> OperationResult:
@@ -0,0 +1,175 @@
+"""
+聊天补全请求的准入控制
+同时转发的请求数达到上限后，新请求进入有界等待队列；队列已满立即返回 429，
+排队超时返回 503，两者都带 Retry-After。流式响应在整个流结束后才释放名额。
+
+异步引擎由 AdmissionController 在事件循环中排队。WSGI 引擎在线程里排队会占住工作线程，
+改由 PooledWSGIServer 在连接进入工作线程之前排队（线程数即并发上限，连接队列即等待队列），
+排队时间经 bind_queue_wait 交给处理该连接的请求。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from modules.proxy.proxy_config import AdmissionConfig
+from modules.proxy.proxy_stats import ProxyStats
+
+REJECT_QUEUE_FULL = 429
+REJECT_QUEUE_TIMEOUT = 503
+
+_local = threading.local()
+
+
+def rejection_payload(status: int) -> dict:
+    """准入被拒绝时的响应体。"""
+    if status == REJECT_QUEUE_FULL:
+        message, error_type = "Too many concurrent requests, please retry later", "rate_limit_error"
+    else:
+        message, error_type = "Proxy is overloaded, please retry later", "server_error"
+    return {"error": {"message": message, "type": error_type}}
+
+
+@contextlib.contextmanager
+def bind_queue_wait(wait: float) -> Iterator[None]:
+    """WSGI 工作线程处理一条连接期间登记该连接在连接队列中的等待时间。"""
+    _local.queue_wait = wait
+    try:
+        yield
+    finally:
+        _local.queue_wait = 0.0
+
+
+def take_queue_wait() -> float:
+    """取出当前连接的排队时间，同一连接上只有第一个聊天请求计入。"""
+    wait = getattr(_local, "queue_wait", 0.0)
+    _local.queue_wait = 0.0
+    return wait
+
+
+@dataclass
+class Admission:
+    """一次准入的结果；admitted 为 True 时须调用 release 归还名额（可重复调用）。"""
+
+    admitted: bool
+    wait: float = 0.0
+    status: int | None = None
+    retry_after: int = 0
+    _controller: AdmissionController | None = field(default=None, repr=False)
+
+    def release(self) -> None:
+        controller = self._controller
+        self._controller = None
+        if controller is not None:
+            controller.release_slot()
+
+
+class AdmissionController:
+    """异步引擎的并发上限加有界等待队列，配置可在热重载时替换，已占用的名额保持不变。"""
+
+    def __init__(self, config: AdmissionConfig, *, stats: ProxyStats) -> None:
+        self._config = config
+        self._stats = stats
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._async_waiters: collections.deque[asyncio.Future] = collections.deque()
+
+    @property
+    def config(self) -> AdmissionConfig:
+        return self._config
+
+    def configure(self, config: AdmissionConfig) -> None:
+        # 排队的协程在下一次释放名额时按新上限转交
+        with self._lock:
+            self._config = config
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "admission_active": self._active,
+                "admission_waiting": self._waiting,
+                "admission_limit": self._config.max_concurrent,
+            }
+
+    def _has_free_slot(self) -> bool:
+        limit = self._config.max_concurrent
+        return limit <= 0 or self._active < limit
+
+    def _try_enter(self) -> Admission | None:
+        """在锁内调用：有空闲名额且无人排队时直接占用，队列已满时拒绝，否则返回 None。"""
+        if self._waiting == 0 and self._has_free_slot():
+            self._active += 1
+            return Admission(True, _controller=self)
+        if self._waiting >= self._config.max_queued:
+            self._stats.incr("admission_rejected_full")
+            return Admission(False, status=REJECT_QUEUE_FULL, retry_after=self._config.retry_after)
+        return None
+
+    def _finish_wait(self, started: float, admitted: bool) -> Admission:
+        wait = time.perf_counter() - started
+        self._stats.record_admission_wait(wait, admitted=admitted)
+        if admitted:
+            return Admission(True, wait, _controller=self)
+        return Admission(
+            False, wait, status=REJECT_QUEUE_TIMEOUT, retry_after=self._config.retry_after
+        )
+
+    async def aacquire(self) -> Admission:
+        """名额释放时直接转交给队首的等待者。"""
+        started = time.perf_counter()
+        with self._lock:
+            admission = self._try_enter()
+            if admission is not None:
+                return admission
+            waiter = asyncio.get_running_loop().create_future()
+            self._async_waiters.append(waiter)
+            self._waiting += 1
+        try:
+            await asyncio.wait({waiter}, timeout=self._config.queue_timeout)
+        except BaseException:
+            # 请求在排队时被取消（客户端断开或服务器停止），已转交的名额要归还
+            if self._abandon(waiter):
+                self.release_slot()
+            raise
+        return self._finish_wait(started, self._abandon(waiter))
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """结束排队，返回名额是否已转交给该等待者。"""
+        with self._lock:
+            if waiter.done():
+                return True
+            waiter.cancel()
+            self._async_waiters.remove(waiter)
+            self._waiting -= 1
+            return False
+
+    def _hand_over_async(self) -> None:
+        """在锁内调用：把空闲名额转交给排队的协程，名额计数在转交时占用。"""
+        while self._async_waiters and self._has_free_slot():
+            waiter = self._async_waiters.popleft()
+            self._waiting -= 1
+            self._active += 1
+            waiter.set_result(None)
+
+    def release_slot(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._hand_over_async()
+
+
+__all__ = [
+    "REJECT_QUEUE_FULL",
+    "REJECT_QUEUE_TIMEOUT",
+    "Admission",
+    "AdmissionController",
+    "bind_queue_wait",
+    "rejection_payload",
+    "take_queue_wait",
+]
@@ -0,0 +1,192 @@
+"""
+流式响应聚合为 JSON
+stream_mode 为 "true" 而客户端请求非流式时，上游仍以流式返回（更早发现失败，不会因长时间
+没有响应数据而触发空闲超时），这里逐个合并上游事件，结束后组装为一个 chat.completion：
+    content / reasoning_content   按 choice 拼接文本增量
+    tool_calls                    按 index 合并，参数片段依次拼接
+    function_call                 同上（旧版函数调用）
+    finish_reason / usage         取最后一次出现的值
+只保留合并后的状态，不缓存原始事件，内存占用与生成的内容大小相当，与事件数量无关。
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+
+from modules.proxy.proxy_json import loads
+
+# 上游在流中返回错误事件时使用的状态码
+STREAM_ERROR_STATUS = 502
+
+
+class _ToolCallState:
+    __slots__ = ("arguments", "id", "name", "type")
+
+    def __init__(self) -> None:
+        self.id: str | None = None
+        self.type: str | None = None
+        self.name: str | None = None
+        self.arguments: list[str] = []
+
+    def merge(self, fragment: dict) -> None:
+        if fragment.get("id"):
+            self.id = fragment["id"]
+        if fragment.get("type"):
+            self.type = fragment["type"]
+        function = fragment.get("function") or fragment
+        # 部分上游在每个片段中重复函数名，只有参数是增量
+        if function.get("name"):
+            self.name = function["name"]
+        if isinstance(function.get("arguments"), str):
+            self.arguments.append(function["arguments"])
+
+    def function(self) -> dict:
+        return {"name": self.name or "", "arguments": "".join(self.arguments)}
+
+
+class _ChoiceState:
+    __slots__ = (
+        "content",
+        "finish_reason",
+        "function_call",
+        "logprobs",
+        "reasoning",
+        "role",
+        "tool_calls",
+    )
+
+    def __init__(self) -> None:
+        self.role: str | None = None
+        self.content: list[str] = []
+        self.reasoning: list[str] = []
+        self.tool_calls: dict[int, _ToolCallState] = {}
+        self.function_call: _ToolCallState | None = None
+        self.logprobs: list | None = None
+        self.finish_reason: str | None = None
+
+    def merge(self, choice: dict) -> None:
+        delta = choice.get("delta") or choice.get("message") or {}
+        if delta.get("role"):
+            self.role = delta["role"]
+        if isinstance(delta.get("content"), str):
+            self.content.append(delta["content"])
+        if isinstance(delta.get("reasoning_content"), str):
+            self.reasoning.append(delta["reasoning_content"])
+        for position, fragment in enumerate(delta.get("tool_calls") or []):
+            if isinstance(fragment, dict):
+                index = fragment.get("index", position)
+                self.tool_calls.setdefault(index, _ToolCallState()).merge(fragment)
+        if isinstance(delta.get("function_call"), dict):
+            if self.function_call is None:
+                self.function_call = _ToolCallState()
+            self.function_call.merge(delta["function_call"])
+        logprobs = choice.get("logprobs")
+        if isinstance(logprobs, dict) and isinstance(logprobs.get("content"), list):
+            if self.logprobs is None:
+                self.logprobs = []
+            self.logprobs.extend(logprobs["content"])
+        if choice.get("finish_reason"):
+            self.finish_reason = choice["finish_reason"]
+
+    def result(self, index: int) -> dict:
+        message: dict[str, object] = {"role": self.role or "assistant"}
+        has_call = bool(self.tool_calls) or self.function_call is not None
+        # 只有函数调用时 content 为 null，与上游的非流式响应一致
+        message["content"] = "".join(self.content) if self.content or not has_call else None
+        if self.reasoning:
+            message["reasoning_content"] = "".join(self.reasoning)
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": call.id or f"call_{uuid.uuid4().hex[:24]}",
+                    "type": call.type or "function",
+                    "function": call.function(),
+                }
+                for _index, call in sorted(self.tool_calls.items())
+            ]
+        if self.function_call is not None:
+            message["function_call"] = self.function_call.function()
+        default_reason = "tool_calls" if self.tool_calls else "stop"
+        return {
+            "index": index,
+            "message": message,
+            "logprobs": {"content": self.logprobs} if self.logprobs is not None else None,
+            "finish_reason": self.finish_reason or default_reason,
+        }
+
+
+class StreamAggregator:
+    """逐个合并上游 SSE 事件，result() 返回组装后的响应体与状态码。"""
+
+    def __init__(self, *, model_name: str, log) -> None:
+        self._model_name = model_name
+        self._log = log
+        self._fields: dict[str, object] = {}
+        self._choices: dict[int, _ChoiceState] = {}
+        self.usage: dict | None = None
+        self.error: dict | None = None
+        self.events = 0
+        self.done = False
+
+    @property
+    def finished(self) -> bool:
+        """已收到 [DONE] 或错误事件，不必继续读取上游。"""
+        return self.done or self.error is not None
+
+    def feed(self, raw_event: bytes) -> None:
+        event_text = raw_event.decode("utf-8", errors="replace")
+        data_lines = [
+            line[len("data:") :].lstrip()
+            for line in event_text.splitlines()
+            if line.startswith("data:")
+        ]
+        if not data_lines:
+            return
+        data_str = "\n".join(data_lines)
+        if data_str.strip() == "[DONE]":
+            self.done = True
+            return
+        self.events += 1
+        try:
+            payload = loads(data_str)
+        except ValueError as exc:
+            self._log(f"evt#{self.events} JSON 解析失败，聚合时跳过: {exc}")
+            return
+        if not isinstance(payload, dict):
+            return
+        if payload.get("error"):
+            self.error = payload
+            return
+        for key in ("id", "created", "model", "system_fingerprint"):
+            if key not in self._fields and payload.get(key):
+                self._fields[key] = payload[key]
+        if payload.get("usage"):
+            self.usage = payload["usage"]
+        for position, choice in enumerate(payload.get("choices") or []):
+            if isinstance(choice, dict):
+                index = choice.get("index", position)
+                self._choices.setdefault(index, _ChoiceState()).merge(choice)
+
+    def result(self) -> tuple[dict, int]:
+        if self.error is not None:
+            self._log(f"上游流式响应返回错误，返回 {STREAM_ERROR_STATUS}: {self.error}")
+            return self.error, STREAM_ERROR_STATUS
+        if not self.done:
+            self._log(f"未收到上游 [DONE]，按已收到的 {self.events} 个事件组装响应")
+        fields = self._fields
+        response: dict[str, object] = {
+            "id": fields.get("id") or f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": fields.get("created") or int(time.time()),
+            "model": fields.get("model") or self._model_name,
+            "choices": [state.result(index) for index, state in sorted(self._choices.items())],
+        }
+        if "system_fingerprint" in fields:
+            response["system_fingerprint"] = fields["system_fingerprint"]
+        if self.usage is not None:
+            response["usage"] = self.usage
+        return response, 200
+
+
+__all__ = ["STREAM_ERROR_STATUS", "StreamAggregator"]
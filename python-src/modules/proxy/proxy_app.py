@@ -3,31 +3,85 @@ from __future__ import annotations
 import contextlib
 import json
 import logging
+import threading
 import time
 import uuid
+from collections.abc import Callable, Iterator
 
 import requests
 from flask import Flask, Response, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import ClosingIterator
 
+from modules.proxy.proxy_admission import AdmissionController, take_queue_wait
+from modules.proxy.proxy_aggregate import StreamAggregator
+from modules.proxy.proxy_async_transport import missing_http2_dependencies
 from modules.proxy.proxy_auth import ProxyAuth
-from modules.proxy.proxy_config import DEFAULT_MIDDLE_ROUTE, ProxyConfig, build_proxy_config
-from modules.proxy.proxy_transport import ProxyTransport
+from modules.proxy.proxy_body import UpstreamBody, rewrite_request_body
+from modules.proxy.proxy_coalesce import SseCoalescer
+from modules.proxy.proxy_config import (
+    DEFAULT_MAX_REQUEST_BODY_MB,
+    DEFAULT_MIDDLE_ROUTE,
+    ProxyConfig,
+    SocketTuningConfig,
+    StreamConfig,
+    UpstreamTimeoutConfig,
+    build_proxy_config,
+)
+from modules.proxy.proxy_deadline import (
+    UpstreamDeadlines,
+    UpstreamTimeout,
+    earliest_timeout,
+    timeout_error_payload,
+)
+from modules.proxy.proxy_disconnect import (
+    STAGE_BODY,
+    STAGE_STREAM,
+    DisconnectWatcher,
+    UpstreamCancel,
+)
+from modules.proxy.proxy_http2_transport import Http2ProxyTransport
+from modules.proxy.proxy_json import dumps, dumps_body, loads
+from modules.proxy.proxy_readahead import READ_AHEAD_EVENTS, iter_with_deadline
+from modules.proxy.proxy_simulate import iter_simulated_events
+from modules.proxy.proxy_stats import ProxyStats, StreamStats
+from modules.proxy.proxy_stream import SseStreamProcessor
+from modules.proxy.proxy_transport import BaseProxyTransport, ProxyTransport
+from modules.proxy.proxy_warmup import UpstreamWarmer
 from modules.runtime.resource_manager import ResourceManager
+from modules.runtime.thread_manager import ThreadManager
+
+# 客户端在响应之前断开时使用的状态码（nginx 约定），客户端不会收到
+CLIENT_CLOSED_REQUEST = 499
 
 
 class ProxyApp:
     """代理服务的领域逻辑：配置解析 + Flask 路由 + 上游转发。"""
 
-    def __init__(self, config=None, log_func=print, *, resource_manager: ResourceManager):
+    def __init__(  # noqa: PLR0913, PLR0915
+        self,
+        config=None,
+        log_func=print,
+        *,
+        resource_manager: ResourceManager,
+        stats: ProxyStats | None = None,
+        proxy_config: ProxyConfig | None = None,
+        transport=None,
+        admission: AdmissionController | None = None,
+    ):
+        """proxy_config 为已解析的配置；transport 与 admission 为热重载时沿用的旧实例对象。"""
         self.config = config or {}
         self.log_func = log_func
         self.resource_manager = resource_manager
+        self.stats = stats or ProxyStats()
         self.app: Flask | None = None
         self.valid = True
         self.proxy_config: ProxyConfig | None = None
         self.auth: ProxyAuth | None = None
         self.transport: ProxyTransport | None = None
         self.http_client: requests.Session | None = None
+        self.upstream_warmer: UpstreamWarmer | None = None
+        self.admission: AdmissionController | None = None
         self.target_api_base_url = ""
         self.middle_route = ""
         self.inbound_route = DEFAULT_MIDDLE_ROUTE
@@ -35,9 +89,18 @@ class ProxyApp:
         self.target_model_id = ""
         self.stream_mode = None
         self.debug_mode = False
+        self.sse_passthrough = False
+        self.stream_config = StreamConfig()
+        self.timeout_config = UpstreamTimeoutConfig()
+        self.max_request_body = DEFAULT_MAX_REQUEST_BODY_MB * 1024 * 1024
         self.disable_ssl_strict_mode = False
+        self.disconnect_watcher = DisconnectWatcher()
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._retired = False
+        self._retire_close_transport = False
 
-        proxy_config = build_proxy_config(
+        proxy_config = proxy_config or build_proxy_config(
             self.config,
             resource_manager=self.resource_manager,
             log_func=self.log_func,
@@ -53,18 +116,137 @@ class ProxyApp:
         self.target_model_id = proxy_config.target_model_id
         self.stream_mode = proxy_config.stream_mode  # None, 'true', 'false'
         self.debug_mode = proxy_config.debug_mode
+        self.sse_passthrough = proxy_config.sse_passthrough
+        self.stream_config = proxy_config.stream
+        self.timeout_config = proxy_config.upstream_timeouts
+        self.max_request_body = proxy_config.max_request_body
         self.disable_ssl_strict_mode = proxy_config.disable_ssl_strict_mode
         self.auth = ProxyAuth(proxy_config.mtga_auth_key)
-        self.transport = ProxyTransport(
+        self.upstream_warmer = UpstreamWarmer(
+            proxy_config.upstream_pool, log=self.log_func, stats=self.stats
+        )
+        self.admission = self._create_admission(admission)
+        if transport is None:
+            self._create_transport()
+        else:
+            self._adopt_transport(transport)
+        self._create_app()
+
+    def _create_admission(
+        self, admission: AdmissionController | None
+    ) -> AdmissionController | None:
+        """WSGI 引擎在 PooledWSGIServer 的连接队列中排队，应用内不做准入。"""
+        return None
+
+    def _socket_config(self) -> SocketTuningConfig | None:
+        return self.proxy_config.socket if self.proxy_config else None
+
+    def _adopt_transport(self, transport: ProxyTransport) -> None:
+        self.transport = transport
+        self.http_client = transport.session
+
+    @property
+    def shared_transport(self):
+        """热重载时可交给新实例沿用的传输层。"""
+        return self.transport
+
+    def can_share_transport(self, proxy_config: ProxyConfig) -> bool:
+        """TLS 校验、连接池与套接字参数不变时，新配置可沿用现有传输层及其已建立的上游连接。"""
+        current = self.proxy_config
+        return (
+            current is not None
+            and self.shared_transport is not None
+            and current.disable_ssl_strict_mode == proxy_config.disable_ssl_strict_mode
+            and current.upstream_pool == proxy_config.upstream_pool
+            and current.socket == proxy_config.socket
+        )
+
+    def take_over(self, previous: ProxyApp) -> None:
+        """热重载时接管旧实例的运行时状态，同步引擎无需处理。"""
+
+    def retire(self, *, close_transport: bool) -> None:
+        """被热重载替换后调用：停止预热，在途请求全部结束后释放资源。
+
+        close_transport 为 False 时传输层已交给新实例，不能关闭。
+        """
+        if self.upstream_warmer:
+            self.upstream_warmer.stop()
+        with self._inflight_lock:
+            self._retired = True
+            self._retire_close_transport = close_transport
+        self._release_if_idle()
+
+    def _release_if_idle(self) -> None:
+        with self._inflight_lock:
+            if not (self._retired and self._inflight == 0):
+                return
+            # 只释放一次
+            self._retired = False
+            close_transport = self._retire_close_transport
+        self._release(close_transport)
+
+    def _release(self, close_transport: bool) -> None:
+        if close_transport:
+            self.close()
+
+    def _enter_request(self) -> None:
+        with self._inflight_lock:
+            self._inflight += 1
+
+    def _leave_request(self) -> None:
+        with self._inflight_lock:
+            self._inflight -= 1
+        self._release_if_idle()
+
+    def _track_requests(self, wsgi_app):
+        """统计在途请求，流式响应在响应体迭代结束（close）时才算完成。"""
+
+        def tracked_app(environ, start_response):
+            self._enter_request()
+            try:
+                app_iter = wsgi_app(environ, start_response)
+            except BaseException:
+                self._leave_request()
+                raise
+            return ClosingIterator(app_iter, self._leave_request)
+
+        return tracked_app
+
+    def _create_transport(self) -> None:
+        pool_config = self.proxy_config.upstream_pool if self.proxy_config else None
+        transport_cls = ProxyTransport
+        if pool_config and pool_config.http2:
+            missing = missing_http2_dependencies()
+            if missing:
+                self.log_func(f"HTTP/2 依赖缺失 ({', '.join(missing)})，上游继续使用 HTTP/1.1")
+            else:
+                transport_cls = Http2ProxyTransport
+                self.log_func("上游启用 HTTP/2（ALPN 协商，不支持时回退到 HTTP/1.1）")
+        self.transport = transport_cls(
             resource_manager=self.resource_manager,
             disable_ssl_strict_mode=self.disable_ssl_strict_mode,
             log_func=self.log_func,
+            pool_config=pool_config,
+            socket_config=self._socket_config(),
         )
         self.http_client = self.transport.session
 
-        self._create_app()
+    def start_upstream_warmup(self, thread_manager: ThreadManager) -> None:
+        """运行时启动成功后调用：在后台预热上游连接并定期探测。"""
+        warmer = self.upstream_warmer
+        transport = self.transport
+        if not (warmer and warmer.enabled and transport):
+            return
+        url = self.target_api_base_url
+        thread_manager.run(
+            "proxy_upstream_warmup",
+            warmer.run,
+            args=(lambda count: transport.warm_up(url, count),),
+        )
 
     def close(self) -> None:
+        if self.upstream_warmer:
+            self.upstream_warmer.stop()
         if self.transport:
             self.transport.close()
 
@@ -93,44 +275,42 @@ class ProxyApp:
             return f"/{suffix.lstrip('/')}"
         return f"{middle_route.rstrip('/')}/{suffix.lstrip('/')}"
 
+    @property
+    def models_route(self) -> str:
+        return self._build_route(self.inbound_route, "models")
+
+    @property
+    def chat_route(self) -> str:
+        return self._build_route(self.inbound_route, "chat/completions")
+
+    @property
+    def chat_target_url(self) -> str:
+        return (
+            f"{self.target_api_base_url.rstrip('/')}"
+            f"{self._build_route(self.middle_route, 'chat/completions')}"
+        )
+
     def _create_app(self):
         self.app = Flask(__name__)
+        # 分块上传的请求体达到上限时 werkzeug 只截断不报错，多放行 1 字节以便识别超限
+        self.app.config["MAX_CONTENT_LENGTH"] = self.max_request_body + 1
+        self.app.wsgi_app = self._track_requests(self.app.wsgi_app)  # type: ignore[method-assign]
 
         if self.debug_mode:
             logging.getLogger().setLevel(logging.INFO)
             self.app.logger.setLevel(logging.INFO)
 
-        models_route = self._build_route(self.inbound_route, "models")
-        chat_route = self._build_route(self.inbound_route, "chat/completions")
-
-        self.app.add_url_rule(models_route, "get_models", self._get_models, methods=["GET"])
+        self.app.add_url_rule(self.models_route, "get_models", self._get_models, methods=["GET"])
         self.app.add_url_rule(
-            chat_route,
+            self.chat_route,
             "chat_completions",
             self._chat_completions,
             methods=["POST"],
         )
 
-    def _get_models(self):
-        self.log_func(f"收到模型列表请求 {self._build_route(self.inbound_route, 'models')}")
-
-        auth = self.auth
-        if not auth:
-            self.log_func("代理鉴权未就绪")
-            return jsonify(
-                {"error": {"message": "Proxy not ready", "type": "server_error"}}
-            ), 500
-
-        auth_header = request.headers.get("Authorization")
-        if not auth.verify(auth_header):
-            self.log_func("模型列表请求鉴权失败")
-            return jsonify(
-                {"error": {"message": "Invalid authentication", "type": "authentication_error"}}
-            ), 401
-
+    def _build_models_payload(self) -> dict:
         mapped_model_id = self._get_mapped_model_id()
-
-        model_data = {
+        return {
             "object": "list",
             "data": [
                 {
@@ -158,214 +338,727 @@ class ProxyApp:
             ],
         }
 
-        self.log_func(f"返回映射模型: {mapped_model_id}")
-        return jsonify(model_data)
-
-    def _chat_completions(self):  # noqa: PLR0911, PLR0912, PLR0915
-        request_id = self._new_request_id()
-
-        def log(message: str):
-            self._log_request(request_id, message)
-
-        log(f"收到聊天补全请求 {self._build_route(self.inbound_route, 'chat/completions')}")
-
+    def _check_models_auth(self, auth_header: str | None) -> tuple[dict, int] | None:
+        """模型列表鉴权，失败时返回错误响应体与状态码。"""
         auth = self.auth
-        transport = self.transport
-        http_client = self.http_client
-        if not (auth and transport and http_client):
-            log("代理服务未就绪")
-            return jsonify({"error": "Proxy not ready"}), 500
-
-        if self.debug_mode:
-            headers_str = "\\n".join(f"{k}: {v}" for k, v in request.headers.items())
-            log_message = (
-                f"--- 请求头 (调试模式) ---\\n{headers_str}\\n"
+        if not auth:
+            self.log_func("代理鉴权未就绪")
+            return {"error": {"message": "Proxy not ready", "type": "server_error"}}, 500
+        if not auth.verify(auth_header):
+            self.log_func("模型列表请求鉴权失败")
+            return {
+                "error": {"message": "Invalid authentication", "type": "authentication_error"}
+            }, 401
+        return None
+
+    def _log_debug_request(self, headers, body_reader, log) -> None:
+        headers_str = "\\n".join(f"{k}: {v}" for k, v in headers.items())
+        log_message = (
+            f"--- 请求头 (调试模式) ---\\n{headers_str}\\n"
+            "--------------------------------------"
+        )
+        try:
+            body_str = body_reader()
+            log_message += (
+                f"--- 请求体 (调试模式) ---\\n{body_str}\\n"
                 "--------------------------------------"
             )
-            try:
-                body_str = request.get_data(as_text=True)
-                log_message += (
-                    f"--- 请求体 (调试模式) ---\\n{body_str}\\n"
-                    "--------------------------------------"
-                )
-            except Exception as body_exc:
-                error_msg = f"读取请求体数据时出错: {body_exc}\\n"
-                log(error_msg)
-                log_message += error_msg
-            log(log_message)
+        except Exception as body_exc:
+            error_msg = f"读取请求体数据时出错: {body_exc}\\n"
+            log(error_msg)
+            log_message += error_msg
+        log(log_message)
 
-        request_data = request.get_json(silent=True)
+    @staticmethod
+    def _is_json_request(headers) -> bool:
+        content_type = (headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+        return content_type == "application/json" or content_type.endswith("+json")
+
+    def _parse_json_body(self, headers, body: bytes) -> dict | None:
+        """按 Content-Type 解析请求体，只接受 JSON 对象，失败返回 None。"""
+        if not self._is_json_request(headers):
+            return None
+        try:
+            request_data = loads(body)
+        except ValueError:
+            return None
+        return request_data if isinstance(request_data, dict) else None
 
-        if request_data is None:
-            log("解析 JSON 失败或请求不是 JSON 格式")
-            log(f"Content-Type: {request.headers.get('Content-Type')}")
-            return jsonify(
-                {
-                    "error": "Invalid JSON or Content-Type",
-                    "message": (
-                        "The request body must be valid JSON and the Content-Type header "
-                        "must be 'application/json'."
-                    ),
-                }
-            ), 400
+    @staticmethod
+    def _invalid_json_payload() -> dict:
+        return {
+            "error": "Invalid JSON or Content-Type",
+            "message": (
+                "The request body must be valid JSON and the Content-Type header "
+                "must be 'application/json'."
+            ),
+        }
+
+    def _body_too_large_payload(self) -> dict:
+        return {
+            "error": "Request body too large",
+            "message": f"The request body must not exceed {self.max_request_body} bytes.",
+        }
 
-        client_requested_stream = request_data.get("stream", False)
+    @staticmethod
+    def _auth_failed_payload() -> dict:
+        return {"error": {"message": "Invalid authentication", "type": "authentication_error"}}
+
+    def _log_request_overrides(self, fields: dict, log):
+        """记录 model/stream 的改写情况，返回客户端原始请求的流模式。"""
+        client_requested_stream = fields.get("stream", False)
         log(f"客户端请求的流模式: {client_requested_stream}")
 
-        if "model" in request_data:
-            original_model = request_data["model"]
-            log(f"替换模型名: {original_model} -> {self.target_model_id}")
-            request_data["model"] = self.target_model_id
+        if "model" in fields:
+            log(f"替换模型名: {fields['model']} -> {self.target_model_id}")
         else:
             log(f"请求中没有 model 字段，添加 model: {self.target_model_id}")
-            request_data["model"] = self.target_model_id
 
         if self.stream_mode is not None:
             stream_value = self.stream_mode == "true"
-            if "stream" in request_data:
-                original_stream_value = request_data["stream"]
-                log(f"强制修改流模式: {original_stream_value} -> {stream_value}")
-                request_data["stream"] = stream_value
+            if "stream" in fields:
+                log(f"强制修改流模式: {fields['stream']} -> {stream_value}")
             else:
                 log(f"请求中没有 stream 参数，设置为 {stream_value}")
-                request_data["stream"] = stream_value
+        return client_requested_stream
 
-        auth_header = request.headers.get("Authorization")
-        if not auth.verify(auth_header):
-            log("聊天补全请求MTGA鉴权失败")
-            return jsonify(
-                {"error": {"message": "Invalid authentication", "type": "authentication_error"}}
-            ), 401
+    def _apply_request_overrides(self, request_data: dict, log) -> bool:
+        """改写 model/stream 字段，返回客户端原始请求的流模式。"""
+        client_requested_stream = self._log_request_overrides(request_data, log)
+        request_data["model"] = self.target_model_id
+        if self.stream_mode is not None:
+            request_data["stream"] = self.stream_mode == "true"
+        return client_requested_stream
 
+    @staticmethod
+    def _requested_token_limit(fields: dict) -> int | None:
+        """客户端请求的输出 token 上限，用于估计中止上游请求时节省的 token。"""
+        for key in ("max_completion_tokens", "max_tokens"):
+            value = fields.get(key)
+            if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+                return value
+        return None
+
+    def _prepare_upstream_body(
+        self, headers, body: bytes, log
+    ) -> tuple[bytes | UpstreamBody, object, object, int | None] | None:
+        """改写请求体中的 model/stream，返回 (上游请求体, 客户端流模式, 转发流模式, token 上限)。
+
+        优先只改写原始字节中的顶层字段；不可用或请求体异常时回退到完整解析，
+        仍无法解析为 JSON 对象时返回 None。
+        """
+        if not self._is_json_request(headers):
+            return None
+        stream_override = None if self.stream_mode is None else self.stream_mode == "true"
+        rewritten = rewrite_request_body(body, model=self.target_model_id, stream=stream_override)
+        if rewritten is not None:
+            upstream_body, originals = rewritten
+            if self.debug_mode:
+                log(f"请求体按原始字节改写 ({len(body)} 字节)")
+            client_requested_stream = self._log_request_overrides(originals, log)
+            is_stream = (
+                client_requested_stream if stream_override is None else stream_override
+            )
+            return (
+                upstream_body,
+                client_requested_stream,
+                is_stream,
+                self._requested_token_limit(originals),
+            )
+
+        request_data = self._parse_json_body(headers, body)
+        if request_data is None:
+            return None
+        client_requested_stream = self._apply_request_overrides(request_data, log)
+        return (
+            dumps_body(request_data),
+            client_requested_stream,
+            request_data.get("stream", False),
+            self._requested_token_limit(request_data),
+        )
+
+    def _build_forward_headers(self, auth: ProxyAuth, auth_header: str | None, log) -> dict:
         target_api_key = ""
         if self.proxy_config:
             target_api_key = self.proxy_config.api_key
-        forward_headers = auth.build_forward_headers(
+        return auth.build_forward_headers(
             auth_header,
             target_api_key,
             log_func=log,
         )
 
+    def _open_sse_log(self, transport: BaseProxyTransport, log):
+        """调试模式下打开 SSE 原始数据记录文件，返回 (文件, ExitStack, 路径)。"""
+        if not self.debug_mode:
+            return None, None, None
         try:
-            target_url = (
-                f"{self.target_api_base_url.rstrip('/')}"
-                f"{self._build_route(self.middle_route, 'chat/completions')}"
+            log_path = transport.prepare_sse_log_path()
+            log_file_stack = contextlib.ExitStack()
+            log_file = log_file_stack.enter_context(open(log_path, "wb"))  # noqa: SIM115
+            log(f"SSE 原始数据将记录到: {log_path}")
+            return log_file, log_file_stack, log_path
+        except Exception as log_exc:  # noqa: BLE001
+            log(f"SSE 日志文件创建失败: {log_exc}")
+            return None, None, None
+
+    def _new_stream_processor(self, transport: BaseProxyTransport, log) -> SseStreamProcessor:
+        return SseStreamProcessor(
+            transport,
+            model_name=self.target_model_id,
+            debug_mode=self.debug_mode,
+            log=log,
+            passthrough=self.sse_passthrough,
+        )
+
+    def _new_coalescer(self) -> SseCoalescer:
+        stream_config = self.stream_config
+        return SseCoalescer(
+            stream_config.coalesce_window_ms / 1000,
+            stream_config.coalesce_max_bytes,
+            heartbeat=stream_config.heartbeat_interval,
+        )
+
+    def _new_aggregator(self, log) -> StreamAggregator:
+        self.stats.incr("streams_aggregated")
+        return StreamAggregator(model_name=self.target_model_id, log=log)
+
+    @staticmethod
+    def _is_event_stream(headers) -> bool:
+        """上游确实返回了 SSE；强制流式时部分上游仍返回 JSON，按非流式响应处理。"""
+        return "text/event-stream" in (headers.get("content-type") or "")
+
+    @staticmethod
+    def _aggregate_stream(  # noqa: PLR0913
+        aggregator: StreamAggregator,
+        transport: BaseProxyTransport,
+        response_from_target,
+        log,
+        *,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+    ) -> None:
+        """读取上游流式响应并逐个合并事件，直到 [DONE]、错误事件或上游结束。"""
+        cancel.set_interrupt(
+            lambda: transport.interrupt_response(response_from_target), stage=STAGE_STREAM
+        )
+        deadlines.response_started()
+        events = transport.extract_sse_events(response_from_target, log=log)
+        if deadlines.wait_timed:
+            events = iter_with_deadline(events, deadlines.timeout, size=READ_AHEAD_EVENTS)
+        with contextlib.closing(events):
+            for item in events:
+                if item is None:
+                    kind = deadlines.expired()
+                    if kind is not None:
+                        # 读取线程仍阻塞在上游读取上，先中断响应，关闭时不必等到上游返回数据
+                        transport.interrupt_response(response_from_target)
+                        raise UpstreamTimeout(kind)
+                    continue
+                _chunk_index, raw_event = item
+                deadlines.on_event(raw_event)
+                aggregator.feed(raw_event)
+                if aggregator.finished:
+                    return
+
+    @staticmethod
+    def _log_downstream_writes(coalescer: SseCoalescer, stream_stats: StreamStats, log) -> None:
+        if coalescer.enabled:
+            log(f"DOWN 合并写入: {coalescer.events} 个事件，{coalescer.writes} 次写出")
+        if coalescer.heartbeats:
+            log(f"DOWN 心跳: {coalescer.heartbeats} 次")
+        if stream_stats.buffer_size:
+            log(
+                f"读取阶段缓冲: 峰值 {stream_stats.buffered_max}/{stream_stats.buffer_size} 个事件"
             )
-            log(f"转发请求到: {target_url}")
 
-            is_stream = request_data.get("stream", False)
-            log(f"流模式: {is_stream}")
+    @staticmethod
+    def _paced(events: Iterator[bytes], delay: float) -> Iterator[bytes]:
+        for position, event in enumerate(events):
+            if position:
+                time.sleep(delay)
+            yield event
+
+    def _simulated_stream_events(self, response_json: dict, log) -> Iterator[bytes]:
+        """把非流式响应切分为 SSE 事件，事件间的等待由调用方按 simulated_delay_ms 控制。"""
+        return iter_simulated_events(
+            response_json, chunk_chars=self.stream_config.simulated_chunk_chars, log=log
+        )
 
-            response_from_target = http_client.post(
-                target_url,
-                json=request_data,
-                headers=forward_headers,
-                stream=is_stream,
-                timeout=300,
+    def _log_json_response(self, response_json: dict, log) -> None:
+        if self.debug_mode:
+            response_str = json.dumps(response_json, indent=2, ensure_ascii=False)
+            log(
+                f"--- 完整响应体 (调试模式) ---\\n{response_str}\\n"
+                "--------------------------------------"
             )
-            response_from_target.raise_for_status()
-            if self.debug_mode:
-                log(f"上游响应状态码: {response_from_target.status_code}")
-                log(f"上游 Content-Type: {response_from_target.headers.get('content-type')}")
+        else:
+            log("返回非流式 JSON 响应")
 
-            if is_stream:
-                log("返回流式响应")
+    @staticmethod
+    def _upstream_http_error(status_code: int, text: str, log) -> tuple[dict, int]:
+        log(f"目标 API HTTP 错误: {status_code} - {text}")
+        return {"error": f"Target API error: {status_code}", "details": text}, status_code
 
-                log_file = None
-                log_file_stack = None
-                log_path = None
-                if self.debug_mode:
-                    try:
-                        log_path = transport.prepare_sse_log_path()
-                        log_file_stack = contextlib.ExitStack()
-                        log_file = log_file_stack.enter_context(open(log_path, "wb"))  # noqa: SIM115
-                        log(f"SSE 原始数据将记录到: {log_path}")
-                    except Exception as log_exc:  # noqa: BLE001
-                        log(f"SSE 日志文件创建失败: {log_exc}")
-
-                def generate_stream():  # noqa: PLR0915, PLR0912
-                    nonlocal log_file, log_file_stack
-                    event_index = 0
-                    done_sent = False
-                    finish_reason_seen = None
+    @staticmethod
+    def _upstream_connect_error(exc: Exception, log) -> tuple[dict, int]:
+        log(f"连接目标 API 时出错: {exc}")
+        return {"error": f"Error contacting target API: {str(exc)}"}, 503
+
+    def _timeout_payload(self, kind: str, log, outcome: str) -> dict:
+        seconds = getattr(self.timeout_config, kind)
+        log(f"上游{UpstreamDeadlines.label(kind)}超时（{seconds} 秒），{outcome}")
+        self.stats.incr(f"upstream_timeout_{kind}")
+        return timeout_error_payload(kind, seconds)
+
+    def _upstream_timeout(self, kind: str, log) -> tuple[dict, int]:
+        return self._timeout_payload(kind, log, "返回 504"), 504
+
+    @staticmethod
+    def _sse_error_event(payload: dict) -> bytes:
+        """流式响应已开始后出错：以 SSE error 事件告知客户端，不再补发 [DONE]。"""
+        return f"data: {dumps(payload)}\n\n".encode()
+
+    def _upstream_timeout_event(self, kind: str, log) -> bytes:
+        payload = self._timeout_payload(kind, log, "流式响应已开始，以 SSE error 事件告知客户端")
+        return self._sse_error_event(payload)
+
+    def _watch_client_disconnect(self, cancel: UpstreamCancel) -> Callable[[], None]:
+        """监视当前请求的入站连接，客户端断开时中止上游请求；返回取消监视的函数。"""
+        sock = request.environ.get("werkzeug.socket")
+        if sock is None:
+            return lambda: None
+        return self.disconnect_watcher.watch(sock, cancel.cancel)
+
+    def _client_disconnected(
+        self, cancel: UpstreamCancel, log, *, events: int = 0, bytes_out: int = 0
+    ) -> None:
+        log(cancel.describe(events=events, bytes_out=bytes_out))
+        self.stats.incr(f"client_disconnect_{cancel.stage}")
+
+    @staticmethod
+    def _unexpected_error(exc: Exception, log) -> tuple[dict, int]:
+        log(f"发生意外错误: {exc}")
+        return {"error": "An internal server error occurred"}, 500
+
+    def _accept_upstream_response(
+        self,
+        response_from_target,
+        transport: BaseProxyTransport,
+        log,
+        *,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+    ) -> bool:
+        """收到上游响应头：客户端已断开时关闭响应并返回 False，上游返回错误状态码时抛出异常。"""
+        if cancel.cancelled:
+            # HTTP/2 上游无法在收到响应头之前中止，收到后立即关闭
+            with contextlib.suppress(Exception):
+                response_from_target.close()
+            return False
+        cancel.set_interrupt(
+            lambda: transport.interrupt_response(response_from_target), stage=STAGE_BODY
+        )
+        deadlines.idle_on_socket = transport.set_read_timeout(
+            response_from_target, deadlines.body_read_timeout()
+        )
+        response_from_target.raise_for_status()
+        self._log_upstream_response(response_from_target, log)
+        return True
+
+    def _log_upstream_response(self, response_from_target, log) -> None:
+        if self.debug_mode:
+            log(f"上游响应状态码: {response_from_target.status_code}")
+            log(f"上游 Content-Type: {response_from_target.headers.get('content-type')}")
+            log(f"上游协议: {getattr(response_from_target, 'http_version', 'HTTP/1.1')}")
+
+    def _stream_before_headers(  # noqa: PLR0912, PLR0913, PLR0915
+        self,
+        send_upstream: Callable[[], requests.Response],
+        transport: BaseProxyTransport,
+        request_id: str,
+        log,
+        *,
+        is_stream: bool,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+        unwatch: Callable[[], None],
+    ) -> Iterator[bytes]:
+        """客户端请求流式响应且配置了心跳：等待上游响应头期间已开始下游 SSE 并按间隔发送心跳。
+
+        下游状态码此时已经是 200，之后的上游错误与超时以 SSE error 事件告知客户端；
+        上游返回 JSON 时转换为流式事件。
+        """
+        coalescer = self._new_coalescer()
+        response_from_target = None
+        handed_over = False
+
+        def upstream_response() -> Iterator[requests.Response]:
+            yield send_upstream()
+
+        try:
+            # 请求在读取线程中发出，等待期间按心跳间隔产出 None
+            with contextlib.closing(
+                iter_with_deadline(upstream_response(), coalescer.timeout, size=1)
+            ) as waiting:
+                for item in waiting:
+                    if item is not None:
+                        response_from_target = item
+                        break
+                    data = coalescer.expire()
+                    if data:
+                        yield data
+            if response_from_target is None or not self._accept_upstream_response(
+                response_from_target, transport, log, deadlines=deadlines, cancel=cancel
+            ):
+                self._client_disconnected(cancel, log)
+                return
+            if is_stream and self._is_event_stream(response_from_target.headers):
+                handed_over = True
+                yield from self._generate_stream(
+                    response_from_target,
+                    transport,
+                    request_id,
+                    log,
+                    deadlines=deadlines,
+                    cancel=cancel,
+                    unwatch=unwatch,
+                    coalescer=coalescer,
+                )
+                return
+            response_json = loads(response_from_target.content)
+            log("将非流式响应转换为流式格式返回给客户端")
+            events = self._simulated_stream_events(response_json, log)
+            delay = self.stream_config.simulated_delay_ms / 1000
+            yield from self._paced(events, delay) if delay else (b"".join(events),)
+        except GeneratorExit:
+            if not handed_over:
+                # 写出心跳失败先于监视线程发现客户端断开
+                cancel.cancel()
+                self._client_disconnected(cancel, log)
+            raise
+        except requests.exceptions.HTTPError as e:
+            payload, _status = self._upstream_http_error(
+                e.response.status_code, e.response.text, log
+            )
+            yield self._sse_error_event(payload)
+        except requests.exceptions.RequestException as e:
+            if cancel.cancelled:
+                self._client_disconnected(cancel, log)
+                return
+            kind = deadlines.classify(e, headers_received=response_from_target is not None)
+            if kind is not None:
+                yield self._upstream_timeout_event(kind, log)
+            else:
+                yield self._sse_error_event(self._upstream_connect_error(e, log)[0])
+        except ValueError as e:
+            yield self._sse_error_event(self._upstream_connect_error(e, log)[0])
+        except Exception as e:
+            yield self._sse_error_event(self._unexpected_error(e, log)[0])
+        finally:
+            if not handed_over:
+                cancel.set_interrupt(None)
+                unwatch()
+                if response_from_target is not None:
+                    with contextlib.suppress(Exception):
+                        response_from_target.close()
+
+    def _generate_stream(  # noqa: PLR0912, PLR0913, PLR0915
+        self,
+        response_from_target,
+        transport: BaseProxyTransport,
+        request_id: str,
+        log,
+        *,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+        unwatch: Callable[[], None],
+        coalescer: SseCoalescer | None = None,
+    ) -> Iterator[bytes]:
+        """转发上游 SSE；coalescer 由等待响应头期间已开始写出的调用方传入。"""
+        log_file, log_file_stack, log_path = self._open_sse_log(transport, log)
+        processor = self._new_stream_processor(transport, log)
+        coalescer = coalescer or self._new_coalescer()
+        aborted = threading.Event()
+
+        def abort():
+            aborted.set()
+            transport.interrupt_response(response_from_target)
+
+        stream_stats = self.stats.open_stream(request_id, abort=abort)
+        cancel.set_interrupt(
+            lambda: transport.interrupt_response(response_from_target),
+            stage=STAGE_STREAM,
+        )
+        deadlines.response_started()
+
+        def downstream_writes() -> Iterator[bytes]:
+            """处理上游事件并按合并窗口产出下游写入，None 表示窗口、心跳或时限到期。"""
+            events = transport.extract_sse_events(response_from_target, log_file=log_file, log=log)
+            # 合并窗口、心跳与首 token/总时限需要限时等待，同样经由读取线程；
+            # 空闲时限由套接字读取超时执行，HTTP/2 上游无法设置时同样按事件计时
+            read_ahead = self.stream_config.read_ahead_events
+            if read_ahead or coalescer.timed or deadlines.wait_timed:
+                stream_stats.buffer_size = read_ahead or READ_AHEAD_EVENTS
+                events = iter_with_deadline(
+                    events,
+                    lambda: earliest_timeout(coalescer.timeout, deadlines.timeout),
+                    size=stream_stats.buffer_size,
+                    on_depth=stream_stats.record_buffered,
+                )
+            for item in events:
+                if item is None:
+                    kind = deadlines.expired()
+                    if kind is not None:
+                        data = coalescer.flush()
+                        if data:
+                            stream_stats.writes += 1
+                            yield data
+                        raise UpstreamTimeout(kind)
+                    data = coalescer.expire()
+                    stream_stats.heartbeats = coalescer.heartbeats
+                else:
+                    output = processor.process(*item)
+                    deadlines.on_event(output or b"")
+                    if output is None:
+                        continue
+                    stream_stats.events += 1
+                    stream_stats.bytes_out += len(output)
+                    data = coalescer.push(output, urgent=processor.urgent)
+                if data:
+                    stream_stats.writes += 1
+                    yield data
+                if processor.done_sent:
+                    return
+            data = coalescer.flush()
+            if data:
+                stream_stats.writes += 1
+                yield data
+
+        try:
+            with contextlib.closing(downstream_writes()) as writes:
+                for data in writes:
                     try:
-                        for upstream_chunk_index, raw_event in transport.extract_sse_events(
-                            response_from_target, log_file=log_file, log=log
-                        ):
-                            event_index += 1
-                            event_text = raw_event.decode("utf-8", errors="replace")
-                            data_lines = [
-                                line[len("data:") :].lstrip()
-                                for line in event_text.splitlines()
-                                if line.startswith("data:")
-                            ]
-                            if not data_lines:
-                                log(f"evt#{event_index} 跳过无 data 行的事件: {event_text!r}")
-                                continue
-                            data_str = "\n".join(data_lines)
-
-                            if self.debug_mode:
-                                log(
-                                    f"UP<< evt#{event_index} src_chunk#{upstream_chunk_index} "
-                                    f"bytes={len(raw_event)} | {data_str.strip()}"
-                                )
-
-                            if data_str.strip() == "[DONE]":
-                                done_sent = True
-                                done_bytes = b"data: [DONE]\n\n"
-                                try:
-                                    yield done_bytes
-                                except GeneratorExit:
-                                    log(
-                                        f"DOWN 连接提前中断，已读取上游 evt#{event_index} (DONE)"
-                                    )
-                                    raise
-                                except Exception as downstream_exc:  # noqa: BLE001
-                                    log(f"DOWN 写入异常 (DONE)，停止向下游发送: {downstream_exc}")
-                                    break
-                                log("已转发 [DONE]")
-                                break
-
-                            normalized_bytes, finish_reason = transport.normalize_openai_event(
-                                data_str,
-                                event_index,
-                                model_name=self.target_model_id,
-                                log=log,
+                        yield data
+                    except GeneratorExit:
+                        if processor.done_sent:
+                            log(processor.describe_interrupt())
+                        else:
+                            # 写出失败先于监视线程发现客户端断开
+                            cancel.cancel()
+                            self._client_disconnected(
+                                cancel,
+                                log,
+                                events=stream_stats.events,
+                                bytes_out=stream_stats.bytes_out,
                             )
-                            if finish_reason:
-                                finish_reason_seen = finish_reason
-                            try:
-                                yield normalized_bytes
-                            except GeneratorExit:
-                                log(
-                                    f"DOWN 连接提前中断，已读取上游 evt#{event_index} "
-                                    f"finish={finish_reason_seen}"
-                                )
-                                raise
-                            except Exception as downstream_exc:  # noqa: BLE001
-                                log(f"DOWN 写入异常，停止向下游发送: {downstream_exc}")
-                                break
-                        if not done_sent:
-                            tail_bytes = b"data: [DONE]\n\n"
-                            with contextlib.suppress(Exception):
-                                yield tail_bytes
-                            if self.debug_mode:
-                                extra = (
-                                    f"，finish_reason={finish_reason_seen}"
-                                    if finish_reason_seen
-                                    else ""
-                                )
-                                log(f"未收到上游 [DONE]，已补发终止事件{extra}")
-                    finally:
-                        if log_file_stack:
-                            with contextlib.suppress(Exception):
-                                log_file_stack.close()
-                        if log_path:
-                            log(f"SSE 记录完成: {log_path}")
-                        with contextlib.suppress(Exception):
-                            response_from_target.close()
-                        if self.debug_mode:
-                            log(f"UP 流结束，累计 {event_index} 个事件")
+                        raise
+                    except Exception as downstream_exc:  # noqa: BLE001
+                        log(f"DOWN 写入异常，停止向下游发送: {downstream_exc}")
+                        break
+            if aborted.is_set() and not processor.done_sent:
+                # 中止上游响应后读取通常以 EOF 正常结束，不能补发 [DONE] 伪装成完整响应
+                log(f"代理停止，已中止流式响应，已读取上游 evt#{processor.event_index}")
+                return
+            if cancel.cancelled and not processor.done_sent:
+                # 中断上游响应后读取也可能以 EOF 正常结束
+                self._client_disconnected(
+                    cancel,
+                    log,
+                    events=stream_stats.events,
+                    bytes_out=stream_stats.bytes_out,
+                )
+                return
+            if processor.done_sent:
+                log("已转发 [DONE]")
+            tail_bytes = processor.tail()
+            if tail_bytes:
+                with contextlib.suppress(Exception):
+                    yield tail_bytes
+        except Exception as exc:
+            if aborted.is_set():
+                log(f"代理停止，已中止流式响应，已读取上游 evt#{processor.event_index}")
+                return
+            if cancel.cancelled:
+                self._client_disconnected(
+                    cancel,
+                    log,
+                    events=stream_stats.events,
+                    bytes_out=stream_stats.bytes_out,
+                )
+                return
+            # 读取线程可能仍阻塞在上游读取上，先中断响应，finally 中关闭时不必等待上游
+            with contextlib.suppress(Exception):
+                transport.interrupt_response(response_from_target)
+            kind = deadlines.classify(exc, headers_received=True)
+            if kind is None:
+                raise
+            with contextlib.suppress(Exception):
+                yield self._upstream_timeout_event(kind, log)
+        finally:
+            cancel.set_interrupt(None)
+            unwatch()
+            self.stats.close_stream(request_id)
+            if log_file_stack:
+                with contextlib.suppress(Exception):
+                    log_file_stack.close()
+            if log_path:
+                log(f"SSE 记录完成: {log_path}")
+            with contextlib.suppress(Exception):
+                response_from_target.close()
+            if self.debug_mode:
+                log(f"UP 流结束，累计 {processor.event_index} 个事件")
+                self._log_downstream_writes(coalescer, stream_stats, log)
+
+    def _get_models(self):
+        self.log_func(f"收到模型列表请求 {self.models_route}")
+
+        auth_error = self._check_models_auth(request.headers.get("Authorization"))
+        if auth_error:
+            payload, status = auth_error
+            return jsonify(payload), status
+
+        model_data = self._build_models_payload()
+        self.log_func(f"返回映射模型: {self._get_mapped_model_id()}")
+        return jsonify(model_data)
+
+    def _chat_completions(self):
+        """准入已在进入工作线程之前完成，这里只记录连接的排队时间。"""
+        return self._forward_chat_completions(take_queue_wait())
+
+    def _forward_chat_completions(self, queue_wait: float = 0.0):  # noqa: PLR0911, PLR0912, PLR0915
+        request_id = self._new_request_id()
+
+        def log(message: str):
+            self._log_request(request_id, message)
+
+        log(f"收到聊天补全请求 {self.chat_route}")
+        self.stats.incr("chat_requests")
+        if queue_wait:
+            log(f"准入排队 {queue_wait * 1000:.0f} ms")
+
+        auth = self.auth
+        transport = self.transport
+        http_client = self.http_client
+        if not (auth and transport and http_client):
+            log("代理服务未就绪")
+            return jsonify({"error": "Proxy not ready"}), 500
+
+        try:
+            body = request.get_data()
+        except RequestEntityTooLarge:
+            body = None
+        if body is None or len(body) > self.max_request_body:
+            log(f"请求体超过上限 {self.max_request_body} 字节，拒绝转发")
+            self.stats.incr("requests_too_large")
+            return jsonify(self._body_too_large_payload()), 413
+
+        if self.debug_mode:
+            self._log_debug_request(
+                request.headers,
+                lambda: body.decode("utf-8", errors="replace"),
+                log,
+            )
+
+        prepared = self._prepare_upstream_body(request.headers, body, log)
+        if prepared is None:
+            log("解析 JSON 失败或请求不是 JSON 格式")
+            log(f"Content-Type: {request.headers.get('Content-Type')}")
+            return jsonify(self._invalid_json_payload()), 400
+
+        upstream_body, client_requested_stream, is_stream, token_limit = prepared
+
+        auth_header = request.headers.get("Authorization")
+        if not auth.verify(auth_header):
+            log("聊天补全请求MTGA鉴权失败")
+            return jsonify(self._auth_failed_payload()), 401
+
+        forward_headers = self._build_forward_headers(auth, auth_header, log)
+        deadlines = UpstreamDeadlines(self.timeout_config)
+        headers_received = False
+        cancel = UpstreamCancel(token_limit)
+        unwatch = self._watch_client_disconnect(cancel)
+        # 流式响应的监视交给 generate_stream，在流结束时取消
+        stream_started = False
+
+        try:
+            target_url = self.chat_target_url
+            log(f"转发请求到: {target_url}")
+
+            log(f"流模式: {is_stream}")
+
+            def send_upstream():
+                # 非流式响应同样在收到响应头后再读取响应体，以便区分首字节超时与空闲超时
+                with cancel.bind():
+                    return http_client.post(
+                        target_url,
+                        data=upstream_body,
+                        headers=forward_headers,
+                        stream=True,
+                        timeout=deadlines.request_timeout(),
+                    )
+
+            if client_requested_stream and self.stream_config.heartbeat_interval > 0:
+                log("返回流式响应，等待上游响应头期间发送心跳")
+                stream_started = True
+                return Response(
+                    self._stream_before_headers(
+                        send_upstream,
+                        transport,
+                        request_id,
+                        log,
+                        is_stream=is_stream,
+                        deadlines=deadlines,
+                        cancel=cancel,
+                        unwatch=unwatch,
+                    ),
+                    content_type="text/event-stream",
+                )
+
+            response_from_target = send_upstream()
+            headers_received = True
+            if not self._accept_upstream_response(
+                response_from_target, transport, log, deadlines=deadlines, cancel=cancel
+            ):
+                self._client_disconnected(cancel, log)
+                return "", CLIENT_CLOSED_REQUEST
+
+            if is_stream and not client_requested_stream and self._is_event_stream(
+                response_from_target.headers
+            ):
+                log("客户端请求非流式响应，聚合上游流式响应后返回 JSON")
+                aggregator = self._new_aggregator(log)
+                try:
+                    self._aggregate_stream(
+                        aggregator,
+                        transport,
+                        response_from_target,
+                        log,
+                        deadlines=deadlines,
+                        cancel=cancel,
+                    )
+                except Exception as exc:
+                    if cancel.cancelled:
+                        self._client_disconnected(cancel, log, events=aggregator.events)
+                        return "", CLIENT_CLOSED_REQUEST
+                    kind = deadlines.classify(exc, headers_received=True)
+                    if kind is None:
+                        raise
+                    payload, status = self._upstream_timeout(kind, log)
+                    return jsonify(payload), status
+                finally:
+                    cancel.set_interrupt(None)
+                    with contextlib.suppress(Exception):
+                        response_from_target.close()
+                if cancel.cancelled and not aggregator.finished:
+                    # 中断上游响应后读取也可能以 EOF 正常结束
+                    self._client_disconnected(cancel, log, events=aggregator.events)
+                    return "", CLIENT_CLOSED_REQUEST
+                payload, status = aggregator.result()
+                self._log_json_response(payload, log)
+                return jsonify(payload), status
+
+            if is_stream and client_requested_stream:
+                log("返回流式响应")
 
                 downstream_content_type = response_from_target.headers.get(
                     "content-type", "text/event-stream"
@@ -373,89 +1066,62 @@ class ProxyApp:
                 if self.debug_mode:
                     log(f"下游响应 Content-Type: {downstream_content_type}")
 
+                stream_started = True
                 return Response(
-                    generate_stream(),
+                    self._generate_stream(
+                        response_from_target,
+                        transport,
+                        request_id,
+                        log,
+                        deadlines=deadlines,
+                        cancel=cancel,
+                        unwatch=unwatch,
+                    ),
                     content_type=downstream_content_type,
                 )
 
-            response_json = response_from_target.json()
+            try:
+                response_json = loads(response_from_target.content)
+            except ValueError as e:
+                payload, status = self._upstream_connect_error(e, log)
+                return jsonify(payload), status
+            finally:
+                cancel.set_interrupt(None)
 
             if client_requested_stream and self.stream_mode == "false":
                 log("将非流式响应转换为流式格式返回给客户端")
-
-                def simulate_stream():
-                    choices = response_json.get("choices", [])
-                    if not choices:
-                        log("响应中没有找到 choices 字段")
-                        yield f"data: {json.dumps({'error': 'No choices in response'})}\\n\\n"
-                        return
-
-                    first_choice = choices[0]
-                    message = first_choice.get("message", {})
-                    content = message.get("content", "")
-
-                    if not content:
-                        log("响应中没有找到内容")
-                        yield f"data: {json.dumps({'error': 'No content in response'})}\\n\\n"
-                        return
-
-                    model = response_json.get("model", "")
-                    id_value = response_json.get("id", "")
-                    created = response_json.get("created", 0)
-
-                    chunk_size = 10
-                    total_chars = len(content)
-
-                    for i in range(0, total_chars, chunk_size):
-                        chunk = content[i : i + chunk_size]
-
-                        chunk_data = {
-                            "id": id_value,
-                            "object": "chat.completion.chunk",
-                            "created": created,
-                            "model": model,
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {"content": chunk},
-                                    "finish_reason": None
-                                    if i + chunk_size < total_chars
-                                    else first_choice.get("finish_reason", "stop"),
-                                }
-                            ],
-                        }
-
-                        yield f"data: {json.dumps(chunk_data)}\\n\\n"
-                        time.sleep(0.01)
-
-                    yield "data: [DONE]\\n\\n"
-
-                return Response(simulate_stream(), content_type="text/event-stream")
-
-            if self.debug_mode:
-                response_str = json.dumps(response_json, indent=2, ensure_ascii=False)
-                log(
-                    f"--- 完整响应体 (调试模式) ---\\n{response_str}\\n"
-                    "--------------------------------------"
-                )
-            else:
-                log("返回非流式 JSON 响应")
+                events = self._simulated_stream_events(response_json, log)
+                delay = self.stream_config.simulated_delay_ms / 1000
+                if not delay:
+                    # 响应已经完整，不再人为控制节奏，全部事件一次写出
+                    return Response(b"".join(events), content_type="text/event-stream")
+                return Response(self._paced(events, delay), content_type="text/event-stream")
+
+            self._log_json_response(response_json, log)
             return jsonify(response_json), response_from_target.status_code
 
         except requests.exceptions.HTTPError as e:
-            error_msg = f"目标 API HTTP 错误: {e.response.status_code} - {e.response.text}"
-            log(error_msg)
-            return jsonify(
-                {"error": f"Target API error: {e.response.status_code}", "details": e.response.text}
-            ), e.response.status_code
+            payload, status = self._upstream_http_error(
+                e.response.status_code, e.response.text, log
+            )
+            return jsonify(payload), status
         except requests.exceptions.RequestException as e:
-            error_msg = f"连接目标 API 时出错: {e}"
-            log(error_msg)
-            return jsonify({"error": f"Error contacting target API: {str(e)}"}), 503
+            if cancel.cancelled:
+                self._client_disconnected(cancel, log)
+                return "", CLIENT_CLOSED_REQUEST
+            kind = deadlines.classify(e, headers_received=headers_received)
+            if kind is not None:
+                payload, status = self._upstream_timeout(kind, log)
+            else:
+                payload, status = self._upstream_connect_error(e, log)
+            return jsonify(payload), status
         except Exception as e:
-            error_msg = f"发生意外错误: {e}"
-            log(error_msg)
-            return jsonify({"error": "An internal server error occurred"}), 500
+            payload, status = self._unexpected_error(e, log)
+            return jsonify(payload), status
+        finally:
+            if not stream_started:
+                cancel.set_interrupt(None)
+                unwatch()
 
 
 __all__ = ["ProxyApp"]
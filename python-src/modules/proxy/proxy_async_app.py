@@ -0,0 +1,783 @@
+"""
+异步代理引擎
+与 ProxyApp 共用配置解析、鉴权、模型改写与 SSE 归一化，路由改为 ASGI 实现，
+上游转发使用 httpx.AsyncClient，单个进程即可挂起大量空闲的流式连接。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+
+from modules.proxy.proxy_admission import (
+    REJECT_QUEUE_FULL,
+    REJECT_QUEUE_TIMEOUT,
+    Admission,
+    AdmissionController,
+    rejection_payload,
+)
+from modules.proxy.proxy_aggregate import StreamAggregator
+from modules.proxy.proxy_app import ProxyApp
+from modules.proxy.proxy_async_transport import AsyncProxyTransport, httpx
+from modules.proxy.proxy_body import UpstreamBody
+from modules.proxy.proxy_coalesce import SseCoalescer
+from modules.proxy.proxy_config import ProxyConfig
+from modules.proxy.proxy_deadline import UpstreamDeadlines, UpstreamTimeout, earliest_timeout
+from modules.proxy.proxy_disconnect import STAGE_BODY, STAGE_STREAM, UpstreamCancel
+from modules.proxy.proxy_json import loads
+from modules.proxy.proxy_readahead import aiter_with_deadline
+from modules.proxy.proxy_stats import ProxyStats
+from modules.runtime.resource_manager import ResourceManager
+from modules.runtime.thread_manager import ThreadManager
+
+
+class AsgiHeaders:
+    """ASGI 请求头的只读视图，键名大小写不敏感。"""
+
+    def __init__(self, scope: dict) -> None:
+        self._items = [
+            (key.decode("latin-1"), value.decode("latin-1"))
+            for key, value in scope.get("headers", [])
+        ]
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        lowered = name.lower()
+        for key, value in self._items:
+            if key.lower() == lowered:
+                return value
+        return default
+
+    def items(self) -> list[tuple[str, str]]:
+        return list(self._items)
+
+
+class AsyncProxyApp(ProxyApp):
+    """代理服务的 ASGI 版本，实例本身即 ASGI 应用。"""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        config=None,
+        log_func=print,
+        *,
+        resource_manager: ResourceManager,
+        stats: ProxyStats | None = None,
+        proxy_config: ProxyConfig | None = None,
+        transport: AsyncProxyTransport | None = None,
+        admission: AdmissionController | None = None,
+    ):
+        self.async_transport: AsyncProxyTransport | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._warmup_future: concurrent.futures.Future | None = None
+        self._warmup_requested = False
+        self._warmup_lock = threading.Lock()
+        # 热重载后接替本实例的新实例，lifespan 关闭阶段沿链找到当前实例
+        self._successor: AsyncProxyApp | None = None
+        super().__init__(
+            config,
+            log_func,
+            resource_manager=resource_manager,
+            stats=stats,
+            proxy_config=proxy_config,
+            transport=transport,
+            admission=admission,
+        )
+
+    def _create_transport(self) -> None:
+        self.async_transport = AsyncProxyTransport(
+            resource_manager=self.resource_manager,
+            disable_ssl_strict_mode=self.disable_ssl_strict_mode,
+            log_func=self.log_func,
+            pool_config=self.proxy_config.upstream_pool if self.proxy_config else None,
+            socket_config=self._socket_config(),
+        )
+
+    def _create_admission(
+        self, admission: AdmissionController | None
+    ) -> AdmissionController | None:
+        """热重载时沿用原有的准入控制器，已占用的名额与排队的请求保持不变。"""
+        if self.proxy_config is None:
+            return None
+        if admission is None:
+            return AdmissionController(self.proxy_config.admission, stats=self.stats)
+        admission.configure(self.proxy_config.admission)
+        return admission
+
+    def _adopt_transport(self, transport: AsyncProxyTransport) -> None:
+        self.async_transport = transport
+
+    @property
+    def shared_transport(self):
+        return self.async_transport
+
+    def take_over(self, previous: ProxyApp) -> None:
+        """沿用旧实例捕获的事件循环；lifespan 只在服务器启动时运行一次。"""
+        if not isinstance(previous, AsyncProxyApp):
+            return
+        with previous._warmup_lock:
+            loop = previous._loop
+            previous._successor = self
+        with self._warmup_lock:
+            self._loop = loop
+
+    def _release(self, close_transport: bool) -> None:
+        with self._warmup_lock:
+            future = self._warmup_future
+            self._warmup_future = None
+            loop = self._loop
+        if future is not None:
+            future.cancel()
+        transport = self.async_transport
+        if not (close_transport and transport and not transport.closed):
+            return
+        if loop is not None and not loop.is_closed():
+            # httpx 客户端只能在创建连接的事件循环中关闭
+            asyncio.run_coroutine_threadsafe(transport.aclose(), loop)
+        else:
+            self.close()
+
+    def _create_app(self):
+        self.app = None
+
+    def start_upstream_warmup(self, thread_manager: ThreadManager) -> None:
+        """预热任务运行在服务器的事件循环中，httpx 连接池只能在该循环内使用。
+
+        运行时可能在 lifespan 启动之前就返回成功，此时由 lifespan 启动阶段补做调度。
+        """
+        with self._warmup_lock:
+            self._warmup_requested = True
+        self._schedule_upstream_warmup()
+
+    def _schedule_upstream_warmup(self) -> None:
+        warmer = self.upstream_warmer
+        transport = self.async_transport
+        with self._warmup_lock:
+            loop = self._loop
+            if not (self._warmup_requested and loop and self._warmup_future is None):
+                return
+            if not (warmer and warmer.enabled and transport):
+                return
+            url = self.target_api_base_url
+            self._warmup_future = asyncio.run_coroutine_threadsafe(
+                warmer.arun(lambda count: transport.awarm_up(url, count)), loop
+            )
+
+    async def _stop_upstream_warmup(self) -> None:
+        with self._warmup_lock:
+            future = self._warmup_future
+            self._warmup_future = None
+            self._warmup_requested = False
+        if self.upstream_warmer:
+            self.upstream_warmer.stop()
+        if future is not None:
+            future.cancel()
+            # 等待任务真正结束后再关闭 httpx 客户端
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await asyncio.wrap_future(future)
+
+    async def aclose(self) -> None:
+        if self.async_transport:
+            await self.async_transport.aclose()
+
+    def close(self) -> None:
+        if self.upstream_warmer:
+            self.upstream_warmer.stop()
+        transport = self.async_transport
+        if transport and not transport.closed:
+            with contextlib.suppress(Exception):
+                asyncio.run(transport.aclose())
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._handle_lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        self._enter_request()
+        try:
+            await self._route(scope, receive, send)
+        finally:
+            self._leave_request()
+
+    async def _route(self, scope, receive, send) -> None:
+        path = scope.get("path", "")
+        method = scope.get("method", "GET")
+        if path == self.models_route:
+            if method != "GET":
+                await self._send_json(send, {"error": "Method Not Allowed"}, 405)
+                return
+            await self._get_models_async(scope, send)
+            return
+        if path == self.chat_route:
+            if method != "POST":
+                await self._send_json(send, {"error": "Method Not Allowed"}, 405)
+                return
+            await self._chat_completions_async(scope, receive, send)
+            return
+        await self._send_json(send, {"error": "Not Found"}, 404)
+
+    async def _handle_lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                with self._warmup_lock:
+                    self._loop = asyncio.get_running_loop()
+                self._schedule_upstream_warmup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                current = self
+                while current._successor is not None:
+                    current = current._successor
+                await current._stop_upstream_warmup()
+                await current.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive, limit: int) -> bytes | None:
+        """读取完整请求体，超过 limit 字节时返回 None。"""
+        chunks: list[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > limit:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _wait_client_disconnect(receive, cancel: UpstreamCancel) -> None:
+        """请求体读完后继续等待 ASGI 消息，收到 http.disconnect 时中止上游请求。"""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                cancel.cancel()
+                return
+
+    @staticmethod
+    async def _send_json(
+        send, payload, status: int = 200, headers: dict[str, str] | None = None
+    ) -> None:
+        body = json.dumps(payload).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *(
+                        (key.lower().encode("latin-1"), value.encode("latin-1"))
+                        for key, value in (headers or {}).items()
+                    ),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _start_stream(send, content_type: str) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", content_type.encode("latin-1"))],
+            }
+        )
+
+    @staticmethod
+    async def _send_paced(send, events: Iterator[bytes], delay: float) -> None:
+        """写出转换后的流式事件并结束响应，delay 为相邻事件的间隔（秒）。"""
+        if not delay:
+            # 响应已经完整，不再人为控制节奏，全部事件一次写出
+            await send({"type": "http.response.body", "body": b"".join(events)})
+            return
+        for position, event in enumerate(events):
+            if position:
+                await asyncio.sleep(delay)
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _end_stream_with_error(send, event: bytes) -> None:
+        with contextlib.suppress(Exception):
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+    async def _get_models_async(self, scope, send) -> None:
+        self.log_func(f"收到模型列表请求 {self.models_route}")
+
+        auth_error = self._check_models_auth(AsgiHeaders(scope).get("Authorization"))
+        if auth_error:
+            payload, status = auth_error
+            await self._send_json(send, payload, status)
+            return
+
+        model_data = self._build_models_payload()
+        self.log_func(f"返回映射模型: {self._get_mapped_model_id()}")
+        await self._send_json(send, model_data)
+
+    def _admission_rejected(self, admission: Admission) -> tuple[dict, int, dict[str, str]]:
+        """准入被拒绝时的响应体、状态码与响应头。"""
+        status = admission.status or REJECT_QUEUE_TIMEOUT
+        if status == REJECT_QUEUE_FULL:
+            self.log_func("并发请求已满且等待队列已满，返回 429")
+        else:
+            self.log_func(f"排队 {admission.wait:.1f} 秒仍未获得处理名额，返回 503")
+        return rejection_payload(status), status, {"Retry-After": str(admission.retry_after)}
+
+    async def _chat_completions_async(self, scope, receive, send) -> None:
+        admission = await self.admission.aacquire() if self.admission else Admission(True)
+        if not admission.admitted:
+            payload, status, headers = self._admission_rejected(admission)
+            await self._send_json(send, payload, status, headers)
+            return
+        try:
+            await self._forward_chat_completions_async(scope, receive, send, admission.wait)
+        finally:
+            admission.release()
+
+    async def _forward_chat_completions_async(  # noqa: PLR0911, PLR0912, PLR0915
+        self, scope, receive, send, queue_wait: float = 0.0
+    ) -> None:
+        request_id = self._new_request_id()
+
+        def log(message: str):
+            self._log_request(request_id, message)
+
+        log(f"收到聊天补全请求 {self.chat_route}")
+        self.stats.incr("chat_requests")
+        if queue_wait:
+            log(f"准入排队 {queue_wait * 1000:.0f} ms")
+
+        auth = self.auth
+        transport = self.async_transport
+        if not (auth and transport):
+            log("代理服务未就绪")
+            await self._send_json(send, {"error": "Proxy not ready"}, 500)
+            return
+
+        headers = AsgiHeaders(scope)
+        content_length = headers.get("Content-Length") or ""
+        too_large = content_length.isdigit() and int(content_length) > self.max_request_body
+        body = None if too_large else await self._read_body(receive, self.max_request_body)
+        if body is None:
+            log(f"请求体超过上限 {self.max_request_body} 字节，拒绝转发")
+            self.stats.incr("requests_too_large")
+            # 未读完的请求体会让连接关闭阶段超时，这里的发送失败无需处理
+            with contextlib.suppress(Exception):
+                await self._send_json(send, self._body_too_large_payload(), 413)
+            return
+
+        if self.debug_mode:
+            self._log_debug_request(
+                headers,
+                lambda: body.decode("utf-8", errors="replace"),
+                log,
+            )
+
+        prepared = self._prepare_upstream_body(headers, body, log)
+        if prepared is None:
+            log("解析 JSON 失败或请求不是 JSON 格式")
+            log(f"Content-Type: {headers.get('Content-Type')}")
+            await self._send_json(send, self._invalid_json_payload(), 400)
+            return
+
+        upstream_body, client_requested_stream, is_stream, token_limit = prepared
+
+        auth_header = headers.get("Authorization")
+        if not auth.verify(auth_header):
+            log("聊天补全请求MTGA鉴权失败")
+            await self._send_json(send, self._auth_failed_payload(), 401)
+            return
+
+        forward_headers = self._build_forward_headers(auth, auth_header, log)
+        deadlines = UpstreamDeadlines(self.timeout_config)
+        headers_received = False
+        # 客户端断开时取消处理本请求的任务，httpx 随之关闭上游连接或流
+        task = asyncio.current_task()
+        cancel = UpstreamCancel(token_limit)
+        cancel.set_interrupt(task.cancel)
+        watcher = asyncio.ensure_future(self._wait_client_disconnect(receive, cancel))
+
+        try:
+            target_url = self.chat_target_url
+            log(f"转发请求到: {target_url}")
+
+            log(f"流模式: {is_stream}")
+
+            if isinstance(upstream_body, UpstreamBody):
+                forward_headers["Content-Length"] = str(len(upstream_body))
+                upstream_content = upstream_body.aiter()
+            else:
+                upstream_content = upstream_body
+            connect_timeout, first_byte_timeout = deadlines.request_timeout()
+            upstream_request = transport.client.build_request(
+                "POST",
+                target_url,
+                content=upstream_content,
+                headers=forward_headers,
+                timeout=httpx.Timeout(deadlines.header_read_timeout(), connect=connect_timeout),
+            )
+
+            async def send_upstream():
+                # httpx 的读取超时同时作用于响应体，首字节时限在这里单独计时
+                async with asyncio.timeout(first_byte_timeout):
+                    return await transport.client.send(upstream_request, stream=True)
+
+            if client_requested_stream and self.stream_config.heartbeat_interval > 0:
+                log("返回流式响应，等待上游响应头期间发送心跳")
+                await self._stream_before_headers_async(
+                    send,
+                    send_upstream,
+                    transport,
+                    request_id,
+                    log,
+                    is_stream=is_stream,
+                    deadlines=deadlines,
+                    cancel=cancel,
+                )
+                return
+
+            response_from_target = await send_upstream()
+            headers_received = True
+            cancel.set_interrupt(task.cancel, stage=STAGE_BODY)
+            if response_from_target.is_error:
+                await response_from_target.aread()
+                await response_from_target.aclose()
+                payload, status = self._upstream_http_error(
+                    response_from_target.status_code, response_from_target.text, log
+                )
+                await self._send_json(send, payload, status)
+                return
+            self._log_upstream_response(response_from_target, log)
+
+            if is_stream and not client_requested_stream and self._is_event_stream(
+                response_from_target.headers
+            ):
+                log("客户端请求非流式响应，聚合上游流式响应后返回 JSON")
+                aggregator = self._new_aggregator(log)
+                await self._aggregate_stream_async(
+                    aggregator,
+                    transport,
+                    response_from_target,
+                    log,
+                    deadlines=deadlines,
+                    cancel=cancel,
+                )
+                payload, status = aggregator.result()
+                self._log_json_response(payload, log)
+                await self._send_json(send, payload, status)
+                return
+
+            if is_stream and client_requested_stream:
+                log("返回流式响应")
+                await self._forward_stream(
+                    send,
+                    response_from_target,
+                    transport,
+                    request_id,
+                    log,
+                    deadlines=deadlines,
+                    cancel=cancel,
+                )
+                return
+
+            try:
+                await response_from_target.aread()
+            finally:
+                await response_from_target.aclose()
+            try:
+                response_json = loads(response_from_target.content)
+            except ValueError as e:
+                payload, status = self._upstream_connect_error(e, log)
+                await self._send_json(send, payload, status)
+                return
+
+            if client_requested_stream and self.stream_mode == "false":
+                log("将非流式响应转换为流式格式返回给客户端")
+                events = self._simulated_stream_events(response_json, log)
+                delay = self.stream_config.simulated_delay_ms / 1000
+                await self._start_stream(send, "text/event-stream")
+                await self._send_paced(send, events, delay)
+                return
+
+            self._log_json_response(response_json, log)
+            await self._send_json(send, response_json, response_from_target.status_code)
+
+        except asyncio.CancelledError:
+            if not cancel.cancelled:
+                raise
+            task.uncancel()
+            # 流式阶段的中止由 _forward_stream 记录
+            if cancel.stage != STAGE_STREAM:
+                self._client_disconnected(cancel, log)
+        except (httpx.HTTPError, TimeoutError, UpstreamTimeout) as e:
+            kind = deadlines.classify(e, headers_received=headers_received)
+            if kind is not None:
+                payload, status = self._upstream_timeout(kind, log)
+            else:
+                payload, status = self._upstream_connect_error(e, log)
+            await self._send_json(send, payload, status)
+        except Exception as e:
+            payload, status = self._unexpected_error(e, log)
+            with contextlib.suppress(Exception):
+                await self._send_json(send, payload, status)
+        finally:
+            cancel.set_interrupt(None)
+            watcher.cancel()
+
+    async def _aggregate_stream_async(  # noqa: PLR0913
+        self,
+        aggregator: StreamAggregator,
+        transport: AsyncProxyTransport,
+        response_from_target,
+        log,
+        *,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+    ) -> None:
+        """异步版本的 _aggregate_stream，超时以 UpstreamTimeout 等异常抛出。"""
+        task = asyncio.current_task()
+        if task:
+            cancel.set_interrupt(task.cancel, stage=STAGE_STREAM)
+        deadlines.response_started()
+        upstream_events = transport.aextract_sse_events(response_from_target, log=log)
+        events = upstream_events
+        if deadlines.stream_timed:
+            events = aiter_with_deadline(upstream_events, deadlines.timeout)
+        try:
+            async with contextlib.aclosing(upstream_events), contextlib.aclosing(events):
+                async for item in events:
+                    if item is None:
+                        kind = deadlines.expired()
+                        if kind is not None:
+                            raise UpstreamTimeout(kind)
+                        continue
+                    _chunk_index, raw_event = item
+                    deadlines.on_event(raw_event)
+                    aggregator.feed(raw_event)
+                    if aggregator.finished:
+                        break
+        except asyncio.CancelledError:
+            if cancel.cancelled:
+                self._client_disconnected(cancel, log, events=aggregator.events)
+            raise
+        finally:
+            with contextlib.suppress(Exception):
+                await response_from_target.aclose()
+
+    async def _stream_before_headers_async(  # noqa: PLR0912, PLR0913
+        self,
+        send,
+        send_upstream: Callable[[], Awaitable[httpx.Response]],
+        transport: AsyncProxyTransport,
+        request_id: str,
+        log,
+        *,
+        is_stream: bool,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+    ) -> None:
+        """_stream_before_headers 的异步版本：先发送 200 响应头，等待上游响应头期间发送心跳。
+
+        客户端断开时任务被取消，由调用方记录。
+        """
+        task = asyncio.current_task()
+        coalescer = self._new_coalescer()
+        response_from_target = None
+
+        async def upstream_response() -> AsyncIterator[httpx.Response]:
+            yield await send_upstream()
+
+        await self._start_stream(send, "text/event-stream")
+        try:
+            upstream = upstream_response()
+            waiting = aiter_with_deadline(upstream, coalescer.timeout)
+            async with contextlib.aclosing(upstream), contextlib.aclosing(waiting):
+                async for item in waiting:
+                    if item is not None:
+                        response_from_target = item
+                        break
+                    data = coalescer.expire()
+                    if data:
+                        await send({"type": "http.response.body", "body": data, "more_body": True})
+            if task:
+                cancel.set_interrupt(task.cancel, stage=STAGE_BODY)
+            if response_from_target.is_error:
+                await response_from_target.aread()
+                payload, _status = self._upstream_http_error(
+                    response_from_target.status_code, response_from_target.text, log
+                )
+                await self._end_stream_with_error(send, self._sse_error_event(payload))
+                return
+            self._log_upstream_response(response_from_target, log)
+            if is_stream and self._is_event_stream(response_from_target.headers):
+                await self._forward_stream(
+                    send,
+                    response_from_target,
+                    transport,
+                    request_id,
+                    log,
+                    deadlines=deadlines,
+                    cancel=cancel,
+                    coalescer=coalescer,
+                )
+                return
+            await response_from_target.aread()
+            response_json = loads(response_from_target.content)
+            log("将非流式响应转换为流式格式返回给客户端")
+            events = self._simulated_stream_events(response_json, log)
+            await self._send_paced(send, events, self.stream_config.simulated_delay_ms / 1000)
+        except (httpx.HTTPError, TimeoutError, UpstreamTimeout) as e:
+            kind = deadlines.classify(e, headers_received=response_from_target is not None)
+            if kind is not None:
+                event = self._upstream_timeout_event(kind, log)
+            else:
+                event = self._sse_error_event(self._upstream_connect_error(e, log)[0])
+            await self._end_stream_with_error(send, event)
+        except ValueError as e:
+            payload = self._upstream_connect_error(e, log)[0]
+            await self._end_stream_with_error(send, self._sse_error_event(payload))
+        except Exception as e:
+            payload = self._unexpected_error(e, log)[0]
+            await self._end_stream_with_error(send, self._sse_error_event(payload))
+        finally:
+            if response_from_target is not None:
+                with contextlib.suppress(Exception):
+                    await response_from_target.aclose()
+
+    async def _forward_stream(  # noqa: PLR0912, PLR0913, PLR0915
+        self,
+        send,
+        response_from_target,
+        transport: AsyncProxyTransport,
+        request_id: str,
+        log,
+        *,
+        deadlines: UpstreamDeadlines,
+        cancel: UpstreamCancel,
+        coalescer: SseCoalescer | None = None,
+    ) -> None:
+        """转发上游 SSE；coalescer 由已开始下游响应的调用方传入，此时不再发送响应头。"""
+        started = coalescer is not None
+        downstream_content_type = response_from_target.headers.get(
+            "content-type", "text/event-stream"
+        )
+        if self.debug_mode and not started:
+            log(f"下游响应 Content-Type: {downstream_content_type}")
+
+        log_file, log_file_stack, log_path = self._open_sse_log(transport, log)
+        processor = self._new_stream_processor(transport, log)
+        coalescer = coalescer or self._new_coalescer()
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        stream_stats = self.stats.open_stream(
+            request_id,
+            abort=(lambda: loop.call_soon_threadsafe(task.cancel)) if task else None,
+        )
+        if task:
+            cancel.set_interrupt(task.cancel, stage=STAGE_STREAM)
+        if not started:
+            await self._start_stream(send, downstream_content_type)
+        deadlines.response_started()
+        try:
+            upstream_events = transport.aextract_sse_events(
+                response_from_target, log_file=log_file, log=log
+            )
+            read_ahead = self.stream_config.read_ahead_events
+            events = upstream_events
+            if read_ahead or coalescer.timed or deadlines.stream_timed:
+                stream_stats.buffer_size = read_ahead
+                events = aiter_with_deadline(
+                    upstream_events,
+                    lambda: earliest_timeout(coalescer.timeout, deadlines.timeout),
+                    size=read_ahead,
+                    on_depth=stream_stats.record_buffered,
+                )
+            async with contextlib.aclosing(upstream_events), contextlib.aclosing(events):
+                async for item in events:
+                    if item is None:
+                        kind = deadlines.expired()
+                        if kind is not None:
+                            data = coalescer.flush()
+                            if data:
+                                stream_stats.writes += 1
+                                await send(
+                                    {"type": "http.response.body", "body": data, "more_body": True}
+                                )
+                            raise UpstreamTimeout(kind)
+                        data = coalescer.expire()
+                        stream_stats.heartbeats = coalescer.heartbeats
+                    else:
+                        output = processor.process(*item)
+                        deadlines.on_event(output or b"")
+                        if output is None:
+                            continue
+                        stream_stats.events += 1
+                        stream_stats.bytes_out += len(output)
+                        data = coalescer.push(output, urgent=processor.urgent)
+                    if data:
+                        stream_stats.writes += 1
+                        try:
+                            await send(
+                                {"type": "http.response.body", "body": data, "more_body": True}
+                            )
+                        except Exception as downstream_exc:  # noqa: BLE001
+                            log(f"DOWN 写入异常，停止向下游发送: {downstream_exc}")
+                            break
+                    if processor.done_sent:
+                        log("已转发 [DONE]")
+                        break
+                else:
+                    data = coalescer.flush()
+                    if data:
+                        stream_stats.writes += 1
+                        with contextlib.suppress(Exception):
+                            await send(
+                                {"type": "http.response.body", "body": data, "more_body": True}
+                            )
+            tail_bytes = processor.tail()
+            with contextlib.suppress(Exception):
+                if tail_bytes:
+                    await send(
+                        {"type": "http.response.body", "body": tail_bytes, "more_body": True}
+                    )
+                await send({"type": "http.response.body", "body": b""})
+        except asyncio.CancelledError:
+            if not cancel.cancelled:
+                log(processor.describe_interrupt())
+            elif not processor.done_sent:
+                self._client_disconnected(
+                    cancel, log, events=stream_stats.events, bytes_out=stream_stats.bytes_out
+                )
+            raise
+        except Exception as exc:
+            kind = deadlines.classify(exc, headers_received=True)
+            if kind is None:
+                raise
+            await self._end_stream_with_error(send, self._upstream_timeout_event(kind, log))
+        finally:
+            self.stats.close_stream(request_id)
+            if log_file_stack:
+                with contextlib.suppress(Exception):
+                    log_file_stack.close()
+            if log_path:
+                log(f"SSE 记录完成: {log_path}")
+            with contextlib.suppress(Exception):
+                await response_from_target.aclose()
+            if self.debug_mode:
+                log(f"UP 流结束，累计 {processor.event_index} 个事件")
+                self._log_downstream_writes(coalescer, stream_stats, log)
+
+
+__all__ = ["AsgiHeaders", "AsyncProxyApp"]
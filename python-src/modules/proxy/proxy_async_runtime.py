@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import ssl
+import threading
+from dataclasses import dataclass
+
+from modules.proxy.proxy_async_transport import httpx
+from modules.proxy.proxy_config import ServerConfig, SocketTuningConfig
+from modules.proxy.proxy_listen import bind_listeners, format_address, report_listen_results
+from modules.proxy.proxy_sockopt import SocketOption, apply_socket_options, build_socket_options
+from modules.proxy.proxy_stats import ProxyStats
+from modules.proxy.proxy_tls import get_server_ssl_context, tls_session_stats
+from modules.runtime.error_codes import ErrorCode
+from modules.runtime.operation_result import OperationResult
+from modules.runtime.resource_manager import ResourceManager
+from modules.runtime.thread_manager import ThreadManager
+
+try:
+    from hypercorn.asyncio.lifespan import Lifespan
+    from hypercorn.asyncio.tcp_server import TCPServer
+    from hypercorn.asyncio.worker_context import WorkerContext
+    from hypercorn.config import Config as HypercornConfig
+    from hypercorn.statsd import StatsdLogger
+    from hypercorn.utils import wrap_app
+except ImportError:  # pragma: no cover - 可选依赖
+    HypercornConfig = None
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - 可选依赖
+    uvloop = None
+
+GRACEFUL_TIMEOUT = 2.0
+
+
+def missing_async_dependencies() -> list[str]:
+    """返回异步引擎缺失的依赖包名，为空表示可用。"""
+    missing: list[str] = []
+    if httpx is None:
+        missing.append("httpx")
+    if HypercornConfig is None:
+        missing.append("hypercorn")
+    return missing
+
+
+class InflightTracker:
+    """统计正在处理的 HTTP 请求，停止时只等待在途请求，空闲连接直接断开。
+
+    同时按客户端地址累计每条连接处理过的请求数。
+    """
+
+    def __init__(self) -> None:
+        self._count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._requests_by_peer: dict[tuple, int] = {}
+
+    def wrap(self, app):
+        async def tracked_app(scope, receive, send):
+            if scope["type"] != "http":
+                await app(scope, receive, send)
+                return
+            client = scope.get("client")
+            if client:
+                peer = tuple(client)
+                self._requests_by_peer[peer] = self._requests_by_peer.get(peer, 0) + 1
+            self._count += 1
+            self._idle.clear()
+            try:
+                await app(scope, receive, send)
+            finally:
+                self._count -= 1
+                if self._count == 0:
+                    self._idle.set()
+
+        return tracked_app
+
+    async def wait_idle(self) -> None:
+        await self._idle.wait()
+
+    def pop_connection(self, peername) -> int:
+        """连接关闭时取出并清除该连接处理过的请求数。"""
+        if not peername:
+            return 0
+        return self._requests_by_peer.pop(tuple(peername[:2]), 0)
+
+
+@dataclass
+class AsyncRuntimeState:
+    loop: asyncio.AbstractEventLoop | None = None
+    shutdown_event: asyncio.Event | None = None
+    server_task_id: str | None = None
+    ssl_context: ssl.SSLContext | None = None
+    listeners: list[dict[str, object]] | None = None
+    drain_timeout: int = 0
+    drain_report: dict[str, int] | None = None
+    running: bool = False
+
+
+class AsyncProxyRuntime:
+    """异步引擎运行时：在受管线程的事件循环中运行 Hypercorn。"""
+
+    def __init__(
+        self,
+        app,
+        log_func,
+        *,
+        resource_manager: ResourceManager,
+        thread_manager: ThreadManager,
+        stats: ProxyStats | None = None,
+    ) -> None:
+        self._app = app
+        self._log = log_func
+        self._resource_manager = resource_manager
+        self._thread_manager = thread_manager
+        self._stats = stats or ProxyStats()
+        self._state = AsyncRuntimeState()
+
+    def is_running(self) -> bool:
+        return self._state.running
+
+    def swap_app(self, app) -> None:
+        """热重载：之后的请求交给新的 ASGI 应用，进行中的请求继续在旧应用中完成。"""
+        self._app = app
+
+    async def _dispatch(self, scope, receive, send) -> None:
+        await self._app(scope, receive, send)
+
+    def get_stats(self) -> dict[str, object]:
+        return {
+            "running": self._state.running,
+            "listeners": self._state.listeners or [],
+            **tls_session_stats(self._state.ssl_context),
+            **self._stats.snapshot(),
+        }
+
+    def _new_event_loop(self, server_config: ServerConfig) -> asyncio.AbstractEventLoop:
+        if server_config.uvloop and uvloop is not None:
+            self._log("事件循环: uvloop")
+            return uvloop.new_event_loop()
+        self._log("事件循环: asyncio")
+        return asyncio.new_event_loop()
+
+    def _build_config(  # noqa: PLR0913
+        self,
+        hosts: tuple[str, ...],
+        port: int,
+        cert_file: str,
+        key_file: str,
+        server_config: ServerConfig,
+    ):
+        config = HypercornConfig()  # type: ignore[misc]
+        # 监听套接字由 bind_listeners 创建，bind 仅作记录
+        config.bind = [format_address(host, port) for host in hosts]
+        config.certfile = cert_file
+        config.keyfile = key_file
+        # h2 优先：同一连接上的多个流式响应以 HTTP/2 DATA 帧复用，不支持 h2 的客户端回退 HTTP/1.1
+        config.alpn_protocols = ["h2", "http/1.1"] if server_config.http2 else ["http/1.1"]
+        config.accesslog = None
+        config.graceful_timeout = server_config.drain_timeout
+        config.keep_alive_timeout = server_config.keepalive_timeout
+        return config
+
+    async def _serve(
+        self,
+        config,
+        sockets,
+        ssl_context: ssl.SSLContext,
+        shutdown_event: asyncio.Event,
+        socket_options: list[SocketOption],
+    ) -> None:
+        """运行 Hypercorn 连接处理；停止时先在排空时限内等待在途请求，
+        超时后取消剩余的流式响应，再强制断开残留连接。
+
+        直接使用 hypercorn 的 worker_serve 时，空闲的 keep-alive TLS 连接会在关闭阶段
+        等待客户端的 close_notify（默认 30 秒），因此这里自行跟踪连接。
+        """
+        loop = asyncio.get_running_loop()
+        config.set_statsd_logger_class(StatsdLogger)
+        inflight = InflightTracker()
+        app = wrap_app(inflight.wrap(self._dispatch), config.wsgi_max_body_size, "asgi")
+        lifespan_state: dict = {}
+        lifespan = Lifespan(app, config, loop, lifespan_state)
+        lifespan_task = loop.create_task(lifespan.handle_lifespan())
+        await lifespan.wait_for_startup()
+
+        context = WorkerContext(None)
+        connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+        async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            task = asyncio.current_task()
+            if task is None:
+                return
+            connections[task] = writer
+            if apply_socket_options(writer.get_extra_info("socket"), socket_options):
+                self._stats.incr("socket_option_errors")
+            peername = writer.get_extra_info("peername")
+            ssl_object = writer.get_extra_info("ssl_object")
+            if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+                self._stats.incr("inbound_h2_connections")
+            try:
+                await TCPServer(app, loop, config, context, lifespan_state, reader, writer)
+            except (TimeoutError, ConnectionError):
+                pass
+            finally:
+                connections.pop(task, None)
+                self._stats.record_connection(inflight.pop_connection(peername))
+
+        servers = [
+            await asyncio.start_server(
+                on_connect,
+                backlog=config.backlog,
+                ssl=ssl_context,
+                sock=sock,
+                ssl_handshake_timeout=config.ssl_handshake_timeout,
+                ssl_shutdown_timeout=GRACEFUL_TIMEOUT,
+            )
+            for sock in sockets
+        ]
+        try:
+            await shutdown_event.wait()
+        finally:
+            await context.terminated.set()
+            for server in servers:
+                server.close()
+            self._state.drain_report = await self._drain_streams(inflight, config.graceful_timeout)
+            for writer in list(connections.values()):
+                with contextlib.suppress(Exception):
+                    writer.transport.abort()
+            for server in servers:
+                with contextlib.suppress(Exception):
+                    await asyncio.wait_for(server.wait_closed(), GRACEFUL_TIMEOUT)
+            await lifespan.wait_for_shutdown()
+            lifespan_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await lifespan_task
+
+    async def _drain_streams(self, inflight: InflightTracker, timeout: float) -> dict[str, int]:
+        active = self._stats.active_streams()
+        closed_before = self._stats.closed_streams()
+        if active:
+            self._log(f"停止接收新连接，等待 {active} 个流式响应结束（最多 {timeout} 秒）")
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(inflight.wait_idle(), timeout)
+        drained = self._stats.closed_streams() - closed_before
+        aborted = self._stats.abort_streams()
+        if aborted:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(inflight.wait_idle(), GRACEFUL_TIMEOUT)
+        if drained or aborted:
+            self._log(f"流式响应排空完成: {drained} 个正常结束，{aborted} 个被中止")
+        return self._stats.record_drain(drained, aborted)
+
+    def start(  # noqa: PLR0911, PLR0913, PLR0915
+        self,
+        *,
+        hosts: tuple[str, ...],
+        port: int,
+        target_api_base_url: str,
+        custom_model_id: str,
+        target_model_id: str,
+        stream_mode: str | None,
+        server_config: ServerConfig | None = None,
+        socket_config: SocketTuningConfig | None = None,
+        reuse_port: bool = False,
+    ) -> OperationResult:
+        if self._state.running:
+            self._log("代理服务器已在运行")
+            return OperationResult.success()
+
+        missing = missing_async_dependencies()
+        if missing:
+            self._log(f"异步引擎依赖缺失: {', '.join(missing)}")
+            return OperationResult.failure("异步引擎依赖缺失", code=ErrorCode.CONFIG_INVALID)
+
+        cert_file = self._resource_manager.get_cert_file()
+        key_file = self._resource_manager.get_key_file()
+
+        if not cert_file or not key_file:
+            self._log("证书路径为空")
+            return OperationResult.failure("证书路径为空", code=ErrorCode.CONFIG_INVALID)
+
+        if not (os.path.exists(cert_file) and os.path.exists(key_file)):
+            self._log(f"证书文件不存在: {cert_file} 或 {key_file}")
+            return OperationResult.failure("证书文件不存在", code=ErrorCode.FILE_NOT_FOUND)
+
+        server_config = server_config or ServerConfig()
+        try:
+            config = self._build_config(hosts, port, cert_file, key_file, server_config)
+            ssl_context, reused = get_server_ssl_context(
+                cert_file, key_file, alpn_protocols=tuple(config.alpn_protocols)
+            )
+            sockets, listen_results = bind_listeners(
+                hosts, port, backlog=config.backlog, reuse_port=reuse_port
+            )
+        except PermissionError:
+            self._log(f"权限不足，无法监听 {port} 端口。请以管理员身份运行。")
+            return OperationResult.failure("权限不足", code=ErrorCode.PERMISSION_DENIED)
+        except OSError as exc:
+            if "address already in use" in str(exc).lower():
+                self._log(f"端口 {port} 已被占用。请检查是否有其他服务占用了该端口。")
+                return OperationResult.failure("端口已被占用", code=ErrorCode.PORT_IN_USE)
+            self._log(f"启动服务器时发生 OS 错误: {exc}")
+            return OperationResult.failure("启动服务器时发生 OS 错误", code=ErrorCode.UNKNOWN)
+        except Exception as exc:
+            self._log(f"启动代理服务器时发生意外错误: {exc}")
+            return OperationResult.failure("启动代理服务器时发生意外错误", code=ErrorCode.UNKNOWN)
+
+        if reused:
+            self._log("复用进程内的 TLS 上下文，客户端可恢复重启前的会话")
+        addresses = ", ".join(f"https://{format_address(host, port)}" for host in hosts)
+        self._log(f"启动代理服务器（异步引擎），监听 {addresses}")
+        self._log(f"入站协议: {' / '.join(config.alpn_protocols)}（ALPN 协商）")
+        listen_result = report_listen_results(listen_results, self._log)
+        if not listen_result.ok:
+            return listen_result
+        self._log(f"目标 API 地址: {target_api_base_url}")
+        self._log(f"自定义模型 ID: {custom_model_id}")
+        self._log(f"实际模型 ID: {target_model_id}")
+        if stream_mode:
+            self._log(f"强制流模式: {stream_mode}")
+
+        loop = self._new_event_loop(server_config)
+        shutdown_event = asyncio.Event()
+        server_ready_event = threading.Event()
+        self._state.loop = loop
+        self._state.shutdown_event = shutdown_event
+        self._state.ssl_context = ssl_context
+        self._state.listeners = listen_result.details["listeners"]
+        self._state.drain_timeout = server_config.drain_timeout
+        self._state.drain_report = None
+
+        def run_server():
+            asyncio.set_event_loop(loop)
+            try:
+                server_ready_event.set()
+                loop.run_until_complete(
+                    self._serve(
+                        config,
+                        sockets,
+                        ssl_context,
+                        shutdown_event,
+                        build_socket_options(socket_config or SocketTuningConfig()),
+                    )
+                )
+            except Exception as exc:
+                self._log(f"服务器运行出错: {exc}")
+            finally:
+                with contextlib.suppress(Exception):
+                    loop.run_until_complete(self._app.aclose())
+                loop.close()
+                self._state.running = False
+                self._state.server_task_id = None
+                self._state.loop = None
+                self._state.shutdown_event = None
+                self._state.listeners = None
+                for sock in sockets:
+                    sock.close()
+                self._log("服务器线程已退出")
+
+        self._state.server_task_id = self._thread_manager.run(
+            "proxy_server",
+            run_server,
+            allow_parallel=False,
+        )
+        self._state.running = True
+
+        if not server_ready_event.wait(timeout=5):
+            self._log("代理服务器启动超时")
+            return OperationResult.failure("代理服务器启动超时", code=ErrorCode.UNKNOWN)
+
+        self._log("代理服务器已成功启动")
+        return listen_result
+
+    def stop(self) -> OperationResult:
+        if not self._state.running:
+            self._log("代理服务器未运行")
+            return OperationResult.success()
+
+        self._log("正在停止代理服务器...")
+        self._state.running = False
+
+        loop = self._state.loop
+        shutdown_event = self._state.shutdown_event
+        if loop and shutdown_event:
+            try:
+                loop.call_soon_threadsafe(shutdown_event.set)
+                self._log("服务器停止指令已发送")
+            except RuntimeError as exc:
+                self._log(f"停止服务器时出错: {exc}")
+
+        clean_stop = True
+        task_id = self._state.server_task_id
+        if task_id:
+            # 排空时限之外再留出连接关闭与 lifespan 清理的时间
+            timeout = self._state.drain_timeout + 5
+            try:
+                finished = self._thread_manager.wait(task_id, timeout=timeout)
+                if finished:
+                    self._log("服务器线程已安全停止")
+                else:
+                    clean_stop = False
+                    self._log(f"服务器线程未能在 {timeout} 秒内停止")
+            except Exception as exc:
+                clean_stop = False
+                self._log(f"等待线程结束时出错: {exc}")
+
+        drain_report = self._state.drain_report or {}
+        if clean_stop:
+            self._log("代理服务器已完全停止")
+            return OperationResult.success(**drain_report)
+
+        self._log("代理服务器仍在后台清理，请稍后关注日志")
+        return OperationResult.failure(
+            "代理服务器未完全停止", code=ErrorCode.UNKNOWN, **drain_report
+        )
+
+
+__all__ = ["AsyncProxyRuntime", "missing_async_dependencies"]
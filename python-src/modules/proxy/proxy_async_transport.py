@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import ssl
+from collections.abc import AsyncGenerator
+
+from modules.proxy.proxy_config import SocketTuningConfig, UpstreamPoolConfig
+from modules.proxy.proxy_transport import BaseProxyTransport
+from modules.proxy.proxy_warmup import WARMUP_TIMEOUT
+from modules.runtime.resource_manager import ResourceManager
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 可选依赖
+    httpx = None
+
+try:
+    import h2
+except ImportError:  # pragma: no cover - 可选依赖
+    h2 = None
+
+# httpx 默认空闲 5 秒即关闭长连接，预热后的连接需要保留更久
+UPSTREAM_KEEPALIVE_EXPIRY = 120.0
+
+
+def missing_http2_dependencies() -> list[str]:
+    """返回 HTTP/2 上游缺失的依赖包名，为空表示可用。"""
+    missing: list[str] = []
+    if httpx is None:
+        missing.append("httpx")
+    if h2 is None:
+        missing.append("h2")
+    return missing
+
+
+def build_httpx_limits(pool_config: UpstreamPoolConfig) -> httpx.Limits:
+    """httpx 没有按主机划分的连接池，hosts 不生效；非阻塞模式下不限制总连接数。
+
+    HTTP/2 连接可同时承载多个请求，size 限制的是连接数而不是并发请求数。
+    """
+    return httpx.Limits(
+        max_connections=pool_config.size if pool_config.block else None,
+        max_keepalive_connections=pool_config.size,
+        keepalive_expiry=max(UPSTREAM_KEEPALIVE_EXPIRY, pool_config.ping_interval * 2),
+    )
+
+
+class AsyncProxyTransport(BaseProxyTransport):
+    """异步引擎的传输层：基于 httpx.AsyncClient 的上游请求与 SSE 读取。"""
+
+    def __init__(
+        self,
+        *,
+        resource_manager: ResourceManager,
+        disable_ssl_strict_mode: bool,
+        log_func=print,
+        pool_config: UpstreamPoolConfig | None = None,
+        socket_config: SocketTuningConfig | None = None,
+    ) -> None:
+        super().__init__(
+            resource_manager=resource_manager, log_func=log_func, socket_config=socket_config
+        )
+        self._pool_config = pool_config or UpstreamPoolConfig()
+        self._client = self._create_http_client(disable_ssl_strict_mode)
+        self._closed = False
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        with contextlib.suppress(Exception):
+            await self._client.aclose()
+
+    def _create_http_client(self, disable_ssl_strict_mode: bool) -> httpx.AsyncClient:
+        if httpx is None:
+            raise RuntimeError("httpx 未安装，无法使用异步引擎")
+        verify: ssl.SSLContext | bool = self._relaxed_ssl_context(disable_ssl_strict_mode) or True
+        http2 = self._pool_config.http2
+        if http2 and missing_http2_dependencies():
+            self._log("HTTP/2 依赖 h2 未安装，上游继续使用 HTTP/1.1")
+            http2 = False
+        elif http2:
+            self._log("上游启用 HTTP/2（ALPN 协商，不支持时回退到 HTTP/1.1）")
+        limits = build_httpx_limits(self._pool_config)
+        # 套接字参数只能通过传输层设置；客户端参数保留给环境变量代理使用的传输层
+        transport = httpx.AsyncHTTPTransport(
+            verify=verify, http2=http2, limits=limits, socket_options=self._socket_options
+        )
+        return httpx.AsyncClient(
+            verify=verify,
+            timeout=httpx.Timeout(300),
+            limits=limits,
+            http2=http2,
+            transport=transport,
+        )
+
+    async def awarm_up(self, url: str, count: int) -> int:
+        """并发发起 count 个 HEAD 请求，使连接池保留对应数量的长连接，返回成功数。"""
+        if count <= 0 or self._closed:
+            return 0
+
+        async def ping() -> bool:
+            try:
+                await self._client.head(url, timeout=WARMUP_TIMEOUT)
+            except httpx.HTTPError:
+                return False
+            return True
+
+        results = await asyncio.gather(*(ping() for _ in range(count)))
+        return sum(results)
+
+    async def aextract_sse_events(
+        self, response, *, log_file=None, log
+    ) -> AsyncGenerator[tuple[int, bytes]]:
+        framer = self._new_sse_framer()
+        chunk_index = 0
+        upstream_chunks = response.aiter_bytes()
+        async with contextlib.aclosing(upstream_chunks):
+            async for chunk in upstream_chunks:
+                chunk_index += 1
+                log_file = self._write_sse_log(log_file, chunk, log=log)
+                events = self._feed_sse_framer(framer, chunk, log=log)
+                if events is None:
+                    return
+                for event in events:
+                    yield chunk_index, event
+        rest = framer.flush()
+        if rest.strip():
+            log("警告: 上游 SSE 结束时存在未完整分隔的残留数据")
+            yield chunk_index, rest
+
+
+__all__ = [
+    "UPSTREAM_KEEPALIVE_EXPIRY",
+    "AsyncProxyTransport",
+    "build_httpx_limits",
+    "missing_http2_dependencies",
+]
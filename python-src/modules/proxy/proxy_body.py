@@ -0,0 +1,98 @@
+"""
+请求体原始字节改写
+只解码顶层字段的边界（msgspec.Raw），替换 model / stream 后按片段转发，
+messages 等大字段保持原始字节，不做完整的解析与重新序列化。
+未安装 msgspec 或请求体不是合法的 JSON 对象时返回 None，由调用方走完整解析路径。
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterator, Iterator
+
+from modules.proxy.proxy_json import dumps
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - 可选依赖
+    msgspec = None
+
+# 小于该长度的相邻片段合并发送，大字段保留为原始缓冲区的 memoryview
+_PIECE_COALESCE_SIZE = 64 * 1024
+# 随改写结果返回原始值的顶层字段
+_ORIGINAL_FIELDS = ("model", "stream", "max_tokens", "max_completion_tokens")
+
+_top_level_decoder = msgspec.json.Decoder(dict[str, msgspec.Raw]) if msgspec else None
+
+
+class UpstreamBody:
+    """改写后的请求体：按片段迭代发送，长度已知，可重复迭代（供连接重试）。"""
+
+    def __init__(self, pieces: list[bytes | memoryview]) -> None:
+        self._pieces = pieces
+        self._length = sum(len(piece) for piece in pieces)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes | memoryview]:
+        return iter(self._pieces)
+
+    async def aiter(self) -> AsyncIterator[bytes | memoryview]:
+        for piece in self._pieces:
+            yield piece
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self._pieces)
+
+
+def rewrite_request_body(
+    body: bytes, *, model: str, stream: bool | None
+) -> tuple[UpstreamBody, dict[str, object]] | None:
+    """替换顶层 model（必要时添加）与 stream（stream 为 None 时不改），返回改写结果与原始值。
+
+    原始值字典只包含请求中实际存在的 model / stream / max_tokens / max_completion_tokens 字段。
+    """
+    if _top_level_decoder is None:
+        return None
+    try:
+        fields = _top_level_decoder.decode(body)
+        originals = {
+            key: msgspec.json.decode(fields[key]) for key in _ORIGINAL_FIELDS if key in fields
+        }
+    except msgspec.MsgspecError:
+        return None
+
+    replacements: dict[str, bytes] = {"model": dumps(model).encode()}
+    if stream is not None:
+        replacements["stream"] = b"true" if stream else b"false"
+
+    pieces: list[bytes | memoryview] = []
+    pending = bytearray(b"{")
+    first = True
+    for key, raw in fields.items():
+        if not first:
+            pending += b","
+        first = False
+        pending += msgspec.json.encode(key) + b":"
+        replacement = replacements.pop(key, None)
+        if replacement is not None:
+            pending += replacement
+            continue
+        value = memoryview(raw)
+        if len(value) < _PIECE_COALESCE_SIZE:
+            pending += value
+            continue
+        pieces.append(bytes(pending))
+        pieces.append(value)
+        pending = bytearray()
+    for key, replacement in replacements.items():
+        if not first:
+            pending += b","
+        first = False
+        pending += msgspec.json.encode(key) + b":" + replacement
+    pending += b"}"
+    pieces.append(bytes(pending))
+    return UpstreamBody(pieces), originals
+
+
+__all__ = ["UpstreamBody", "rewrite_request_body"]
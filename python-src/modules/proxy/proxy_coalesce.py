@@ -0,0 +1,95 @@
+"""
+下游 SSE 写入合并与心跳
+上游每秒发出数百个小增量时，逐事件写出意味着同样数量的系统调用与 TLS 记录。
+SseCoalescer 把时间窗口内就绪的事件合并为一次写入：缓冲字节数达到上限或窗口到期即写出，
+首 token 之前（含首 token）的事件与 [DONE] 由调用方标记为 urgent，立即写出，不受窗口影响：
+OpenAI 风格的流通常以只有 role 的事件开头，首个真正的 token 是第二个事件。
+
+推理型上游可能在首个增量之前沉默数十秒，客户端或中间设备会因此判定连接超时。
+配置心跳间隔后，下游超过该间隔没有任何写出时写入一行 SSE 注释（": keepalive"），
+客户端按规范忽略注释行；有真实数据写出即重新计时。心跳从等待上游响应头时就开始计时。
+
+窗口与心跳到期需要在上游没有新事件时也能唤醒，由 proxy_readahead 的读取阶段在到期时产出 None，
+调用方随后调用 expire()。
+"""
+
+from __future__ import annotations
+
+import time
+
+SSE_HEARTBEAT = b": keepalive\n\n"
+
+
+class SseCoalescer:
+    """按时间窗口与字节上限合并下游写入；window 为 0 时逐事件写出，heartbeat 为 0 时不发心跳。"""
+
+    def __init__(self, window: float, max_bytes: int, *, heartbeat: float = 0.0) -> None:
+        self.window = window
+        self.max_bytes = max_bytes
+        self.heartbeat = heartbeat
+        self._parts: list[bytes] = []
+        self._size = 0
+        self._deadline = 0.0
+        self._last_write = time.monotonic()
+        self.writes = 0
+        self.events = 0
+        self.heartbeats = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_bytes > 0
+
+    @property
+    def timed(self) -> bool:
+        """是否需要在没有上游事件时按 timeout() 唤醒。"""
+        return self.enabled or self.heartbeat > 0
+
+    def timeout(self) -> float | None:
+        """距离下一次必须写出（缓冲区或心跳）还剩的秒数，None 表示无限等待。"""
+        deadlines = []
+        if self._parts:
+            deadlines.append(self._deadline)
+        if self.heartbeat > 0:
+            deadlines.append(self._last_write + self.heartbeat)
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0.0)
+
+    def expire(self) -> bytes | None:
+        """等待到期时调用：写出缓冲区，缓冲区为空且心跳到期时返回一次心跳。"""
+        data = self.flush()
+        if data is not None:
+            return data
+        if self.heartbeat > 0 and time.monotonic() >= self._last_write + self.heartbeat:
+            self.heartbeats += 1
+            return self._written(SSE_HEARTBEAT)
+        return None
+
+    def push(self, data: bytes, *, urgent: bool = False) -> bytes | None:
+        """加入一个事件，返回此刻需要写出的字节；urgent 表示连同缓冲区立即写出（例如首 token）。"""
+        self.events += 1
+        if not self._parts:
+            if not self.enabled or urgent:
+                return self._written(data)
+            self._deadline = time.monotonic() + self.window
+        self._parts.append(data)
+        self._size += len(data)
+        if urgent or self._size >= self.max_bytes or time.monotonic() >= self._deadline:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes | None:
+        if not self._parts:
+            return None
+        data = self._parts[0] if len(self._parts) == 1 else b"".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return self._written(data)
+
+    def _written(self, data: bytes) -> bytes:
+        self.writes += 1
+        self._last_write = time.monotonic()
+        return data
+
+
+__all__ = ["SSE_HEARTBEAT", "SseCoalescer"]
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 
 import yaml
 
@@ -10,6 +10,128 @@ from modules.runtime.resource_manager import ResourceManager
 PLACEHOLDER_API_URL = "YOUR_REVERSE_ENGINEERED_API_ENDPOINT_BASE_URL"
 DEFAULT_MIDDLE_ROUTE = "/v1"
 
+PROXY_ENGINE_WSGI = "wsgi"
+PROXY_ENGINE_ASGI = "asgi"
+PROXY_ENGINES = (PROXY_ENGINE_WSGI, PROXY_ENGINE_ASGI)
+
+SERVER_MODE_SINGLE = "single"
+SERVER_MODE_THREADED = "threaded"
+SERVER_MODES = (SERVER_MODE_SINGLE, SERVER_MODE_THREADED)
+DEFAULT_SERVER_WORKERS = 8
+DEFAULT_SERVER_QUEUE_SIZE = 32
+DEFAULT_SERVER_KEEPALIVE_TIMEOUT = 15
+DEFAULT_SERVER_DRAIN_TIMEOUT = 10
+# 默认同时监听全部 IPv4 地址与全部 IPv6 地址（hosts 文件同时映射 127.0.0.1 与 ::1）
+DEFAULT_SERVER_LISTEN_HOSTS = ("0.0.0.0", "::")
+DEFAULT_MAX_REQUEST_BODY_MB = 64
+DEFAULT_UPSTREAM_POOL_SIZE = 10
+DEFAULT_UPSTREAM_POOL_HOSTS = 10
+# 预热默认关闭：开启后即使没有聊天请求也会每隔 ping_interval 秒向上游发送一次 HEAD 探测
+DEFAULT_UPSTREAM_PREWARM = 0
+DEFAULT_UPSTREAM_PING_INTERVAL = 30
+# 异步引擎的准入默认值，WSGI 引擎默认沿用工作线程数与连接队列长度
+DEFAULT_ADMISSION_MAX_CONCURRENT = 32
+DEFAULT_ADMISSION_MAX_QUEUED = 64
+DEFAULT_ADMISSION_QUEUE_TIMEOUT = 30
+DEFAULT_ADMISSION_RETRY_AFTER = 2
+DEFAULT_SSE_COALESCE_MAX_BYTES = 16 * 1024
+DEFAULT_SIMULATED_STREAM_CHUNK_CHARS = 32
+DEFAULT_SOCKET_KEEPALIVE_IDLE = 60
+DEFAULT_UPSTREAM_CONNECT_TIMEOUT = 10
+DEFAULT_UPSTREAM_FIRST_BYTE_TIMEOUT = 300
+DEFAULT_UPSTREAM_IDLE_TIMEOUT = 300
+DEFAULT_SOCKET_KEEPALIVE_INTERVAL = 10
+DEFAULT_SOCKET_KEEPALIVE_COUNT = 5
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    """本地监听端的运行参数。"""
+
+    mode: str = SERVER_MODE_THREADED
+    workers: int = DEFAULT_SERVER_WORKERS
+    queue_size: int = DEFAULT_SERVER_QUEUE_SIZE
+    uvloop: bool = True
+    # 入站长连接的空闲超时（秒），0 表示每个响应后关闭连接
+    keepalive_timeout: int = DEFAULT_SERVER_KEEPALIVE_TIMEOUT
+    # 监听地址列表，共用同一个应用与工作线程池
+    listen_hosts: tuple[str, ...] = DEFAULT_SERVER_LISTEN_HOSTS
+    # 停止时等待进行中的流式响应结束的时限（秒），超时后中止剩余的流
+    drain_timeout: int = DEFAULT_SERVER_DRAIN_TIMEOUT
+    # 工作进程数，大于 1 时各进程通过 SO_REUSEPORT 共享监听端口（仅 Linux）
+    processes: int = 1
+    # 通过 ALPN 协商入站 HTTP/2，HTTP/1.1 作为回退（仅异步引擎，WSGI 引擎只支持 HTTP/1.1）
+    http2: bool = True
+
+
+@dataclass(frozen=True)
+class UpstreamPoolConfig:
+    """上游连接池参数。"""
+
+    size: int = DEFAULT_UPSTREAM_POOL_SIZE  # 每个上游主机保留的最大连接数
+    hosts: int = DEFAULT_UPSTREAM_POOL_HOSTS  # 缓存连接池的主机数量
+    block: bool = False  # 连接数达到上限时等待空闲连接，而不是临时新建
+    prewarm: int = DEFAULT_UPSTREAM_PREWARM  # 启动后预先建立的长连接数，0 表示不预热
+    ping_interval: int = DEFAULT_UPSTREAM_PING_INTERVAL  # 空闲探测间隔（秒），0 表示不探测
+    http2: bool = False  # 通过 ALPN 协商 HTTP/2，上游不支持时回退到 HTTP/1.1
+
+
+@dataclass(frozen=True)
+class UpstreamTimeoutConfig:
+    """上游请求各阶段的时限（秒），0 表示不限制。"""
+
+    connect: int = DEFAULT_UPSTREAM_CONNECT_TIMEOUT  # 建立连接（含 TLS 握手）
+    first_byte: int = DEFAULT_UPSTREAM_FIRST_BYTE_TIMEOUT  # 发出请求到收到响应头
+    first_token: int = 0  # 发出请求到收到首个携带内容的流式事件
+    idle: int = DEFAULT_UPSTREAM_IDLE_TIMEOUT  # 响应体两次读取之间的最长间隔
+    total: int = 0  # 整个请求（含流式响应）的总时限
+
+
+@dataclass(frozen=True)
+class AdmissionConfig:
+    """聊天补全请求的准入控制参数。
+
+    异步引擎在协程中排队；WSGI 引擎的并发上限与等待队列就是工作线程池与连接队列，
+    默认取 server_workers 与 server_queue_size（见 _size_worker_pool）。
+    """
+
+    max_concurrent: int = DEFAULT_ADMISSION_MAX_CONCURRENT  # 同时转发的请求数上限，0 表示不限制
+    max_queued: int = DEFAULT_ADMISSION_MAX_QUEUED  # 等待队列长度，队列已满时返回 429
+    queue_timeout: int = DEFAULT_ADMISSION_QUEUE_TIMEOUT  # 排队超时（秒），超时返回 503
+    retry_after: int = DEFAULT_ADMISSION_RETRY_AFTER  # 拒绝响应中 Retry-After 的秒数
+
+
+@dataclass(frozen=True)
+class StreamConfig:
+    """下游流式响应的写出参数。"""
+
+    # 合并写入的时间窗口（毫秒），0 表示逐事件写出；首个事件与 [DONE] 总是立即写出
+    coalesce_window_ms: int = 0
+    coalesce_max_bytes: int = DEFAULT_SSE_COALESCE_MAX_BYTES  # 缓冲达到该字节数立即写出
+    # 读取阶段缓冲区可容纳的上游事件数，大于 0 时上游由独立线程/任务读取，0 表示与下游写出同步
+    read_ahead_events: int = 0
+    # 下游超过该秒数没有写出时发送 ": keepalive" 注释，0 表示不发送；
+    # 大于 0 时流式请求不等上游响应头，先以 200 开始下游 SSE，之后的上游错误以 SSE error 事件告知
+    heartbeat_interval: int = 0
+    # 非流式响应转换为流式时，每个文本增量累积到的字符数（在词边界处切分）
+    simulated_chunk_chars: int = DEFAULT_SIMULATED_STREAM_CHUNK_CHARS
+    # 转换后相邻增量之间的间隔（毫秒），0 表示不等待、一次写出全部事件
+    simulated_delay_ms: int = 0
+
+
+@dataclass(frozen=True)
+class SocketTuningConfig:
+    """入站与上游 TCP 连接共用的套接字参数。"""
+
+    nodelay: bool = True  # 关闭 Nagle 算法，小的 SSE 增量立即发出
+    keepalive: bool = True  # 启用 TCP keepalive 探测，及早发现失效的空闲连接
+    keepalive_idle: int = DEFAULT_SOCKET_KEEPALIVE_IDLE  # 空闲多少秒后开始探测
+    keepalive_interval: int = DEFAULT_SOCKET_KEEPALIVE_INTERVAL  # 探测间隔（秒）
+    keepalive_count: int = DEFAULT_SOCKET_KEEPALIVE_COUNT  # 连续失败多少次后断开
+    send_buffer: int = 0  # SO_SNDBUF（字节），0 表示沿用系统默认
+    recv_buffer: int = 0  # SO_RCVBUF（字节），0 表示沿用系统默认
+    quickack: bool = False  # TCP_QUICKACK，仅 Linux 支持
+
 
 @dataclass(frozen=True)
 class ProxyConfig:
@@ -22,6 +144,15 @@ class ProxyConfig:
     disable_ssl_strict_mode: bool
     api_key: str
     mtga_auth_key: str
+    engine: str = PROXY_ENGINE_WSGI
+    sse_passthrough: bool = False
+    max_request_body: int = DEFAULT_MAX_REQUEST_BODY_MB * 1024 * 1024
+    server: ServerConfig = field(default_factory=ServerConfig)
+    upstream_pool: UpstreamPoolConfig = field(default_factory=UpstreamPoolConfig)
+    upstream_timeouts: UpstreamTimeoutConfig = field(default_factory=UpstreamTimeoutConfig)
+    admission: AdmissionConfig = field(default_factory=AdmissionConfig)
+    stream: StreamConfig = field(default_factory=StreamConfig)
+    socket: SocketTuningConfig = field(default_factory=SocketTuningConfig)
 
 
 def load_global_config(*, resource_manager: ResourceManager, log_func=print) -> dict:
@@ -59,6 +190,216 @@ def normalize_middle_route(value: str | None) -> str:
     return raw_value
 
 
+def _coerce_int(value, *, default: int, minimum: int = 0) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(number, minimum)
+
+
+def _coerce_bool(value, *, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in {"1", "true", "yes", "on"}:
+            return True
+        if normalized in {"0", "false", "no", "off"}:
+            return False
+        return default
+    return bool(value)
+
+
+def _coerce_hosts(value, *, default: tuple[str, ...]) -> tuple[str, ...]:
+    """接受列表或逗号分隔的字符串，IPv6 地址可带方括号。"""
+    items = value.split(",") if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        return default
+    hosts = tuple(
+        dict.fromkeys(str(item).strip().strip("[]") for item in items if str(item).strip())
+    )
+    return hosts or default
+
+
+def _coerce_choice(value, *, choices: tuple[str, ...], default: str) -> str:
+    normalized = str(value or "").strip().lower()
+    return normalized if normalized in choices else default
+
+
+def resolve_proxy_engine(raw_config: dict | None) -> str:
+    return _coerce_choice(
+        (raw_config or {}).get("proxy_engine"),
+        choices=PROXY_ENGINES,
+        default=PROXY_ENGINE_WSGI,
+    )
+
+
+def _build_server_config(raw_config: dict) -> ServerConfig:
+    return ServerConfig(
+        mode=_coerce_choice(
+            raw_config.get("server_mode"),
+            choices=SERVER_MODES,
+            default=SERVER_MODE_THREADED,
+        ),
+        workers=_coerce_int(
+            raw_config.get("server_workers"),
+            default=DEFAULT_SERVER_WORKERS,
+            minimum=1,
+        ),
+        queue_size=_coerce_int(
+            raw_config.get("server_queue_size"),
+            default=DEFAULT_SERVER_QUEUE_SIZE,
+            minimum=1,
+        ),
+        uvloop=_coerce_bool(raw_config.get("server_uvloop"), default=True),
+        keepalive_timeout=_coerce_int(
+            raw_config.get("server_keepalive_timeout"),
+            default=DEFAULT_SERVER_KEEPALIVE_TIMEOUT,
+        ),
+        listen_hosts=_coerce_hosts(
+            raw_config.get("server_listen_hosts"),
+            default=DEFAULT_SERVER_LISTEN_HOSTS,
+        ),
+        drain_timeout=_coerce_int(
+            raw_config.get("server_drain_timeout"),
+            default=DEFAULT_SERVER_DRAIN_TIMEOUT,
+        ),
+        processes=_coerce_int(raw_config.get("server_processes"), default=1, minimum=1),
+        http2=_coerce_bool(raw_config.get("server_http2"), default=True),
+    )
+
+
+def _build_upstream_pool_config(raw_config: dict) -> UpstreamPoolConfig:
+    size = _coerce_int(
+        raw_config.get("upstream_pool_size"),
+        default=DEFAULT_UPSTREAM_POOL_SIZE,
+        minimum=1,
+    )
+    return UpstreamPoolConfig(
+        size=size,
+        hosts=_coerce_int(
+            raw_config.get("upstream_pool_hosts"),
+            default=DEFAULT_UPSTREAM_POOL_HOSTS,
+            minimum=1,
+        ),
+        block=_coerce_bool(raw_config.get("upstream_pool_block"), default=False),
+        prewarm=min(
+            _coerce_int(raw_config.get("upstream_prewarm"), default=DEFAULT_UPSTREAM_PREWARM),
+            size,
+        ),
+        ping_interval=_coerce_int(
+            raw_config.get("upstream_ping_interval"),
+            default=DEFAULT_UPSTREAM_PING_INTERVAL,
+        ),
+        http2=_coerce_bool(raw_config.get("upstream_http2"), default=False),
+    )
+
+
+def _build_upstream_timeout_config(raw_config: dict) -> UpstreamTimeoutConfig:
+    return UpstreamTimeoutConfig(
+        connect=_coerce_int(
+            raw_config.get("upstream_connect_timeout"),
+            default=DEFAULT_UPSTREAM_CONNECT_TIMEOUT,
+        ),
+        first_byte=_coerce_int(
+            raw_config.get("upstream_first_byte_timeout"),
+            default=DEFAULT_UPSTREAM_FIRST_BYTE_TIMEOUT,
+        ),
+        first_token=_coerce_int(raw_config.get("upstream_first_token_timeout"), default=0),
+        idle=_coerce_int(
+            raw_config.get("upstream_idle_timeout"),
+            default=DEFAULT_UPSTREAM_IDLE_TIMEOUT,
+        ),
+        total=_coerce_int(raw_config.get("upstream_total_timeout"), default=0),
+    )
+
+
+def _build_admission_config(
+    raw_config: dict, *, engine: str, server: ServerConfig
+) -> AdmissionConfig:
+    # WSGI 引擎的准入由工作线程池承担，未配置时沿用线程数与连接队列长度
+    wsgi = engine == PROXY_ENGINE_WSGI
+    return AdmissionConfig(
+        max_concurrent=_coerce_int(
+            raw_config.get("admission_max_concurrent"),
+            default=server.workers if wsgi else DEFAULT_ADMISSION_MAX_CONCURRENT,
+        ),
+        max_queued=_coerce_int(
+            raw_config.get("admission_max_queued"),
+            default=server.queue_size if wsgi else DEFAULT_ADMISSION_MAX_QUEUED,
+        ),
+        queue_timeout=_coerce_int(
+            raw_config.get("admission_queue_timeout"),
+            default=DEFAULT_ADMISSION_QUEUE_TIMEOUT,
+        ),
+        retry_after=_coerce_int(
+            raw_config.get("admission_retry_after"),
+            default=DEFAULT_ADMISSION_RETRY_AFTER,
+            minimum=1,
+        ),
+    )
+
+
+def _size_worker_pool(
+    server: ServerConfig, admission: AdmissionConfig
+) -> tuple[ServerConfig, AdmissionConfig]:
+    """WSGI 引擎按准入参数确定线程池：线程数即并发上限，连接队列即等待队列。
+
+    排队的连接在进入工作线程之前等待，不占用线程；并发上限为 0（不限制）时沿用 server_workers。
+    """
+    workers = admission.max_concurrent or server.workers
+    queue_size = max(1, admission.max_queued)
+    return (
+        replace(server, workers=workers, queue_size=queue_size),
+        replace(admission, max_concurrent=workers, max_queued=queue_size),
+    )
+
+
+def _build_stream_config(raw_config: dict) -> StreamConfig:
+    return StreamConfig(
+        coalesce_window_ms=_coerce_int(raw_config.get("sse_coalesce_window_ms"), default=0),
+        coalesce_max_bytes=_coerce_int(
+            raw_config.get("sse_coalesce_max_bytes"),
+            default=DEFAULT_SSE_COALESCE_MAX_BYTES,
+            minimum=1,
+        ),
+        read_ahead_events=_coerce_int(raw_config.get("sse_read_ahead_events"), default=0),
+        heartbeat_interval=_coerce_int(raw_config.get("sse_heartbeat_interval"), default=0),
+        simulated_chunk_chars=_coerce_int(
+            raw_config.get("simulated_stream_chunk_chars"),
+            default=DEFAULT_SIMULATED_STREAM_CHUNK_CHARS,
+            minimum=1,
+        ),
+        simulated_delay_ms=_coerce_int(raw_config.get("simulated_stream_delay_ms"), default=0),
+    )
+
+
+def _build_socket_tuning_config(raw_config: dict) -> SocketTuningConfig:
+    return SocketTuningConfig(
+        nodelay=_coerce_bool(raw_config.get("socket_nodelay"), default=True),
+        keepalive=_coerce_bool(raw_config.get("socket_keepalive"), default=True),
+        keepalive_idle=_coerce_int(
+            raw_config.get("socket_keepalive_idle"),
+            default=DEFAULT_SOCKET_KEEPALIVE_IDLE,
+            minimum=1,
+        ),
+        keepalive_interval=_coerce_int(
+            raw_config.get("socket_keepalive_interval"),
+            default=DEFAULT_SOCKET_KEEPALIVE_INTERVAL,
+            minimum=1,
+        ),
+        keepalive_count=_coerce_int(
+            raw_config.get("socket_keepalive_count"),
+            default=DEFAULT_SOCKET_KEEPALIVE_COUNT,
+            minimum=1,
+        ),
+        send_buffer=_coerce_int(raw_config.get("socket_send_buffer"), default=0),
+        recv_buffer=_coerce_int(raw_config.get("socket_recv_buffer"), default=0),
+        quickack=_coerce_bool(raw_config.get("socket_quickack"), default=False),
+    )
+
+
 def build_proxy_config(
     raw_config: dict | None,
     *,
@@ -82,6 +423,11 @@ def build_proxy_config(
         custom_model_id=custom_model_id,
     )
     middle_route = normalize_middle_route(raw_config.get("middle_route"))
+    engine = resolve_proxy_engine(raw_config)
+    server = _build_server_config(raw_config)
+    admission = _build_admission_config(raw_config, engine=engine, server=server)
+    if engine == PROXY_ENGINE_WSGI and server.mode == SERVER_MODE_THREADED:
+        server, admission = _size_worker_pool(server, admission)
 
     return ProxyConfig(
         target_api_base_url=target_api_base_url,
@@ -93,14 +439,64 @@ def build_proxy_config(
         disable_ssl_strict_mode=bool(raw_config.get("disable_ssl_strict_mode", False)),
         api_key=(raw_config.get("api_key") or ""),
         mtga_auth_key=(global_config.get("mtga_auth_key") or ""),
+        engine=engine,
+        sse_passthrough=_coerce_bool(raw_config.get("sse_passthrough"), default=False),
+        max_request_body=_coerce_int(
+            raw_config.get("max_request_body_mb"),
+            default=DEFAULT_MAX_REQUEST_BODY_MB,
+            minimum=1,
+        )
+        * 1024
+        * 1024,
+        server=server,
+        upstream_pool=_build_upstream_pool_config(raw_config),
+        upstream_timeouts=_build_upstream_timeout_config(raw_config),
+        admission=admission,
+        stream=_build_stream_config(raw_config),
+        socket=_build_socket_tuning_config(raw_config),
     )
 
 
 __all__ = [
+    "DEFAULT_ADMISSION_MAX_CONCURRENT",
+    "DEFAULT_ADMISSION_MAX_QUEUED",
+    "DEFAULT_ADMISSION_QUEUE_TIMEOUT",
+    "DEFAULT_ADMISSION_RETRY_AFTER",
+    "DEFAULT_MAX_REQUEST_BODY_MB",
     "DEFAULT_MIDDLE_ROUTE",
+    "DEFAULT_SERVER_DRAIN_TIMEOUT",
+    "DEFAULT_SERVER_KEEPALIVE_TIMEOUT",
+    "DEFAULT_SERVER_LISTEN_HOSTS",
+    "DEFAULT_SERVER_QUEUE_SIZE",
+    "DEFAULT_SERVER_WORKERS",
+    "DEFAULT_SIMULATED_STREAM_CHUNK_CHARS",
+    "DEFAULT_SOCKET_KEEPALIVE_COUNT",
+    "DEFAULT_SOCKET_KEEPALIVE_IDLE",
+    "DEFAULT_SOCKET_KEEPALIVE_INTERVAL",
+    "DEFAULT_SSE_COALESCE_MAX_BYTES",
+    "DEFAULT_UPSTREAM_CONNECT_TIMEOUT",
+    "DEFAULT_UPSTREAM_FIRST_BYTE_TIMEOUT",
+    "DEFAULT_UPSTREAM_IDLE_TIMEOUT",
+    "DEFAULT_UPSTREAM_PING_INTERVAL",
+    "DEFAULT_UPSTREAM_POOL_HOSTS",
+    "DEFAULT_UPSTREAM_POOL_SIZE",
+    "DEFAULT_UPSTREAM_PREWARM",
+    "AdmissionConfig",
     "ProxyConfig",
     "PLACEHOLDER_API_URL",
+    "PROXY_ENGINES",
+    "PROXY_ENGINE_ASGI",
+    "PROXY_ENGINE_WSGI",
+    "SERVER_MODES",
+    "SERVER_MODE_SINGLE",
+    "SERVER_MODE_THREADED",
+    "ServerConfig",
+    "SocketTuningConfig",
+    "StreamConfig",
+    "UpstreamPoolConfig",
+    "UpstreamTimeoutConfig",
     "build_proxy_config",
     "load_global_config",
     "normalize_middle_route",
+    "resolve_proxy_engine",
 ]
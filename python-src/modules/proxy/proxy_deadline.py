@@ -0,0 +1,215 @@
+"""
+上游请求的分阶段时限
+原先单一的 300 秒超时无法区分连接缓慢与流式响应停滞，失效的上游会占住工作线程长达 5 分钟。
+UpstreamDeadlines 为一次请求分别跟踪：
+    connect      建立连接（含 TLS 握手），由 HTTP 客户端的连接超时执行
+    first_byte   发出请求到收到响应头，由客户端的读取超时执行（异步引擎另有精确计时）
+    first_token  发出请求到收到首个携带内容的流式事件
+    idle         响应体两次读取之间的最长间隔，由套接字读取超时执行，流式读取阶段另按事件计时
+    total        整个请求的总时限，约束以上每个阶段
+流式阶段的时限（first_token / idle / total）通过读取阶段的限时等待检查。
+每种超时对应不同的错误码返回给客户端，并单独计数。
+"""
+
+from __future__ import annotations
+
+import time
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
+
+from modules.proxy.proxy_async_transport import httpx
+from modules.proxy.proxy_config import UpstreamTimeoutConfig
+from modules.proxy.proxy_stream import carries_token
+
+TIMEOUT_CONNECT = "connect"
+TIMEOUT_FIRST_BYTE = "first_byte"
+TIMEOUT_FIRST_TOKEN = "first_token"
+TIMEOUT_IDLE = "idle"
+TIMEOUT_TOTAL = "total"
+
+_TIMEOUT_ERRORS = {
+    TIMEOUT_CONNECT: ("upstream_connect_timeout", "Timed out connecting to target API"),
+    TIMEOUT_FIRST_BYTE: ("upstream_first_byte_timeout", "Target API did not respond in time"),
+    TIMEOUT_FIRST_TOKEN: (
+        "upstream_first_token_timeout",
+        "Target API did not produce any output in time",
+    ),
+    TIMEOUT_IDLE: ("upstream_idle_timeout", "Target API stream stalled"),
+    TIMEOUT_TOTAL: ("upstream_deadline_exceeded", "Request exceeded the overall deadline"),
+}
+
+_TIMEOUT_LABELS = {
+    TIMEOUT_CONNECT: "连接",
+    TIMEOUT_FIRST_BYTE: "首字节",
+    TIMEOUT_FIRST_TOKEN: "首 token",
+    TIMEOUT_IDLE: "空闲",
+    TIMEOUT_TOTAL: "总时限",
+}
+
+_CONNECT_TIMEOUTS: tuple[type[BaseException], ...] = (
+    requests.exceptions.ConnectTimeout,
+    ConnectTimeoutError,
+) + ((httpx.ConnectTimeout,) if httpx is not None else ())
+_TIMEOUTS: tuple[type[BaseException], ...] = (
+    requests.exceptions.Timeout,
+    Urllib3TimeoutError,
+    TimeoutError,
+) + ((httpx.TimeoutException,) if httpx is not None else ())
+
+
+class UpstreamTimeout(Exception):
+    """流式阶段的时限到期。"""
+
+    def __init__(self, kind: str) -> None:
+        super().__init__(kind)
+        self.kind = kind
+
+
+def _exception_chain(exc: BaseException):
+    """依次产出异常本身及其 __cause__ / __context__（requests 会把读取超时包装为连接错误）。"""
+    seen: set[int] = set()
+    current: BaseException | None = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        yield current
+        current = current.__cause__ or current.__context__
+
+
+def _is_handshake_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, TimeoutError) and "handshake" in str(exc)
+
+
+def timeout_error_payload(kind: str, seconds: float) -> dict:
+    code, message = _TIMEOUT_ERRORS[kind]
+    return {
+        "error": {
+            "message": f"{message} ({seconds:g}s)",
+            "type": "timeout_error",
+            "code": code,
+        }
+    }
+
+
+class UpstreamDeadlines:
+    """一次上游请求的时限，创建时开始计时。"""
+
+    def __init__(self, config: UpstreamTimeoutConfig) -> None:
+        self.config = config
+        self.started = time.monotonic()
+        self.last_event = self.started
+        self.token_seen = False
+        # 同步引擎的空闲时限是否已由套接字读取超时执行
+        self.idle_on_socket = False
+
+    def limit(self, kind: str) -> int:
+        return getattr(self.config, kind)
+
+    @staticmethod
+    def label(kind: str) -> str:
+        return _TIMEOUT_LABELS[kind]
+
+    def _remaining_total(self) -> float | None:
+        if not self.config.total:
+            return None
+        return max(self.started + self.config.total - time.monotonic(), 0.0)
+
+    def _bounded(self, seconds: int) -> float | None:
+        remaining = self._remaining_total()
+        if not seconds:
+            return remaining
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def request_timeout(self) -> tuple[float | None, float | None]:
+        """发送请求时使用的 (连接超时, 读取超时)，读取超时在收到响应头之前即首字节时限。"""
+        return self._bounded(self.config.connect), self._bounded(self.config.first_byte)
+
+    def body_read_timeout(self) -> float | None:
+        """收到响应头之后的套接字读取超时。"""
+        return self._bounded(self.config.idle)
+
+    def header_read_timeout(self) -> float | None:
+        """异步引擎的读取超时同时作用于响应头与响应体，取两者中较长的一个，首字节另行计时。"""
+        first_byte, idle = self.config.first_byte, self.config.idle
+        return self._bounded(max(first_byte, idle) if first_byte and idle else 0)
+
+    @property
+    def stream_timed(self) -> bool:
+        """流式阶段是否有需要按事件计时的时限。"""
+        return bool(self.config.first_token or self.config.idle or self.config.total)
+
+    @property
+    def wait_timed(self) -> bool:
+        """同步引擎的流式读取是否需要限时等待：首 token、总时限，以及无法由套接字执行的空闲时限。"""
+        config = self.config
+        return bool(config.first_token or config.total or (config.idle and not self.idle_on_socket))
+
+    def response_started(self) -> None:
+        self.last_event = time.monotonic()
+
+    def on_event(self, output: bytes) -> None:
+        self.last_event = time.monotonic()
+        if not self.token_seen and carries_token(output):
+            self.token_seen = True
+
+    def _stream_deadlines(self) -> list[tuple[float, str]]:
+        config = self.config
+        deadlines: list[tuple[float, str]] = []
+        if config.total:
+            deadlines.append((self.started + config.total, TIMEOUT_TOTAL))
+        if config.first_token and not self.token_seen:
+            deadlines.append((self.started + config.first_token, TIMEOUT_FIRST_TOKEN))
+        if config.idle:
+            deadlines.append((self.last_event + config.idle, TIMEOUT_IDLE))
+        return deadlines
+
+    def timeout(self) -> float | None:
+        """距离最近一个流式时限还剩的秒数，None 表示不限制。"""
+        deadlines = self._stream_deadlines()
+        if not deadlines:
+            return None
+        return max(min(deadlines)[0] - time.monotonic(), 0.0)
+
+    def expired(self) -> str | None:
+        """返回已到期的流式时限类型（最早到期者），均未到期时返回 None。"""
+        now = time.monotonic()
+        due = [deadline for deadline in self._stream_deadlines() if deadline[0] <= now]
+        return min(due)[1] if due else None
+
+    def classify(self, exc: BaseException, *, headers_received: bool) -> str | None:
+        """把 HTTP 客户端抛出的超时异常归类为时限类型，不是超时返回 None。"""
+        if isinstance(exc, UpstreamTimeout):
+            return exc.kind
+        chain = list(_exception_chain(exc))
+        if not any(isinstance(item, _TIMEOUTS) for item in chain):
+            return None
+        if self.config.total and self._remaining_total() == 0:
+            return TIMEOUT_TOTAL
+        # urllib3 把 TLS 握手超时报告为读取超时，只能从底层 ssl 异常的信息中区分
+        if any(
+            isinstance(item, _CONNECT_TIMEOUTS) or _is_handshake_timeout(item) for item in chain
+        ):
+            return TIMEOUT_CONNECT
+        if not headers_received:
+            return TIMEOUT_FIRST_BYTE
+        return TIMEOUT_IDLE
+
+
+def earliest_timeout(*timeouts) -> float | None:
+    """合并多个 timeout() 的结果，取最近的一个；全部为 None 时返回 None。"""
+    values = [value for value in (timeout() for timeout in timeouts) if value is not None]
+    return min(values) if values else None
+
+
+__all__ = [
+    "TIMEOUT_CONNECT",
+    "TIMEOUT_FIRST_BYTE",
+    "TIMEOUT_FIRST_TOKEN",
+    "TIMEOUT_IDLE",
+    "TIMEOUT_TOTAL",
+    "UpstreamDeadlines",
+    "UpstreamTimeout",
+    "earliest_timeout",
+    "timeout_error_payload",
+]
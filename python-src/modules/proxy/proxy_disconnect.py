@@ -0,0 +1,216 @@
+"""
+下游断开时中止上游请求
+原先只有向下游写出失败时才会发现客户端已断开：连接上游、等待响应头与非流式生成期间
+IDE 取消请求，上游仍会把整个响应生成完，白白消耗 token。
+
+UpstreamCancel 是一次上游请求的中止句柄，随请求进展替换中止方式：
+    headers   连接上游与等待响应头，关闭上游套接字（同步引擎经由 urllib3 连接登记）
+    body      读取非流式响应体，中断上游响应
+    stream    流式转发，中断上游响应
+异步引擎直接取消处理请求的任务。
+
+同步引擎由 DisconnectWatcher 的后台线程轮询入站连接：Linux 上等待 POLLRDHUP，
+连接上有未读数据（例如 TLS close_notify）时也能识别对端关闭；其他平台只能在连接可读时
+窥探原始套接字，读到 EOF 或连接错误即视为断开，读到数据则无法判断，不再监视该连接。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import select
+import socket
+import threading
+import time
+from collections.abc import Callable, Iterator
+
+STAGE_HEADERS = "headers"
+STAGE_BODY = "body"
+STAGE_STREAM = "stream"
+
+_STAGE_LABELS = {
+    STAGE_HEADERS: "等待上游响应头",
+    STAGE_BODY: "读取上游响应体",
+    STAGE_STREAM: "流式转发",
+}
+
+_POLL_INTERVAL = 0.25
+_POLLRDHUP = getattr(select, "POLLRDHUP", None)
+
+_local = threading.local()
+
+
+def shutdown_socket(sock: socket.socket) -> None:
+    """从其他线程关闭套接字的收发，唤醒阻塞在该套接字上的连接、发送与读取。
+
+    直接调用 socket.socket.shutdown，SSLSocket 也不会改动其 TLS 状态。
+    """
+    with contextlib.suppress(OSError):
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+
+
+def current_upstream_cancel() -> UpstreamCancel | None:
+    """当前线程正在发送的上游请求的中止句柄，供传输层登记连接。"""
+    return getattr(_local, "cancel", None)
+
+
+class UpstreamCancel:
+    """一次上游请求的中止句柄，cancel() 可跨线程调用。"""
+
+    def __init__(self, token_limit: int | None = None) -> None:
+        self._lock = threading.Lock()
+        self._interrupt: Callable[[], None] | None = None
+        self.started = time.monotonic()
+        self.stage = STAGE_HEADERS
+        self.token_limit = token_limit
+        self.cancelled = False
+
+    @contextlib.contextmanager
+    def bind(self) -> Iterator[None]:
+        """在当前线程内登记句柄，期间传输层建立或复用的上游连接会调用 set_interrupt()。"""
+        previous = current_upstream_cancel()
+        _local.cancel = self
+        try:
+            yield
+        finally:
+            _local.cancel = previous
+
+    def set_interrupt(
+        self, interrupt: Callable[[], None] | None, *, stage: str | None = None
+    ) -> None:
+        """替换中止方式；已经取消时立即执行。传入 None 表示请求已结束，之后的取消不再生效。"""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            self._interrupt = interrupt
+            cancelled = self.cancelled
+        if cancelled and interrupt is not None:
+            with contextlib.suppress(Exception):
+                interrupt()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            interrupt = self._interrupt
+        if interrupt is not None:
+            with contextlib.suppress(Exception):
+                interrupt()
+
+    def describe(self, *, events: int = 0, bytes_out: int = 0) -> str:
+        """中止时的日志：所处阶段、已转发的数据与按 max_tokens 估计节省的 token 数。"""
+        elapsed = time.monotonic() - self.started
+        parts = [f"客户端已断开（{_STAGE_LABELS[self.stage]}，{elapsed:.1f} 秒），已中止上游请求"]
+        if self.stage == STAGE_BODY:
+            # 非流式响应在生成完毕后才返回响应头，此时只省下响应体的传输
+            parts.append("响应已生成，仅省去响应体传输")
+            return "，".join(parts)
+        if self.stage == STAGE_STREAM:
+            parts.append(f"已转发 {events} 个事件（{bytes_out} 字节），其余输出不再生成")
+        else:
+            parts.append("上游尚未返回任何数据")
+        if self.token_limit:
+            # 每个流式事件约对应一个 token
+            saved = max(self.token_limit - events, 0)
+            parts.append(f"按 max_tokens={self.token_limit} 估计最多节省 {saved} tokens")
+        return "，".join(parts)
+
+
+def _peer_closed(sock: socket.socket) -> bool | None:
+    """连接可读时窥探原始数据：EOF 或连接错误返回 True，有数据时无法判断返回 None。"""
+    try:
+        data = socket.socket.recv(sock, 1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+    return True if not data else None
+
+
+class DisconnectWatcher:
+    """在后台线程中监视入站连接，对端关闭时调用登记的回调；没有登记的连接时线程退出。"""
+
+    def __init__(self, interval: float = _POLL_INTERVAL) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched: dict[object, tuple[socket.socket, Callable[[], None]]] = {}
+        self._thread: threading.Thread | None = None
+
+    def watch(self, sock: socket.socket, callback: Callable[[], None]) -> Callable[[], None]:
+        """登记连接，返回取消登记的函数；回调最多调用一次，在监视线程中执行。"""
+        key = object()
+        with self._lock:
+            self._watched[key] = (sock, callback)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="mtga-disconnect-watcher", daemon=True
+                )
+                self._thread.start()
+
+        def unwatch() -> None:
+            with self._lock:
+                self._watched.pop(key, None)
+
+        return unwatch
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._watched:
+                    self._thread = None
+                    return
+                entries = list(self._watched.items())
+            for key, closed in self._poll(entries):
+                with self._lock:
+                    entry = self._watched.pop(key, None)
+                if entry is not None and closed:
+                    with contextlib.suppress(Exception):
+                        entry[1]()
+
+    def _poll(self, entries) -> list[tuple[object, bool]]:
+        """等待至多 interval 秒，返回需要移出监视的连接及其是否已断开。"""
+        keys_by_fd: dict[int, list[object]] = {}
+        socks_by_fd: dict[int, socket.socket] = {}
+        results: list[tuple[object, bool]] = []
+        for key, (sock, _callback) in entries:
+            fd = sock.fileno()
+            if fd < 0:
+                results.append((key, True))
+                continue
+            keys_by_fd.setdefault(fd, []).append(key)
+            socks_by_fd[fd] = sock
+        if results or not keys_by_fd:
+            return results
+        if _POLLRDHUP is not None:
+            poller = select.poll()
+            for fd in keys_by_fd:
+                # POLLHUP / POLLERR 总会报告
+                poller.register(fd, _POLLRDHUP)
+            try:
+                ready = [fd for fd, _event in poller.poll(self.interval * 1000)]
+            except OSError:
+                time.sleep(self.interval)
+                return results
+            return [(key, True) for fd in ready for key in keys_by_fd.get(fd, ())]
+        try:
+            readable, _, _ = select.select(list(socks_by_fd), [], [], self.interval)
+        except (OSError, ValueError):
+            # 连接在登记期间被关闭，下一轮按 fileno() < 0 移出
+            time.sleep(self.interval)
+            return results
+        for fd in readable:
+            closed = _peer_closed(socks_by_fd[fd])
+            if closed is not False:
+                results.extend((key, bool(closed)) for key in keys_by_fd[fd])
+        return results
+
+
+__all__ = [
+    "STAGE_BODY",
+    "STAGE_HEADERS",
+    "STAGE_STREAM",
+    "DisconnectWatcher",
+    "UpstreamCancel",
+    "current_upstream_cancel",
+    "shutdown_socket",
+]
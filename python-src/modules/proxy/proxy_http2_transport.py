@@ -0,0 +1,164 @@
+"""
+HTTP/2 上游传输（同步引擎）
+基于 httpx.Client(http2=True)：TLS 握手时通过 ALPN 协商 h2，并发的流式请求复用少量连接；
+上游未提供 h2 或地址为明文 http:// 时自动使用 HTTP/1.1。
+Http2Session 只实现 ProxyApp 同步转发用到的 requests 接口子集，并把 httpx 异常转换为
+requests 异常，因此同步引擎的转发逻辑无需区分底层客户端。
+"""
+
+from __future__ import annotations
+
+import contextlib
+from collections.abc import Iterator
+
+import requests
+
+from modules.proxy.proxy_async_transport import build_httpx_limits, httpx
+from modules.proxy.proxy_body import UpstreamBody
+from modules.proxy.proxy_transport import ProxyTransport
+
+
+def _translate_error(exc: Exception) -> requests.exceptions.RequestException:
+    if isinstance(exc, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(str(exc))
+    if isinstance(exc, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(str(exc))
+    return requests.exceptions.ConnectionError(str(exc))
+
+
+class Http2Response:
+    """httpx.Response 的 requests 风格视图。"""
+
+    def __init__(self, response: httpx.Response) -> None:
+        self._response = response
+
+    @property
+    def status_code(self) -> int:
+        return self._response.status_code
+
+    @property
+    def headers(self) -> httpx.Headers:
+        return self._response.headers
+
+    @property
+    def http_version(self) -> str:
+        return self._response.http_version
+
+    @property
+    def content(self) -> bytes:
+        try:
+            return self._response.read()
+        except httpx.HTTPError as exc:
+            raise _translate_error(exc) from exc
+
+    @property
+    def text(self) -> str:
+        self.content  # noqa: B018 - 流式响应需先读完响应体
+        return self._response.text
+
+    def raise_for_status(self) -> None:
+        if not self._response.is_error:
+            return
+        with contextlib.suppress(requests.exceptions.RequestException):
+            self.content  # noqa: B018
+        raise requests.exceptions.HTTPError(
+            f"{self.status_code} Error for url: {self._response.url}", response=self
+        )
+
+    def iter_content(self, chunk_size: int | None = None) -> Iterator[bytes]:
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except httpx.HTTPError as exc:
+            raise requests.exceptions.ChunkedEncodingError(str(exc)) from exc
+
+    def close(self) -> None:
+        self._response.close()
+
+
+class Http2Session:
+    """提供 post / head / close 的最小会话接口。"""
+
+    def __init__(self, client: httpx.Client) -> None:
+        self._client = client
+
+    def post(self, url: str, *, data=None, headers=None, stream=False, timeout=None):
+        if isinstance(timeout, tuple):
+            # requests 风格的 (连接超时, 读取超时)
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        headers = dict(headers or {})
+        content = data
+        if isinstance(data, UpstreamBody):
+            # 按片段发送，长度已知时无需分块编码
+            headers["Content-Length"] = str(len(data))
+            content = iter(data)
+        return self._send(
+            "POST",
+            url,
+            content=content,
+            headers=headers,
+            stream=stream,
+            timeout=timeout,
+            follow_redirects=True,
+        )
+
+    def head(self, url: str, *, timeout=None, allow_redirects=False):
+        return self._send(
+            "HEAD",
+            url,
+            headers=None,
+            stream=False,
+            timeout=timeout,
+            follow_redirects=allow_redirects,
+        )
+
+    def close(self) -> None:
+        self._client.close()
+
+    def _send(  # noqa: PLR0913
+        self,
+        method: str,
+        url: str,
+        *,
+        content=None,
+        headers,
+        stream: bool,
+        timeout,
+        follow_redirects: bool,
+    ):
+        request = self._client.build_request(
+            method,
+            url,
+            content=content,
+            headers=headers,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        )
+        try:
+            response = self._client.send(
+                request, stream=stream, follow_redirects=follow_redirects
+            )
+        except httpx.HTTPError as exc:
+            raise _translate_error(exc) from exc
+        return Http2Response(response)
+
+
+class Http2ProxyTransport(ProxyTransport):
+    """同步引擎的 HTTP/2 传输层，SSE 读取与预热沿用 ProxyTransport 的实现。"""
+
+    def _create_http_client(self, disable_ssl_strict_mode: bool) -> Http2Session:
+        verify = self._relaxed_ssl_context(disable_ssl_strict_mode) or True
+        limits = build_httpx_limits(self._pool_config)
+        transport = httpx.HTTPTransport(
+            verify=verify, http2=True, limits=limits, socket_options=self._socket_options
+        )
+        client = httpx.Client(
+            verify=verify,
+            timeout=httpx.Timeout(300),
+            limits=limits,
+            http2=True,
+            transport=transport,
+        )
+        return Http2Session(client)
+
+
+__all__ = ["Http2ProxyTransport", "Http2Response", "Http2Session"]
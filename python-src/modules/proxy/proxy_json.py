@@ -0,0 +1,88 @@
+"""
+代理热路径使用的 JSON 编解码
+解码优先使用 msgspec（fastjson 可选依赖），未安装时回退到标准库；快速后端解析失败时也回退到标准库，
+保证 NaN、超长整数等边界输入与 json.loads 的行为一致。
+dumps 始终由标准库生成，与 json.dumps(..., ensure_ascii=False) 逐字节一致；
+只有发往上游的请求体（dumps_body）使用快速后端的紧凑编码。
+"""
+
+from __future__ import annotations
+
+import json
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - 可选依赖
+    msgspec = None
+
+
+class JsonCodec:
+    """标准库实现，同时是其他后端的回退。"""
+
+    name = "json"
+
+    def __init__(self) -> None:
+        self._encoder = json.JSONEncoder(ensure_ascii=False)
+        self._ascii_encoder = json.JSONEncoder()
+        self._body_encoder = json.JSONEncoder(
+            ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        )
+
+    def loads(self, data: str | bytes | bytearray):
+        return json.loads(data)
+
+    def dumps(self, obj, *, ensure_ascii: bool = False) -> str:
+        """与 json.dumps(obj, ensure_ascii=...) 输出完全一致，复用编码器实例。"""
+        encoder = self._ascii_encoder if ensure_ascii else self._encoder
+        return encoder.encode(obj)
+
+    def dumps_body(self, obj) -> bytes:
+        """上游请求体：紧凑的 UTF-8 JSON，只保证语义等价。"""
+        return self._body_encoder.encode(obj).encode()
+
+
+class MsgspecJsonCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._decoder = msgspec.json.Decoder()
+        self._body_encoder_fast = msgspec.json.Encoder()
+
+    def loads(self, data: str | bytes | bytearray):
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError:
+            return json.loads(data)
+
+    def dumps_body(self, obj) -> bytes:
+        try:
+            return self._body_encoder_fast.encode(obj)
+        except (TypeError, ValueError, OverflowError):
+            return super().dumps_body(obj)
+
+
+def available_json_codecs() -> list[JsonCodec]:
+    """按优先级返回当前环境可用的编解码器，标准库总在最后。"""
+    codecs: list[JsonCodec] = []
+    if msgspec is not None:
+        codecs.append(MsgspecJsonCodec())
+    codecs.append(JsonCodec())
+    return codecs
+
+
+json_codec = available_json_codecs()[0]
+loads = json_codec.loads
+dumps = json_codec.dumps
+dumps_body = json_codec.dumps_body
+
+
+__all__ = [
+    "JsonCodec",
+    "MsgspecJsonCodec",
+    "available_json_codecs",
+    "dumps",
+    "dumps_body",
+    "json_codec",
+    "loads",
+]
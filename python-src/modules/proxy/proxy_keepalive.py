@@ -0,0 +1,235 @@
+"""
+入站 HTTP/1.1 长连接
+werkzeug 的 WSGIRequestHandler 每个响应都发送 Connection: close，并在响应后读空套接字，
+IDE 的每个请求都要重新完成一次 TLS 握手。KeepAliveRequestHandler 自行写出响应：
+没有 Content-Length 的响应（SSE 流）使用分块编码，请求体按长度精确读取，
+连接在空闲超时内等待下一个请求。HTTP/1.0 请求仍在响应后关闭连接。
+
+run_wsgi 按 werkzeug 3.1 的实现改写，用到了 werkzeug.serving 的内部接口（pyproject.toml 中
+限定了版本范围）。这些接口不存在时 KEEPALIVE_SUPPORTED 为 False，服务端改用 werkzeug
+自带的处理器，每个响应后关闭连接。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import WSGIRequestHandler
+
+try:
+    from werkzeug.debug.tbtools import DebugTraceback
+    from werkzeug.serving import DechunkedInput, connection_dropped_errors
+except ImportError:  # pragma: no cover - werkzeug 内部接口变化
+    KEEPALIVE_SUPPORTED = False
+else:
+    KEEPALIVE_SUPPORTED = True
+
+# 应用未读完的请求体最多替它读掉这么多字节，超过则关闭连接
+MAX_DRAIN_BYTES = 64 * 1024 * 1024
+_DRAIN_CHUNK_SIZE = 1024 * 1024
+_DRAIN_TIMEOUT = 1.0
+
+
+class RequestBody(io.RawIOBase):
+    """按 Content-Length 读取请求体，不会越界读到同一连接上的下一个请求。"""
+
+    def __init__(self, rfile, length: int) -> None:
+        self._rfile = rfile
+        self._remaining = max(length, 0)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)
+        if len(view) > self._remaining:
+            view = view[: self._remaining]
+        count = self._rfile.readinto(view)
+        if not count:
+            self._remaining = 0
+            return 0
+        self._remaining -= count
+        return count
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """HTTP/1.1 长连接请求处理器，需配合 StoppableWSGIServer 的空闲连接登记使用。"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.requests_handled = 0
+
+    def handle(self) -> None:
+        try:
+            super().handle()
+        finally:
+            self.server.stats.record_connection(self.requests_handled)
+
+    def handle_one_request(self) -> None:
+        if not self._wait_for_request():
+            self.close_connection = True
+            return
+        super().handle_one_request()
+
+    def _wait_for_request(self) -> bool:
+        """等待下一个请求的首字节，空闲超时、对端关闭或连接被服务器回收时返回 False。"""
+        server = self.server
+        connection = self.connection
+        if self.requests_handled and server.draining:
+            return False
+        server.enter_idle(connection, reused=bool(self.requests_handled))
+        try:
+            connection.settimeout(server.keepalive_timeout)
+            ready = bool(self.rfile.peek(1))
+        except OSError:
+            ready = False
+        finally:
+            owned = server.leave_idle(connection)
+        if not (ready and owned):
+            return False
+        connection.settimeout(None)
+        return True
+
+    def _wrap_request_body(self, environ: dict):
+        stream = environ["wsgi.input"]
+        if isinstance(stream, DechunkedInput):
+            return stream
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            length = 0
+        body = RequestBody(self.rfile, length)
+        environ["wsgi.input"] = body
+        return body
+
+    def _drain_request_body(self, body) -> None:
+        """读掉应用没有读取的请求体，读不完时关闭连接，保证下一个请求从边界开始。"""
+        drained = 0
+        try:
+            self.connection.settimeout(_DRAIN_TIMEOUT)
+            while drained <= MAX_DRAIN_BYTES:
+                data = body.read(_DRAIN_CHUNK_SIZE)
+                if not data:
+                    self.connection.settimeout(None)
+                    return
+                drained += len(data)
+        except (OSError, ValueError):
+            pass
+        self.close_connection = True
+
+    def _send_response_headers(self, status: str, headers, environ: dict) -> bool:
+        """写出状态行与响应头，返回是否使用分块编码。"""
+        code_str, _, message = status.partition(" ")
+        code = int(code_str)
+        self.send_response(code, message)
+        header_keys = set()
+        for key, value in headers:
+            self.send_header(key, value)
+            header_keys.add(key.lower())
+
+        if self.request_version != "HTTP/1.1" or self.server.draining:
+            self.close_connection = True
+        # 与 werkzeug 一致：1xx、204、304 与 HEAD 响应不使用分块编码
+        bodyless = (
+            environ["REQUEST_METHOD"] == "HEAD"
+            or 100 <= code < 200  # noqa: PLR2004
+            or code in {204, 304}
+        )
+        # 需要关闭的连接以关闭作为响应体结束标志，不分块
+        chunked = not (bodyless or self.close_connection or "content-length" in header_keys)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        else:
+            self.send_header("Keep-Alive", f"timeout={self.server.keepalive_timeout}")
+        self.end_headers()
+        return chunked
+
+    def run_wsgi(self) -> None:  # noqa: PLR0915
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        self.requests_handled += 1
+        self.environ = environ = self.make_environ()
+        body = self._wrap_request_body(environ)
+        status_set: str | None = None
+        headers_set: list[tuple[str, str]] | None = None
+        headers_sent = False
+        chunked = False
+
+        def write(data: bytes) -> None:
+            nonlocal headers_sent, chunked
+            if status_set is None or headers_set is None:
+                raise AssertionError("write() before start_response")
+            if not headers_sent:
+                headers_sent = True
+                chunked = self._send_response_headers(status_set, headers_set, environ)
+            if data:
+                if chunked:
+                    # 块头、数据与块尾合并为一次写入
+                    self.wfile.write(b"%x\r\n%b\r\n" % (len(data), data))
+                else:
+                    self.wfile.write(data)
+            self.wfile.flush()
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal status_set, headers_set
+            if exc_info:
+                try:
+                    if headers_sent:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif headers_set:
+                raise AssertionError("Headers already set")
+            status_set = status
+            headers_set = headers
+            return write
+
+        def execute(app) -> None:
+            application_iter = app(environ, start_response)
+            try:
+                for data in application_iter:
+                    write(data)
+                if not headers_sent:
+                    write(b"")
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(application_iter, "close"):
+                    application_iter.close()
+
+        try:
+            execute(self.server.app)
+        except connection_dropped_errors as exc:
+            self.close_connection = True
+            self.connection_dropped(exc, environ)
+            return
+        except Exception as exc:
+            if self.server.passthrough_errors:
+                raise
+            self.close_connection = True
+            if not headers_sent:
+                status_set = None
+                headers_set = None
+                with contextlib.suppress(Exception):
+                    execute(InternalServerError())
+            msg = DebugTraceback(exc).render_traceback_text()
+            self.server.log("error", f"Error on request:\n{msg}")
+            return
+
+        if not self.close_connection:
+            self._drain_request_body(body)
+
+
+__all__ = ["KEEPALIVE_SUPPORTED", "MAX_DRAIN_BYTES", "KeepAliveRequestHandler", "RequestBody"]
@@ -0,0 +1,103 @@
+"""
+多地址监听
+hosts 文件把代理域名同时指向 127.0.0.1 与 ::1，客户端可能优先连接 IPv6 回环地址，
+因此运行时按配置逐个绑定多个地址，由同一个应用与工作线程池处理。
+IPv6 套接字设置 IPV6_V6ONLY，"::" 与 "0.0.0.0" 可同时绑定同一端口而不冲突。
+部分地址绑定失败（例如系统未启用 IPv6）时只记录结果，至少一个地址成功即可启动。
+多进程模式下各工作进程以 SO_REUSEPORT 绑定同一端口，由内核在进程间分配新连接。
+"""
+
+from __future__ import annotations
+
+import errno
+import socket
+from dataclasses import dataclass
+
+from modules.runtime.error_codes import ErrorCode
+from modules.runtime.operation_result import OperationResult
+
+
+def format_address(host: str, port: int) -> str:
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+@dataclass(frozen=True)
+class ListenResult:
+    """单个监听地址的绑定结果。"""
+
+    host: str
+    port: int
+    error: OSError | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def address(self) -> str:
+        return format_address(self.host, self.port)
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "address": self.address,
+            "ok": self.ok,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+def bind_listeners(
+    hosts: tuple[str, ...], port: int, *, backlog: int, reuse_port: bool = False
+) -> tuple[list[socket.socket], list[ListenResult]]:
+    """逐个绑定监听地址，返回成功的监听套接字与每个地址的结果。"""
+    sockets: list[socket.socket] = []
+    results: list[ListenResult] = []
+    for host in dict.fromkeys(hosts):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        try:
+            # create_server 在 IPv6 套接字上设置 IPV6_V6ONLY，在 POSIX 上设置 SO_REUSEADDR
+            sock = socket.create_server(
+                (host, port), family=family, backlog=backlog, reuse_port=reuse_port
+            )
+        except OSError as exc:
+            results.append(ListenResult(host, port, exc))
+            continue
+        sockets.append(sock)
+        results.append(ListenResult(host, port))
+    return sockets, results
+
+
+def _is_address_in_use(exc: OSError) -> bool:
+    return exc.errno == errno.EADDRINUSE or "address already in use" in str(exc).lower()
+
+
+def report_listen_results(results: list[ListenResult], log) -> OperationResult:
+    """记录每个地址的绑定结果；全部失败时按首个错误返回失败结果。"""
+    for result in results:
+        if result.ok:
+            log(f"监听 https://{result.address} 成功")
+        else:
+            log(f"监听 https://{result.address} 失败: {result.error}")
+
+    details = [result.to_dict() for result in results]
+    if any(result.ok for result in results):
+        return OperationResult.success(listeners=details)
+
+    error = results[0].error if results else None
+    port = results[0].port if results else 0
+    if isinstance(error, PermissionError):
+        log(f"权限不足，无法监听 {port} 端口。请以管理员身份运行。")
+        return OperationResult.failure(
+            "权限不足", code=ErrorCode.PERMISSION_DENIED, listeners=details
+        )
+    if error is not None and _is_address_in_use(error):
+        log(f"端口 {port} 已被占用。请检查是否有其他服务占用了该端口。")
+        return OperationResult.failure(
+            "端口已被占用", code=ErrorCode.PORT_IN_USE, listeners=details
+        )
+    log(f"启动服务器时发生 OS 错误: {error}")
+    return OperationResult.failure(
+        "启动服务器时发生 OS 错误", code=ErrorCode.UNKNOWN, listeners=details
+    )
+
+
+__all__ = ["ListenResult", "bind_listeners", "format_address", "report_listen_results"]
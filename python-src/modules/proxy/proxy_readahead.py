@@ -0,0 +1,177 @@
+"""
+上游读取阶段
+默认由同一个生成器读取上游并写出下游：客户端读得慢时上游读取随之停顿，可能触发上游的空闲超时；
+上游慢时下游写出路径同样被占住。读取阶段把上游事件交给独立的线程（同步引擎）或任务（异步引擎）
+读入每条流独立的有界缓冲区，缓冲区满时读取暂停，由 TCP 窗口向上游施加背压。
+
+消费端可以给出等待时限（例如合并写入窗口），时限到期仍没有新事件时产出 None。
+异步引擎不启用缓冲区时保留挂起的读取任务限时等待，同样可以产出 None。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import queue
+import threading
+from collections.abc import AsyncIterator, Callable, Iterator
+
+# 只为等待时限启用读取阶段时（例如合并写入），缓冲区默认可容纳的事件数
+READ_AHEAD_EVENTS = 64
+
+_END = object()
+_PUT_INTERVAL = 0.1
+
+
+class _ReaderDone:
+    """读取端结束标记，error 为读取时抛出的异常。"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException | None = None) -> None:
+        self.error = error
+
+
+def _no_deadline() -> None:
+    return None
+
+
+def iter_with_deadline[T](
+    events: Iterator[T],
+    timeout: Callable[[], float | None] = _no_deadline,
+    *,
+    size: int = READ_AHEAD_EVENTS,
+    on_depth: Callable[[int], None] | None = None,
+) -> Iterator[T | None]:
+    """在独立线程中把 events 读入最多 size 个事件的缓冲区；timeout() 到期时仍没有新事件则产出 None。
+
+    on_depth 在每次入队与出队后收到缓冲区当前的事件数。读取线程抛出的异常在消费端原样抛出。
+    消费端提前结束时读取线程在下一次投递时退出；阻塞在上游读取上的线程由调用方关闭上游响应来唤醒。
+    """
+    buffer: queue.Queue = queue.Queue(max(size, 1))
+    closed = threading.Event()
+
+    def report() -> None:
+        if on_depth is not None:
+            on_depth(buffer.qsize())
+
+    def put(item) -> bool:
+        while not closed.is_set():
+            try:
+                buffer.put(item, timeout=_PUT_INTERVAL)
+            except queue.Full:
+                continue
+            report()
+            return True
+        return False
+
+    def read() -> None:
+        try:
+            for event in events:
+                if not put(event):
+                    return
+        except BaseException as exc:  # noqa: BLE001 - 交给消费端处理
+            put(_ReaderDone(exc))
+            return
+        put(_ReaderDone())
+
+    reader = threading.Thread(target=read, name="mtga-sse-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            try:
+                item = buffer.get(timeout=timeout())
+            except queue.Empty:
+                yield None
+                continue
+            report()
+            if isinstance(item, _ReaderDone):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        closed.set()
+
+
+async def _aiter_pending[T](
+    events: AsyncIterator[T], timeout: Callable[[], float | None]
+) -> AsyncIterator[T | None]:
+    """不预读：读取任务在等待超时后保持挂起，下一轮继续等待同一个任务。"""
+    pending: asyncio.Task | None = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(events, _END))
+            done, _ = await asyncio.wait({pending}, timeout=timeout())
+            if not done:
+                yield None
+                continue
+            item, pending = pending.result(), None
+            if item is _END:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await pending
+
+
+async def _aiter_buffered[T](
+    events: AsyncIterator[T],
+    timeout: Callable[[], float | None],
+    size: int,
+    on_depth: Callable[[int], None] | None,
+) -> AsyncIterator[T | None]:
+    buffer: asyncio.Queue = asyncio.Queue(size)
+
+    def report() -> None:
+        if on_depth is not None:
+            on_depth(buffer.qsize())
+
+    async def read() -> None:
+        try:
+            async for event in events:
+                await buffer.put(event)
+                report()
+        except Exception as exc:  # noqa: BLE001 - 交给消费端处理
+            await buffer.put(_ReaderDone(exc))
+            return
+        await buffer.put(_ReaderDone())
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(buffer.get(), timeout())
+            except TimeoutError:
+                yield None
+                continue
+            report()
+            if isinstance(item, _ReaderDone):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        # 先结束读取任务，调用方随后才能安全地关闭 events
+        reader.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await reader
+
+
+def aiter_with_deadline[T](
+    events: AsyncIterator[T],
+    timeout: Callable[[], float | None] = _no_deadline,
+    *,
+    size: int = 0,
+    on_depth: Callable[[int], None] | None = None,
+) -> AsyncIterator[T | None]:
+    """异步版本：size 大于 0 时由独立任务预读到有界缓冲区，否则只在等待时限上包装 events。"""
+    if size > 0:
+        return _aiter_buffered(events, timeout, size, on_depth)
+    return _aiter_pending(events, timeout)
+
+
+__all__ = ["READ_AHEAD_EVENTS", "aiter_with_deadline", "iter_with_deadline"]
@@ -1,38 +1,439 @@
 from __future__ import annotations
 
+import collections
+import contextlib
 import os
+import queue
+import selectors
+import socket
 import ssl
 import threading
+import time
 from dataclasses import dataclass
 
-from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
-
+from werkzeug.serving import LISTEN_QUEUE, BaseWSGIServer, WSGIRequestHandler
+
+from modules.proxy.proxy_admission import (
+    REJECT_QUEUE_FULL,
+    REJECT_QUEUE_TIMEOUT,
+    bind_queue_wait,
+    rejection_payload,
+)
+from modules.proxy.proxy_config import (
+    SERVER_MODE_THREADED,
+    AdmissionConfig,
+    ServerConfig,
+    SocketTuningConfig,
+)
+from modules.proxy.proxy_json import dumps
+from modules.proxy.proxy_keepalive import KEEPALIVE_SUPPORTED, KeepAliveRequestHandler
+from modules.proxy.proxy_listen import bind_listeners, format_address, report_listen_results
+from modules.proxy.proxy_sockopt import SocketOption, apply_socket_options, build_socket_options
+from modules.proxy.proxy_stats import ProxyStats
+from modules.proxy.proxy_tls import get_server_ssl_context, tls_session_stats
 from modules.runtime.error_codes import ErrorCode
 from modules.runtime.operation_result import OperationResult
 from modules.runtime.resource_manager import ResourceManager
 from modules.runtime.thread_manager import ThreadManager
 
+# 中止剩余的流之后，等待它们关闭上游响应的时间（秒）
+ABORT_TIMEOUT = 2.0
+# 线程池拒绝连接时：握手与读取请求每一步的时限（秒），请求头行数与请求体读取上限
+REJECT_TIMEOUT = 2.0
+_REJECT_MAX_HEADER_LINES = 100
+_REJECT_MAX_BODY = 1024 * 1024
+_REJECT_REASONS = {
+    REJECT_QUEUE_FULL: "Too Many Requests",
+    REJECT_QUEUE_TIMEOUT: "Service Unavailable",
+}
+# 只用于唤醒准入线程重新计算排队超时
+_WAKE = ()
+
+
+def _rejection_response(status: int, retry_after: int) -> bytes:
+    body = dumps(rejection_payload(status)).encode()
+    return (
+        f"HTTP/1.1 {status} {_REJECT_REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Retry-After: {retry_after}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + body
+
 
 class StoppableWSGIServer(BaseWSGIServer):
-    """可停止的 WSGI 服务器"""
+    """可停止的 WSGI 服务器
+
+    同时登记等待下一个请求的长连接（KeepAliveRequestHandler），停止时主动关闭它们。
+    add_listener 添加的监听套接字与主套接字在同一个接收循环中 accept。
+    接收循环无超时地阻塞在 selector 上，停止时通过 socketpair 写入一个字节立即唤醒。
+    accept 得到的连接在交给处理线程之前设置 socket_options。
+    """
 
-    def __init__(self, *args, **kwargs):
+    keepalive_timeout = 0
+    draining = False
+
+    def __init__(
+        self,
+        *args,
+        stats: ProxyStats | None = None,
+        socket_options: list[SocketOption] | None = None,
+        **kwargs,
+    ):
         self._stop_event = threading.Event()
+        self.stats = stats or ProxyStats()
+        self.socket_options = socket_options or []
+        self._idle_lock = threading.Lock()
+        self._idle_connections: dict[socket.socket, bool] = {}
+        self._extra_listeners: list[socket.socket] = []
+        self._wakeup_lock = threading.Lock()
+        self._wakeup: tuple[socket.socket, socket.socket] | None = None
         super().__init__(*args, **kwargs)
+        # 传入 fd 时 werkzeug 会先调用 server_close 关闭 socketserver 自建的套接字
+        self._stop_event.clear()
+        self._wakeup = socket.socketpair()
+
+    def add_listener(self, sock: socket.socket) -> None:
+        """添加已绑定并开始监听的套接字，TLS 设置与主套接字一致。"""
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(
+                sock,
+                server_side=True,
+                do_handshake_on_connect=self.socket.do_handshake_on_connect,  # type: ignore[attr-defined]
+            )
+        self._extra_listeners.append(sock)
+
+    def stop_accepting(self) -> None:
+        """进入排空阶段：关闭监听套接字与空闲长连接，已接收的请求继续处理。"""
+        self.draining = True
+        self._close_listeners()
 
     def server_close(self):
+        self._close_listeners()
+
+    def _close_listeners(self) -> None:
         stop_event = getattr(self, "_stop_event", None)
         if stop_event:
             stop_event.set()
+        self._wake()
         super().server_close()
+        for listener in getattr(self, "_extra_listeners", ()):
+            with contextlib.suppress(OSError):
+                listener.close()
+        self.close_idle_connections()
+
+    def enter_idle(self, connection: socket.socket, *, reused: bool = True) -> None:
+        """登记等待下一个请求的连接；reused 为 False 表示连接还在等待第一个请求。"""
+        with self._idle_lock:
+            self._idle_connections[connection] = reused
+
+    def leave_idle(self, connection: socket.socket) -> bool:
+        """结束空闲等待；连接已被服务器回收时返回 False。"""
+        with self._idle_lock:
+            return self._idle_connections.pop(connection, None) is not None
+
+    def close_idle_connections(self, limit: int | None = None, *, reused_only: bool = False) -> int:
+        """按空闲时间从长到短关闭空闲长连接，返回关闭数量。
+
+        reused_only 时跳过还在等待第一个请求的新连接：它们的请求随时会到达，
+        此时关闭，客户端只会看到连接被重置。
+        """
+        with self._idle_lock:
+            victims = [
+                connection
+                for connection, reused in self._idle_connections.items()
+                if reused or not reused_only
+            ][:limit]
+            for connection in victims:
+                del self._idle_connections[connection]
+        for connection in victims:
+            with contextlib.suppress(OSError):
+                connection.shutdown(socket.SHUT_RDWR)
+        return len(victims)
+
+    def _wake(self) -> None:
+        with self._wakeup_lock:
+            if self._wakeup is not None:
+                with contextlib.suppress(OSError):
+                    self._wakeup[1].send(b"\0")
+
+    def serve_forever(self, poll_interval=None):
+        """poll_interval 为 None 时空闲期间不做任何周期性唤醒。"""
+        with self._wakeup_lock:
+            wakeup = self._wakeup
+        if wakeup is None:
+            return
+        wakeup_reader = wakeup[0]
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(wakeup_reader, selectors.EVENT_READ)
+                for listener in (self.socket, *self._extra_listeners):
+                    selector.register(listener, selectors.EVENT_READ)
+                while not self._stop_event.is_set():
+                    try:
+                        ready = selector.select(poll_interval)
+                    except (OSError, ValueError):
+                        break
+                    for key, _ in ready:
+                        if key.fileobj is wakeup_reader:
+                            with contextlib.suppress(OSError):
+                                wakeup_reader.recv(64)
+                            continue
+                        if self._stop_event.is_set():
+                            break
+                        self._accept(key.fileobj)
+        finally:
+            with self._wakeup_lock:
+                self._wakeup = None
+            for sock in wakeup:
+                sock.close()
+
+    def _accept(self, listener) -> None:
+        """与 socketserver 的 _handle_request_noblock 相同，只是从指定的监听套接字接收。"""
+        try:
+            request, client_address = listener.accept()
+        except OSError:
+            return
+        if apply_socket_options(request, self.socket_options):
+            self.stats.incr("socket_option_errors")
+        if not self.verify_request(request, client_address):
+            self.shutdown_request(request)
+            return
+        try:
+            self.process_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+        except BaseException:
+            self.shutdown_request(request)
+            raise
+
+    def pool_snapshot(self) -> dict[str, int]:
+        return {"workers": 1, "busy_workers": 0, "queue_depth": 0, "queue_size": 0}
+
+
+class PooledWSGIServer(StoppableWSGIServer):
+    """带有界工作线程池的 WSGI 服务器：接收线程只负责 accept 与入队。
+
+    TLS 握手推迟到工作线程执行，避免慢客户端阻塞接收循环。
+    线程池同时承担准入控制：线程数即并发上限，没有空闲线程时连接在队列中等待，不占用线程。
+    队列已满返回 429，排队超过 queue_timeout 返回 503，两者都带 Retry-After，
+    由单独的准入线程完成握手、读完请求后写出；该线程积压超过监听队列长度时才直接关闭连接。
+    启用长连接时，空闲连接同样占用工作线程；没有空闲工作线程时回收最久未用的空闲连接。
+    """
+
+    multithread = True
+    handshake_timeout = 10.0
+
+    def __init__(  # noqa: PLR0913
+        self,
+        host: str,
+        port: int,
+        app,
+        *,
+        max_workers: int,
+        queue_size: int,
+        stats: ProxyStats,
+        keepalive_timeout: int = 0,
+        admission: AdmissionConfig | None = None,
+        **kwargs,
+    ):
+        self._max_workers = max(1, max_workers)
+        self._queue_size = max(1, queue_size)
+        # (连接, 客户端地址, 入队时间, 入队时是否没有空闲线程)
+        self._pending: collections.deque[tuple[socket.socket, tuple, float, bool]] = (
+            collections.deque()
+        )
+        self._pending_ready = threading.Condition()
+        self._closing = False
+        self._busy_workers = 0
+        self._rejects: queue.SimpleQueue[tuple | None] = queue.SimpleQueue()
+        self._admission_thread: threading.Thread | None = None
+        self.set_admission(admission or AdmissionConfig())
+        self.keepalive_timeout = keepalive_timeout
+        self._workers: list[threading.Thread] = []
+        super().__init__(host, port, app, stats=stats, **kwargs)
+        # 传入 fd 时 werkzeug 会在初始化期间调用 server_close
+        self._closing = False
+        if self.ssl_context is not None:
+            self.socket.do_handshake_on_connect = False  # type: ignore[attr-defined]
+        for index in range(self._max_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"mtga-proxy-worker-{index + 1}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._admission_thread = threading.Thread(
+            target=self._admission_loop, name="mtga-proxy-admission", daemon=True
+        )
+        self._admission_thread.start()
+
+    def set_admission(self, admission: AdmissionConfig) -> None:
+        """排队超时与拒绝响应中的 Retry-After，热重载时随准入配置更新。"""
+        self._queue_timeout = admission.queue_timeout
+        self._rejection_responses = {
+            status: _rejection_response(status, admission.retry_after)
+            for status in (REJECT_QUEUE_FULL, REJECT_QUEUE_TIMEOUT)
+        }
+        self._rejects.put(_WAKE)
+
+    def process_request(self, request, client_address):
+        with self._pending_ready:
+            waiting = len(self._pending)
+            full = waiting >= self._queue_size
+            queued = self._busy_workers + waiting >= self._max_workers
+            if not full:
+                self._pending.append((request, client_address, time.monotonic(), queued))
+                self._pending_ready.notify()
+        if full:
+            self.stats.incr("admission_rejected_full")
+            self._reject(request, REJECT_QUEUE_FULL)
+            return
+        self.stats.incr("connections_accepted")
+        if not queued:
+            return
+        # 唤醒准入线程按新的队首计算排队超时
+        self._rejects.put(_WAKE)
+        if self.close_idle_connections(limit=1, reused_only=True):
+            self.stats.incr("keepalive_reclaimed")
 
-    def serve_forever(self, poll_interval=0.5):
-        self.timeout = poll_interval
-        while not self._stop_event.is_set():
+    def server_close(self):
+        super().server_close()
+        with self._pending_ready:
+            self._closing = True
+            pending = list(self._pending)
+            self._pending.clear()
+            self._pending_ready.notify_all()
+        for item in pending:
+            self.shutdown_request(item[0])
+        while True:
             try:
-                self.handle_request()
-            except OSError:
+                item = self._rejects.get_nowait()
+            except queue.Empty:
                 break
+            if item:
+                self.shutdown_request(item[0])
+        if self._admission_thread is not None:
+            self._rejects.put(None)
+
+    def pool_snapshot(self) -> dict[str, int]:
+        with self._pending_ready:
+            busy_workers = self._busy_workers
+            queue_depth = len(self._pending)
+        return {
+            "workers": self._max_workers,
+            "busy_workers": busy_workers,
+            "queue_depth": queue_depth,
+            "queue_size": self._queue_size,
+            "reject_backlog": self._rejects.qsize(),
+        }
+
+    def _handshake(self, request) -> bool:
+        if not isinstance(request, ssl.SSLSocket):
+            return True
+        try:
+            request.settimeout(self.handshake_timeout)
+            request.do_handshake()
+            request.settimeout(None)
+        except (OSError, ValueError):
+            self.stats.incr("handshake_failures")
+            return False
+        return True
+
+    def _reject(self, request, status: int) -> None:
+        if self._rejects.qsize() >= LISTEN_QUEUE:
+            self.stats.incr("connections_dropped")
+            self.shutdown_request(request)
+            return
+        self.stats.incr("connections_rejected")
+        self._rejects.put((request, status))
+
+    def _expire_queued(self) -> float | None:
+        """拒绝排队超时的连接，返回距下一个连接超时的秒数；没有排队的连接时返回 None。"""
+        timeout = self._queue_timeout
+        if timeout <= 0:
+            return None
+        expired = []
+        with self._pending_ready:
+            now = time.monotonic()
+            while self._pending and now - self._pending[0][2] >= timeout:
+                expired.append(self._pending.popleft())
+            next_expiry = timeout - (now - self._pending[0][2]) if self._pending else None
+        for request, _client_address, enqueued, _queued in expired:
+            self.stats.record_admission_wait(now - enqueued, admitted=False)
+            self._reject(request, REJECT_QUEUE_TIMEOUT)
+        return next_expiry
+
+    def _admission_loop(self) -> None:
+        while True:
+            try:
+                item = self._rejects.get(timeout=self._expire_queued())
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            if not item:
+                continue
+            request, status = item
+            try:
+                self._send_rejection(request, status)
+            except (OSError, ValueError):
+                pass
+            finally:
+                self.shutdown_request(request)
+
+    def _send_rejection(self, request, status: int) -> None:
+        """完成握手并读掉请求（请求体最多 _REJECT_MAX_BODY 字节）后写出拒绝响应。
+
+        未读的请求数据留在接收缓冲区时关闭连接会发送 RST，客户端可能收不到响应。
+        """
+        request.settimeout(REJECT_TIMEOUT)
+        if isinstance(request, ssl.SSLSocket):
+            request.do_handshake()
+        length = 0
+        with request.makefile("rb") as rfile:
+            for _ in range(_REJECT_MAX_HEADER_LINES):
+                line = rfile.readline(64 * 1024)
+                if line in {b"", b"\r\n", b"\n"}:
+                    break
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            if length > 0:
+                rfile.read(min(length, _REJECT_MAX_BODY))
+        request.sendall(self._rejection_responses[status])
+
+    def _next_connection(self) -> tuple[socket.socket, tuple, float, bool] | None:
+        with self._pending_ready:
+            while not self._pending:
+                if self._closing:
+                    return None
+                self._pending_ready.wait()
+            self._busy_workers += 1
+            return self._pending.popleft()
+
+    def _worker_loop(self) -> None:
+        while True:
+            item = self._next_connection()
+            if item is None:
+                return
+            request, client_address, enqueued, queued = item
+            wait = time.monotonic() - enqueued if queued else 0.0
+            if queued:
+                self.stats.record_admission_wait(wait, admitted=True)
+            try:
+                if self._handshake(request):
+                    with bind_queue_wait(wait):
+                        self.finish_request(request, client_address)
+            except Exception:
+                with contextlib.suppress(Exception):
+                    self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._pending_ready:
+                    self._busy_workers -= 1
 
 
 @dataclass
@@ -40,38 +441,146 @@ class RuntimeState:
     server: StoppableWSGIServer | None = None
     server_thread: threading.Thread | None = None
     server_task_id: str | None = None
+    ssl_context: ssl.SSLContext | None = None
+    listeners: list[dict[str, object]] | None = None
+    drain_timeout: int = 0
     running: bool = False
 
 
 class ProxyRuntime:
     """代理运行时：负责证书/监听/线程生命周期。"""
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         app,
         log_func,
         *,
         resource_manager: ResourceManager,
         thread_manager: ThreadManager,
+        stats: ProxyStats | None = None,
+        admission: AdmissionConfig | None = None,
     ) -> None:
         self._app = app
+        self._admission = admission or AdmissionConfig()
         self._log = log_func
         self._resource_manager = resource_manager
         self._thread_manager = thread_manager
+        self._stats = stats or ProxyStats()
         self._state = RuntimeState()
 
     def is_running(self) -> bool:
         return self._state.running
 
+    def swap_app(self, app, *, admission: AdmissionConfig | None = None) -> None:
+        """热重载：之后的请求（包括已有长连接上的下一个请求）交给新的 WSGI 应用。
+
+        排队超时与 Retry-After 随之更新；线程数与队列长度需要重启服务才会生效。
+        """
+        self._app = app
+        if admission is not None:
+            self._admission = admission
+        server = self._state.server
+        if server is not None:
+            server.app = app
+            if isinstance(server, PooledWSGIServer):
+                server.set_admission(self._admission)
+
+    def get_stats(self) -> dict[str, object]:
+        server = self._state.server
+        pool = server.pool_snapshot() if server else {}
+        return {
+            "running": self._state.running,
+            **pool,
+            "listeners": self._state.listeners or [],
+            **tls_session_stats(self._state.ssl_context),
+            **self._stats.snapshot(),
+        }
+
+    def _create_server(
+        self,
+        sockets: list[socket.socket],
+        ssl_context,
+        server_config: ServerConfig,
+        socket_config: SocketTuningConfig,
+    ):
+        """以第一个监听套接字创建服务器，其余套接字作为附加监听加入同一个接收循环。"""
+        primary, *extra = sockets
+        host, port = primary.getsockname()[:2]
+        server = self._create_wsgi_server(
+            host,
+            port,
+            primary.fileno(),
+            ssl_context,
+            server_config,
+            socket_options=build_socket_options(socket_config),
+        )
+        # werkzeug 通过 fd 复制了主套接字，原对象可以关闭
+        primary.close()
+        for sock in extra:
+            server.add_listener(sock)
+        return server
+
+    def _create_wsgi_server(  # noqa: PLR0913
+        self,
+        host: str,
+        port: int,
+        fd: int,
+        ssl_context,
+        server_config: ServerConfig,
+        *,
+        socket_options: list[SocketOption],
+    ):
+        if server_config.mode == SERVER_MODE_THREADED:
+            self._log(
+                f"并发模式: 工作线程 {server_config.workers}，"
+                f"等待队列上限 {server_config.queue_size}，"
+                f"排队超时 {self._admission.queue_timeout:g} 秒"
+            )
+            keepalive = server_config.keepalive_timeout > 0
+            if keepalive and not KEEPALIVE_SUPPORTED:
+                self._log("当前 werkzeug 版本不支持入站长连接，改为每个响应后关闭连接")
+                keepalive = False
+            if keepalive:
+                self._log(f"入站长连接: 空闲 {server_config.keepalive_timeout} 秒后关闭")
+            return PooledWSGIServer(
+                host,
+                port,
+                self._app,
+                max_workers=server_config.workers,
+                queue_size=server_config.queue_size,
+                stats=self._stats,
+                keepalive_timeout=server_config.keepalive_timeout,
+                admission=self._admission,
+                handler=KeepAliveRequestHandler if keepalive else WSGIRequestHandler,
+                ssl_context=ssl_context,
+                fd=fd,
+                socket_options=socket_options,
+            )
+        # 单线程模式下空闲的长连接会阻塞其他客户端，保持每个响应后关闭连接
+        self._log("并发模式: 单线程")
+        return StoppableWSGIServer(
+            host,
+            port,
+            self._app,
+            stats=self._stats,
+            handler=WSGIRequestHandler,
+            ssl_context=ssl_context,
+            fd=fd,
+            socket_options=socket_options,
+        )
+
     def start(  # noqa: PLR0911, PLR0912, PLR0913, PLR0915
         self,
         *,
-        host: str,
+        hosts: tuple[str, ...],
         port: int,
         target_api_base_url: str,
         custom_model_id: str,
         target_model_id: str,
         stream_mode: str | None,
+        server_config: ServerConfig | None = None,
+        socket_config: SocketTuningConfig | None = None,
+        reuse_port: bool = False,
     ) -> OperationResult:
         if self._state.running:
             self._log("代理服务器已在运行")
@@ -93,26 +602,37 @@ class ProxyRuntime:
             return OperationResult.failure("证书文件不存在", code=ErrorCode.FILE_NOT_FOUND)
 
         try:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            ssl_context.load_cert_chain(cert_file, key_file)
+            ssl_context, reused = get_server_ssl_context(cert_file, key_file)
+            self._state.ssl_context = ssl_context
+            if reused:
+                self._log("复用进程内的 TLS 上下文，客户端可恢复重启前的会话")
 
-            self._log(f"启动代理服务器，监听 https://{host}:{port}")
+            addresses = ", ".join(f"https://{format_address(host, port)}" for host in hosts)
+            self._log(f"启动代理服务器，监听 {addresses}")
             self._log(f"目标 API 地址: {target_api_base_url}")
             self._log(f"自定义模型 ID: {custom_model_id}")
             self._log(f"实际模型 ID: {target_model_id}")
             if stream_mode:
                 self._log(f"强制流模式: {stream_mode}")
 
+            sockets, listen_results = bind_listeners(
+                hosts, port, backlog=LISTEN_QUEUE, reuse_port=reuse_port
+            )
+            listen_result = report_listen_results(listen_results, self._log)
+            if not listen_result.ok:
+                return listen_result
+            self._state.listeners = listen_result.details["listeners"]
+            server_config = server_config or ServerConfig()
+            self._state.drain_timeout = server_config.drain_timeout
+
             try:
-                self._state.server = StoppableWSGIServer(
-                    host,
-                    port,
-                    self._app,
-                    ssl_context=ssl_context,
+                self._state.server = self._create_server(
+                    sockets, ssl_context, server_config, socket_config or SocketTuningConfig()
                 )
-                self._state.server.RequestHandlerClass = WSGIRequestHandler
                 self._log("服务器实例创建成功")
             except Exception as exc:
+                for sock in sockets:
+                    sock.close()
                 self._log(f"创建服务器实例失败: {exc}")
                 return OperationResult.failure("创建服务器实例失败", code=ErrorCode.UNKNOWN)
 
@@ -151,7 +671,7 @@ class ProxyRuntime:
 
             if self._state.running:
                 self._log("代理服务器已成功启动")
-                return OperationResult.success()
+                return listen_result
 
             self._log("代理服务器启动失败")
             return OperationResult.failure("代理服务器启动失败", code=ErrorCode.UNKNOWN)
@@ -178,8 +698,11 @@ class ProxyRuntime:
         self._state.running = False
 
         stop_requested = False
+        drain_report: dict[str, int] = {}
         if self._state.server:
             try:
+                self._state.server.stop_accepting()
+                drain_report = self._drain_streams()
                 self._state.server.server_close()
                 stop_requested = True
                 self._log("服务器停止指令已发送")
@@ -205,13 +728,32 @@ class ProxyRuntime:
 
         self._state.server = None
         self._state.server_thread = None
+        self._state.listeners = None
 
         if clean_stop or not stop_requested:
             self._log("代理服务器已完全停止")
-            return OperationResult.success()
+            return OperationResult.success(**drain_report)
 
         self._log("代理服务器仍在后台清理，请稍后关注日志")
-        return OperationResult.failure("代理服务器未完全停止", code=ErrorCode.UNKNOWN)
+        return OperationResult.failure(
+            "代理服务器未完全停止", code=ErrorCode.UNKNOWN, **drain_report
+        )
+
+    def _drain_streams(self) -> dict[str, int]:
+        """等待进行中的流式响应结束，超过排空时限后中止剩余的流并关闭其上游响应。"""
+        timeout = self._state.drain_timeout
+        active = self._stats.active_streams()
+        closed_before = self._stats.closed_streams()
+        if active:
+            self._log(f"停止接收新连接，等待 {active} 个流式响应结束（最多 {timeout} 秒）")
+        self._stats.wait_streams(timeout)
+        drained = self._stats.closed_streams() - closed_before
+        aborted = self._stats.abort_streams()
+        if aborted:
+            self._stats.wait_streams(ABORT_TIMEOUT)
+        if drained or aborted:
+            self._log(f"流式响应排空完成: {drained} 个正常结束，{aborted} 个被中止")
+        return self._stats.record_drain(drained, aborted)
 
 
 __all__ = ["ProxyRuntime"]
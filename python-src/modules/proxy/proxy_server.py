@@ -1,12 +1,29 @@
 """
 代理服务器模块
 将代理逻辑拆分为领域逻辑（ProxyApp）与运行时（ProxyRuntime）。
+配置组中的 proxy_engine 可选 wsgi（Flask + requests）或 asgi（ASGI + httpx）。
+server_processes 大于 1 时改由工作进程池运行，本进程只负责监督。
 """
 
 from __future__ import annotations
 
 from modules.proxy.proxy_app import ProxyApp
+from modules.proxy.proxy_async_app import AsyncProxyApp
+from modules.proxy.proxy_async_runtime import AsyncProxyRuntime, missing_async_dependencies
+from modules.proxy.proxy_config import (
+    PROXY_ENGINE_ASGI,
+    PROXY_ENGINE_WSGI,
+    AdmissionConfig,
+    ServerConfig,
+    build_proxy_config,
+    resolve_proxy_engine,
+)
 from modules.proxy.proxy_runtime import ProxyRuntime
+from modules.proxy.proxy_sockopt import describe_socket_tuning
+from modules.proxy.proxy_stats import ProxyStats
+from modules.proxy.proxy_workers import ProxyWorkerPool, reuse_port_supported
+from modules.runtime.error_codes import ErrorCode
+from modules.runtime.operation_result import OperationResult
 from modules.runtime.resource_manager import ResourceManager
 from modules.runtime.thread_manager import ThreadManager
 
@@ -14,45 +31,202 @@ from modules.runtime.thread_manager import ThreadManager
 class ProxyServer:
     """代理服务器类，负责装配领域逻辑与运行时。"""
 
-    def __init__(self, config=None, log_func=print, *, thread_manager: ThreadManager):
+    def __init__(
+        self,
+        config=None,
+        log_func=print,
+        *,
+        thread_manager: ThreadManager,
+        worker_index: int | None = None,
+    ):
+        """worker_index 非空表示运行在多进程模式的工作进程中。"""
         self.config = config or {}
         self.log_func = log_func
         self.resource_manager = ResourceManager()
         self.thread_manager = thread_manager
+        self.worker_index = worker_index
+        self.workers: ProxyWorkerPool | None = None
+        self.stats = ProxyStats()
+        self.engine = self._resolve_engine()
 
-        self.app_layer = ProxyApp(
-            self.config,
-            self.log_func,
-            resource_manager=self.resource_manager,
-        )
-        self.runtime = ProxyRuntime(
-            self.app_layer.app,
+        self.app_layer: ProxyApp = self._create_app_layer(self.config)
+        self.runtime: ProxyRuntime | AsyncProxyRuntime
+        if self.engine == PROXY_ENGINE_ASGI:
+            self.runtime = AsyncProxyRuntime(
+                self.app_layer,
+                self.log_func,
+                resource_manager=self.resource_manager,
+                thread_manager=self.thread_manager,
+                stats=self.stats,
+            )
+        else:
+            self.runtime = ProxyRuntime(
+                self.app_layer.app,
+                self.log_func,
+                resource_manager=self.resource_manager,
+                thread_manager=self.thread_manager,
+                stats=self.stats,
+                admission=self._admission_config(),
+            )
+
+    def _admission_config(self) -> AdmissionConfig:
+        proxy_config = self.app_layer.proxy_config
+        return proxy_config.admission if proxy_config else AdmissionConfig()
+
+    def _create_app_layer(self, config, **kwargs) -> ProxyApp:
+        app_cls = AsyncProxyApp if self.engine == PROXY_ENGINE_ASGI else ProxyApp
+        return app_cls(
+            config,
             self.log_func,
             resource_manager=self.resource_manager,
-            thread_manager=self.thread_manager,
+            stats=self.stats,
+            **kwargs,
         )
 
-    def start(self, host="0.0.0.0", port=443) -> bool:
+    def _resolve_engine(self) -> str:
+        engine = resolve_proxy_engine(self.config)
+        if engine == PROXY_ENGINE_ASGI:
+            missing = missing_async_dependencies()
+            if missing:
+                self.log_func(f"异步引擎依赖缺失 ({', '.join(missing)})，改用 WSGI 引擎")
+                return PROXY_ENGINE_WSGI
+            self.log_func("使用异步代理引擎 (ASGI)")
+        return engine
+
+    def start(self, host: str | None = None, port=443) -> bool:
+        """host 为空时监听配置中的全部地址（默认 0.0.0.0 与 ::）。"""
         if not self.app_layer.valid:
             return False
+        server_config = self._server_config()
+        hosts = (host,) if host else server_config.listen_hosts
+        if server_config.processes > 1 and self.worker_index is None:
+            if reuse_port_supported():
+                return self._start_workers(hosts, port, server_config).ok
+            self.log_func("当前平台不支持 SO_REUSEPORT，多进程模式改为单进程运行")
+        return self.start_result(hosts=hosts, port=port).ok
 
+    def start_result(self, *, hosts: tuple[str, ...], port: int) -> OperationResult:
+        """在本进程内启动运行时。"""
+        if not self.app_layer.valid:
+            return OperationResult.failure("配置无效", code=ErrorCode.CONFIG_INVALID)
+        socket_config = self.app_layer.proxy_config.socket
+        if self.app_layer.debug_mode:
+            self.log_func(f"套接字参数（入站与上游）: {describe_socket_tuning(socket_config)}")
         result = self.runtime.start(
-            host=host,
+            hosts=hosts,
             port=port,
             target_api_base_url=self.app_layer.target_api_base_url,
             custom_model_id=self.app_layer.custom_model_id,
             target_model_id=self.app_layer.target_model_id,
             stream_mode=self.app_layer.stream_mode,
+            server_config=self._server_config(),
+            socket_config=socket_config,
+            reuse_port=self.worker_index is not None,
+        )
+        if result.ok:
+            self.app_layer.start_upstream_warmup(self.thread_manager)
+        return result
+
+    def _server_config(self) -> ServerConfig:
+        proxy_config = self.app_layer.proxy_config
+        return proxy_config.server if proxy_config else ServerConfig()
+
+    def _start_workers(
+        self, hosts: tuple[str, ...], port: int, server_config: ServerConfig
+    ) -> OperationResult:
+        workers = ProxyWorkerPool(
+            self.config,
+            self.log_func,
+            processes=server_config.processes,
+            drain_timeout=server_config.drain_timeout,
+            thread_manager=self.thread_manager,
+        )
+        result = workers.start(hosts=hosts, port=port)
+        if result.ok:
+            self.workers = workers
+        return result
+
+    def reload(self, config) -> OperationResult:
+        """热重载配置：监听端口与已建立的入站连接保持不变，之后的请求使用新配置。
+
+        进行中的请求在旧实例上完成；TLS 校验与连接池参数不变时沿用已预热的上游连接。
+        引擎或监听参数变化时返回失败，由调用方改为重启。
+        """
+        if not self.is_running():
+            return OperationResult.failure("代理服务器未运行")
+        if self.workers is not None:
+            self.log_func("多进程模式不支持热重载，需要重启代理服务器")
+            return OperationResult.failure("多进程模式不支持热重载", code=ErrorCode.CONFIG_INVALID)
+        config = config or {}
+        if resolve_proxy_engine(config) != resolve_proxy_engine(self.config):
+            self.log_func("代理引擎变化，需要重启代理服务器")
+            return OperationResult.failure("代理引擎变化", code=ErrorCode.CONFIG_INVALID)
+
+        proxy_config = build_proxy_config(
+            config,
+            resource_manager=self.resource_manager,
+            log_func=self.log_func,
+        )
+        if not proxy_config:
+            return OperationResult.failure("配置无效", code=ErrorCode.CONFIG_INVALID)
+        previous = self.app_layer
+        if previous.proxy_config and (
+            proxy_config.server != previous.proxy_config.server
+            or proxy_config.socket != previous.proxy_config.socket
+        ):
+            self.log_func("监听参数变化，需要重启代理服务器")
+            return OperationResult.failure("监听参数变化", code=ErrorCode.CONFIG_INVALID)
+
+        share_transport = previous.can_share_transport(proxy_config)
+        app_layer = self._create_app_layer(
+            config,
+            proxy_config=proxy_config,
+            transport=previous.shared_transport if share_transport else None,
+            admission=previous.admission,
         )
-        return result.ok
+        app_layer.take_over(previous)
+        self.app_layer = app_layer
+        if isinstance(self.runtime, ProxyRuntime):
+            self.runtime.swap_app(app_layer.app, admission=self._admission_config())
+        else:
+            self.runtime.swap_app(app_layer)
+        self.config = config
+        previous.retire(close_transport=not share_transport)
+        app_layer.start_upstream_warmup(self.thread_manager)
+
+        if share_transport:
+            self.log_func("配置已热重载，沿用现有上游连接池")
+        else:
+            self.log_func("配置已热重载，上游连接池已重建")
+        self.log_func(f"目标 API 地址: {app_layer.target_api_base_url}")
+        self.log_func(f"实际模型 ID: {app_layer.target_model_id}")
+        return OperationResult.success(transport_reused=share_transport)
 
-    def stop(self) -> None:
-        self.runtime.stop()
+    def stop(self) -> OperationResult:
+        """停止运行时（先排空进行中的流式响应），结果中包含排空与中止的流数量。"""
+        if self.workers is not None:
+            result = self.workers.stop()
+            self.workers = None
+        else:
+            result = self.runtime.stop()
         self.app_layer.close()
+        return result
 
     def is_running(self) -> bool:
+        if self.workers is not None:
+            return self.workers.is_running()
         return self.runtime.is_running()
 
+    def get_stats(self) -> dict[str, object]:
+        if self.workers is not None:
+            return {"engine": self.engine, **self.workers.get_stats()}
+        admission = self.app_layer.admission
+        return {
+            "engine": self.engine,
+            **self.runtime.get_stats(),
+            **(admission.snapshot() if admission else {}),
+        }
+
 
 def start_proxy_server(config, log_func=print, *, thread_manager: ThreadManager):
     proxy = ProxyServer(config, log_func, thread_manager=thread_manager)
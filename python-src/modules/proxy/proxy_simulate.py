@@ -0,0 +1,117 @@
+"""
+非流式响应转换为流式
+stream_mode 为 "false" 而客户端请求流式时，上游只返回完整的 chat.completion，
+这里把它重新切分为 chat.completion.chunk 事件。每个 choice 依次发出：
+    role 增量、reasoning_content 与 content 文本增量、tool_calls / function_call 增量、
+    带 finish_reason 的结束增量
+usage 附在最后一个结束增量上，最后发出 [DONE]。
+
+没有分词器可用，文本在词边界处切分（CJK 字符逐字切分，近似 token 边界），
+每个增量累积到约 chunk_chars 个字符，单个词超过 chunk_chars 时按字符数切开。
+响应此时已经完整，事件之间是否等待由调用方按配置决定。
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from collections.abc import Iterator
+
+from modules.proxy.proxy_json import dumps
+from modules.proxy.proxy_stream import DONE_BYTES
+
+# CJK 统一表意文字、谚文、兼容表意文字与全角字符各自成词，其余按空白分词，词尾空白归属该词
+_CJK = "⺀-鿿가-힯豈-﫿＀-￯"
+_WORD_RE = re.compile(rf"[{_CJK}]\s*|[^\s{_CJK}]+\s*|\s+")
+
+
+def split_text(text: str, chunk_chars: int) -> Iterator[str]:
+    """按词边界把文本切分为约 chunk_chars 个字符的片段，片段依次拼接即为原文。"""
+    pending: list[str] = []
+    size = 0
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        if size and size + len(word) > chunk_chars:
+            yield "".join(pending)
+            pending.clear()
+            size = 0
+        while len(word) > chunk_chars:
+            yield word[:chunk_chars]
+            word = word[chunk_chars:]
+        pending.append(word)
+        size += len(word)
+    if pending:
+        yield "".join(pending)
+
+
+def _message_text(value) -> str:
+    """content 可能是多段内容数组，只取其中的文本部分。"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "".join(
+            part.get("text") or ""
+            for part in value
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return ""
+
+
+def _event(payload: dict) -> bytes:
+    return b"data: " + dumps(payload).encode() + b"\n\n"
+
+
+def iter_simulated_events(response_json: dict, *, chunk_chars: int, log) -> Iterator[bytes]:
+    """把 chat.completion 转换为 SSE 事件序列（含结尾的 [DONE]）。"""
+    choices = response_json.get("choices")
+    if not choices or not isinstance(choices, list):
+        log("响应中没有找到 choices 字段")
+        yield _event({"error": "No choices in response"})
+        return
+
+    base = {
+        "id": response_json.get("id") or "",
+        "object": "chat.completion.chunk",
+        "created": response_json.get("created") or int(time.time()),
+        "model": response_json.get("model") or "",
+    }
+    if response_json.get("system_fingerprint"):
+        base["system_fingerprint"] = response_json["system_fingerprint"]
+    usage = response_json.get("usage")
+
+    for position, choice in enumerate(choices):
+        index = choice.get("index", position)
+        message = choice.get("message") or {}
+
+        def chunk(delta: dict, finish_reason=None, *, index=index) -> dict:
+            return {
+                **base,
+                "choices": [
+                    {
+                        "index": index,
+                        "delta": delta,
+                        "logprobs": None,
+                        "finish_reason": finish_reason,
+                    }
+                ],
+            }
+
+        yield _event(chunk({"role": message.get("role") or "assistant", "content": ""}))
+        for key in ("reasoning_content", "content"):
+            text = _message_text(message.get(key))
+            for piece in split_text(text, chunk_chars):
+                yield _event(chunk({key: piece}))
+        for call_index, call in enumerate(message.get("tool_calls") or []):
+            yield _event(chunk({"tool_calls": [{"index": call_index, **call}]}))
+        if message.get("function_call"):
+            yield _event(chunk({"function_call": message["function_call"]}))
+
+        final = chunk({}, choice.get("finish_reason") or "stop")
+        if usage and position == len(choices) - 1:
+            final["usage"] = usage
+        yield _event(final)
+
+    yield DONE_BYTES
+
+
+__all__ = ["iter_simulated_events", "split_text"]
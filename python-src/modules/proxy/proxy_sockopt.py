@@ -0,0 +1,85 @@
+"""
+TCP 套接字参数
+入站连接（监听端 accept 得到的套接字）与上游连接按同一组参数设置：
+TCP_NODELAY 关闭 Nagle 算法，避免小的 SSE 增量等待前一个分段的 ACK；
+keepalive 探测让被 NAT 或中间设备静默丢弃的空闲连接尽快暴露，而不是在下一次请求时才失败。
+收发缓冲区为 0 时不设置，沿用系统默认（Linux 默认会自动调节）。
+TCP_QUICKACK 仅 Linux 支持，内核会在之后的交互中自行恢复延迟 ACK，这里只在建立连接时设置一次。
+平台不提供的选项直接跳过，设置失败的选项不影响连接本身。
+"""
+
+from __future__ import annotations
+
+import socket
+
+from modules.proxy.proxy_config import SocketTuningConfig
+
+SocketOption = tuple[int, int, int]
+
+# macOS 上空闲时间的选项名为 TCP_KEEPALIVE
+_TCP_KEEPIDLE = getattr(socket, "TCP_KEEPIDLE", None) or getattr(socket, "TCP_KEEPALIVE", None)
+_TCP_KEEPINTVL = getattr(socket, "TCP_KEEPINTVL", None)
+_TCP_KEEPCNT = getattr(socket, "TCP_KEEPCNT", None)
+_TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+
+
+def build_socket_options(config: SocketTuningConfig) -> list[SocketOption]:
+    """把配置转换为 (level, option, value) 列表，格式与 urllib3/httpcore 的 socket_options 相同。"""
+    tcp = socket.IPPROTO_TCP
+    options: list[SocketOption] = [
+        (tcp, socket.TCP_NODELAY, int(config.nodelay)),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(config.keepalive)),
+    ]
+    if config.keepalive:
+        for option, value in (
+            (_TCP_KEEPIDLE, config.keepalive_idle),
+            (_TCP_KEEPINTVL, config.keepalive_interval),
+            (_TCP_KEEPCNT, config.keepalive_count),
+        ):
+            if option is not None:
+                options.append((tcp, option, value))
+    if config.send_buffer > 0:
+        options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, config.send_buffer))
+    if config.recv_buffer > 0:
+        options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, config.recv_buffer))
+    if config.quickack and _TCP_QUICKACK is not None:
+        options.append((tcp, _TCP_QUICKACK, 1))
+    return options
+
+
+def apply_socket_options(sock, options: list[SocketOption]) -> int:
+    """在已建立的连接上逐个设置选项，返回设置失败的数量。"""
+    failed = 0
+    for level, option, value in options:
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            failed += 1
+    return failed
+
+
+def describe_socket_tuning(config: SocketTuningConfig) -> str:
+    """用于调试日志的参数摘要，标出当前平台不支持的选项。"""
+    parts = [f"TCP_NODELAY {'开' if config.nodelay else '关'}"]
+    if not config.keepalive:
+        parts.append("keepalive 关")
+    elif _TCP_KEEPIDLE is None or _TCP_KEEPINTVL is None or _TCP_KEEPCNT is None:
+        parts.append("keepalive 开（平台不支持探测参数，使用系统默认）")
+    else:
+        parts.append(
+            f"keepalive 空闲 {config.keepalive_idle}s/间隔 {config.keepalive_interval}s/"
+            f"{config.keepalive_count} 次"
+        )
+    parts.append(f"发送缓冲 {config.send_buffer or '默认'}")
+    parts.append(f"接收缓冲 {config.recv_buffer or '默认'}")
+    if config.quickack:
+        parts.append("TCP_QUICKACK 开" if _TCP_QUICKACK is not None else "TCP_QUICKACK 不支持")
+    return "，".join(parts)
+
+
+__all__ = [
+    "SocketOption",
+    "apply_socket_options",
+    "build_socket_options",
+    "describe_socket_tuning",
+]
@@ -0,0 +1,186 @@
+"""
+增量 SSE 分帧器
+逐 token 推送时上游 chunk 很小，通常恰好是一个或几个事件：残留的不完整事件以 bytes 保存，
+与下一个 chunk 拼接后直接切分，没有 \r 时只查找 \n\n。
+残留超过 _JOIN_THRESHOLD（例如很长的 tool_call 参数分多次到达）时改为追加到同一个 bytearray，
+读取位置只前移不复制，已消费的前缀在过半时一次性裁掉，每个事件的成本与 chunk 大小无关。
+"""
+
+from __future__ import annotations
+
+DEFAULT_MAX_SSE_EVENT_SIZE = 8 * 1024 * 1024
+_COMPACT_THRESHOLD = 64 * 1024
+# 残留数据不超过该大小时以 bytes 保存并与下一个 chunk 拼接，超过时改用缓冲区
+_JOIN_THRESHOLD = 16 * 1024
+_CR = ord("\r")
+
+
+class SseEventTooLarge(ValueError):
+    """单个 SSE 事件超过大小上限。"""
+
+    def __init__(self, size: int, limit: int) -> None:
+        super().__init__(f"SSE 事件大小 {size} 字节超过上限 {limit} 字节")
+        self.size = size
+        self.limit = limit
+
+
+class SseFramer:
+    """按空行（\\n\\n 或 \\r\\n\\r\\n）切分 SSE 事件，返回的事件不含分隔符。"""
+
+    def __init__(self, max_event_size: int = DEFAULT_MAX_SSE_EVENT_SIZE) -> None:
+        self._tail = b""
+        self._buffer = bytearray()
+        self._offset = 0
+        self._max_event_size = max_event_size
+        # 缓冲区中只有出现过 \r 才需要查找 CRLF 分隔符；已确认不存在的范围不再重复查找
+        self._seen_cr = False
+        self._crlf_scanned = 0
+        self._crlf_hit = -1
+
+    @property
+    def pending(self) -> int:
+        """尚未组成完整事件的字节数。"""
+        return len(self._tail) + len(self._buffer) - self._offset
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """追加一段上游数据，返回其中已完整的事件。"""
+        if self._buffer:
+            return self._feed_buffered(chunk)
+        if not self._tail:
+            end = len(chunk) - 2
+            # 最常见的情况：chunk 恰好是一个完整事件，不进入切分循环
+            if chunk.find(b"\n\n") == end and end >= 0 and _CR not in chunk:
+                if end > self._max_event_size:
+                    raise SseEventTooLarge(end, self._max_event_size)
+                return [chunk[:end]]
+            data = chunk
+        else:
+            data = self._tail + chunk
+        if _CR in data:
+            self._crlf_scanned = 0
+            self._crlf_hit = -1
+            self._seen_cr = True
+            events, offset = self._split(data, 0, owned=False)
+        else:
+            events = []
+            offset = 0
+            sep = data.find(b"\n\n")
+            while sep != -1:
+                events.append(data[offset:sep])
+                offset = sep + 2
+                sep = data.find(b"\n\n", offset)
+            # 单个事件不会比 data 更长，data 未超过上限时省去逐个检查
+            if len(data) > self._max_event_size:
+                self._check_sizes(events, len(data) - offset)
+        if len(data) - offset > _JOIN_THRESHOLD:
+            self._tail = b""
+            self._buffer += memoryview(data)[offset:]
+            self._seen_cr = _CR in self._buffer
+            self._crlf_scanned = 0
+            self._crlf_hit = -1
+        else:
+            self._tail = data[offset:]
+        return events
+
+    def _feed_buffered(self, chunk: bytes) -> list[bytes]:
+        """残留数据较多时追加到缓冲区，避免反复拷贝和查找已接收的部分。"""
+        # 已有数据中不含 \n\n，分隔符最早从原末尾字节开始
+        scan_from = len(self._buffer) - 1
+        self._buffer += chunk
+        if not self._seen_cr and _CR in chunk:
+            self._seen_cr = True
+        events, self._offset = self._split(
+            self._buffer, self._offset, owned=True, scan_from=scan_from
+        )
+        if len(self._buffer) - self._offset <= _JOIN_THRESHOLD:
+            # 大事件已经切出，剩余部分回到 bytes 拼接方式
+            self._tail = bytes(self._buffer[self._offset :])
+            self._buffer.clear()
+            self._offset = 0
+        else:
+            self._compact()
+        return events
+
+    def _check_sizes(self, events: list[bytes], rest: int) -> None:
+        limit = self._max_event_size
+        for event in events:
+            if len(event) > limit:
+                raise SseEventTooLarge(len(event), limit)
+        if rest > limit:
+            raise SseEventTooLarge(rest, limit)
+
+    def _split(
+        self, data: bytes | bytearray, offset: int, *, owned: bool, scan_from: int = 0
+    ) -> tuple[list[bytes], int]:
+        """从 offset 开始切出完整事件（含 CRLF 分隔符），返回事件列表与剩余数据的起点。"""
+        seen_cr = self._seen_cr
+        events: list[bytes] = []
+        limit = self._max_event_size
+        while True:
+            lf = data.find(b"\n\n", max(offset, scan_from))
+            crlf = self._find_crlf(data, offset, lf) if seen_cr else -1
+            if crlf != -1:
+                sep, sep_len = crlf, 4
+            elif lf != -1:
+                sep, sep_len = lf, 2
+            else:
+                break
+            if sep - offset > limit:
+                raise SseEventTooLarge(sep - offset, limit)
+            events.append(bytes(data[offset:sep]) if owned else data[offset:sep])
+            offset = sep + sep_len
+        if len(data) - offset > limit:
+            raise SseEventTooLarge(len(data) - offset, limit)
+        return events, offset
+
+    def flush(self) -> bytes:
+        """取出剩余的未分隔数据并清空缓冲区。"""
+        rest = self._tail or bytes(self._buffer[self._offset :])
+        self._reset()
+        return rest
+
+    def _reset(self) -> None:
+        self._tail = b""
+        self._buffer.clear()
+        self._offset = 0
+        self._seen_cr = False
+        self._crlf_scanned = 0
+        self._crlf_hit = -1
+
+    def _find_crlf(self, data: bytes | bytearray, offset: int, lf: int) -> int:
+        """返回早于 lf 的 CRLF 分隔符位置，不存在时返回 -1。"""
+        hit = self._crlf_hit
+        if hit < offset:
+            start = max(offset, self._crlf_scanned)
+            end = len(data) if lf == -1 else lf + 3
+            if start >= end - 3:
+                return -1
+            hit = data.find(b"\r\n\r\n", start, end)
+            self._crlf_hit = hit
+            # 末尾可能只到达分隔符的一部分，下次从这里继续查找
+            self._crlf_scanned = end - 3 if hit == -1 else hit + 1
+            if hit == -1:
+                return -1
+        if lf != -1 and hit > lf:
+            return -1
+        return hit
+
+    def _compact(self) -> None:
+        offset = self._offset
+        if offset == 0:
+            return
+        if offset < len(self._buffer) and (
+            offset < _COMPACT_THRESHOLD or offset * 2 < len(self._buffer)
+        ):
+            return
+        del self._buffer[:offset]
+        self._offset = 0
+        self._shift(offset)
+
+    def _shift(self, delta: int) -> None:
+        """缓冲区起点前移 delta 字节后，同步调整 CRLF 查找记录。"""
+        self._crlf_hit = self._crlf_hit - delta if self._crlf_hit >= delta else -1
+        self._crlf_scanned = max(0, self._crlf_scanned - delta)
+
+
+__all__ = ["DEFAULT_MAX_SSE_EVENT_SIZE", "SseEventTooLarge", "SseFramer"]
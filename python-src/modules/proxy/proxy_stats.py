@@ -0,0 +1,155 @@
+"""代理运行统计：线程安全的计数器与活跃流登记，供运行时与 UI 查询。"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class StreamStats:
+    """单个流式响应的运行状态。"""
+
+    request_id: str
+    started_at: float = field(default_factory=time.time)
+    events: int = 0
+    bytes_out: int = 0
+    writes: int = 0  # 下游写入次数，启用合并写入时小于 events
+    buffer_size: int = 0  # 读取阶段缓冲区容量（事件数），0 表示未启用
+    buffered: int = 0  # 缓冲区中等待写出的事件数
+    buffered_max: int = 0
+    heartbeats: int = 0  # 上游沉默期间发送的 ": keepalive" 心跳数
+
+    def record_buffered(self, depth: int) -> None:
+        self.buffered = depth
+        self.buffered_max = max(self.buffered_max, depth)
+
+
+class ProxyStats:
+    """集中记录代理计数器，所有方法均可跨线程调用。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+        self._streams: dict[str, StreamStats] = {}
+        self._stream_aborts: dict[str, Callable[[], None]] = {}
+        self._streams_closed = 0
+        self._streams_changed = threading.Condition(self._lock)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def record_connection(self, requests: int) -> None:
+        """登记一条已关闭的入站连接及其处理过的请求数。"""
+        with self._lock:
+            counters = self._counters
+            if requests <= 0:
+                counters["inbound_unused_connections"] = (
+                    counters.get("inbound_unused_connections", 0) + 1
+                )
+                return
+            counters["inbound_connections"] = counters.get("inbound_connections", 0) + 1
+            counters["inbound_requests"] = counters.get("inbound_requests", 0) + requests
+            counters["inbound_reused_requests"] = (
+                counters.get("inbound_reused_requests", 0) + requests - 1
+            )
+            counters["inbound_max_requests_per_connection"] = max(
+                counters.get("inbound_max_requests_per_connection", 0), requests
+            )
+
+    def record_admission_wait(self, wait: float, *, admitted: bool) -> None:
+        """登记一次准入排队：累计与最大等待时间（毫秒），超时未获准入单独计数。"""
+        wait_ms = int(wait * 1000)
+        with self._lock:
+            counters = self._counters
+            counters["admission_queued"] = counters.get("admission_queued", 0) + 1
+            counters["admission_wait_ms_total"] = (
+                counters.get("admission_wait_ms_total", 0) + wait_ms
+            )
+            counters["admission_wait_ms_max"] = max(
+                counters.get("admission_wait_ms_max", 0), wait_ms
+            )
+            if not admitted:
+                counters["admission_rejected_timeout"] = (
+                    counters.get("admission_rejected_timeout", 0) + 1
+                )
+
+    def open_stream(
+        self, request_id: str, *, abort: Callable[[], None] | None = None
+    ) -> StreamStats:
+        """登记活跃流；abort 用于停止时中止该流，须可跨线程调用。"""
+        stream = StreamStats(request_id=request_id)
+        with self._lock:
+            self._streams[request_id] = stream
+            if abort is not None:
+                self._stream_aborts[request_id] = abort
+            self._counters["streams_total"] = self._counters.get("streams_total", 0) + 1
+        return stream
+
+    def close_stream(self, request_id: str) -> None:
+        with self._lock:
+            self._stream_aborts.pop(request_id, None)
+            if self._streams.pop(request_id, None) is not None:
+                self._streams_closed += 1
+            self._streams_changed.notify_all()
+
+    def closed_streams(self) -> int:
+        """累计已结束的流数量，停止前后相减即排空期间结束的流。"""
+        with self._lock:
+            return self._streams_closed
+
+    def wait_streams(self, timeout: float) -> bool:
+        """等待全部活跃流结束，超时返回 False。"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._streams:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._streams_changed.wait(remaining)
+            return True
+
+    def abort_streams(self) -> int:
+        """中止仍在进行的流，返回中止数量。"""
+        with self._lock:
+            aborts = list(self._stream_aborts.values())
+            self._stream_aborts.clear()
+        for abort in aborts:
+            with contextlib.suppress(Exception):
+                abort()
+        return len(aborts)
+
+    def active_streams(self) -> int:
+        with self._lock:
+            return len(self._streams)
+
+    def record_drain(self, drained: int, aborted: int) -> dict[str, int]:
+        """累计停止时排空与中止的流数量，返回本次的排空结果。"""
+        with self._lock:
+            counters = self._counters
+            counters["streams_drained"] = counters.get("streams_drained", 0) + drained
+            counters["streams_aborted"] = counters.get("streams_aborted", 0) + aborted
+        return {"drained_streams": drained, "aborted_streams": aborted}
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            connections = self._counters.get("inbound_connections", 0)
+            requests = self._counters.get("inbound_requests", 0)
+            return {
+                "counters": dict(self._counters),
+                # 每条入站连接平均处理的请求数，大于 1 的部分即省下的 TLS 握手
+                "requests_per_connection": round(requests / connections, 2) if connections else 0.0,
+                "active_streams": len(self._streams),
+                "streams": [asdict(stream) for stream in self._streams.values()],
+            }
+
+
+__all__ = ["ProxyStats", "StreamStats"]
@@ -0,0 +1,254 @@
+"""SSE 流处理：把上游事件转换为下游字节，同步与异步引擎共用。"""
+
+from __future__ import annotations
+
+import re
+
+from modules.proxy.proxy_json import dumps, loads
+from modules.proxy.proxy_transport import BaseProxyTransport
+
+DONE_BYTES = b"data: [DONE]\n\n"
+
+# 透传模式：前几个事件完整归一化并校验，全部合规后其余事件按原始字节转发
+PASSTHROUGH_VALIDATE_EVENTS = 3
+
+_CHUNK_KEYS = frozenset(
+    {"id", "object", "created", "model", "choices", "system_fingerprint", "service_tier", "usage"}
+)
+_CHOICE_KEYS = frozenset({"index", "delta", "logprobs", "finish_reason"})
+_DELTA_KEYS = frozenset({"role", "content", "tool_calls", "function_calls", "reasoning_content"})
+_FINISH_REASON_RE = re.compile(rb'"finish_reason"\s*:\s*(?:"([^"\\]*)"|null)')
+# 事件中携带内容的 delta 字段（值非空），用于判断首 token；
+# 冒号后的空白按占有方式匹配，否则 `"content": ""` 会回溯到空白之前被误判为内容
+_TOKEN_RE = re.compile(
+    rb'"(?:content|reasoning_content|tool_calls|function_calls)"\s*:\s*+(?!null\b|""|\[\])'
+)
+
+
+def carries_token(event: bytes) -> bool:
+    """事件是否携带首 token（content / reasoning_content / tool_calls 非空）。"""
+    return _TOKEN_RE.search(event) is not None
+
+
+def _unexpected_keys(mapping: dict, allowed: frozenset[str]) -> list[str]:
+    """不在 allowed 中且值不为 null 的字段；null 字段（如 OpenAI 的 refusal）归一化时本就会丢弃。"""
+    return sorted(key for key in mapping.keys() - allowed if mapping[key] is not None)
+
+
+def check_passthrough_payload(payload, event_index: int) -> str | None:  # noqa: PLR0911
+    """检查上游事件是否已是归一化后的形态，合规返回 None，否则返回原因。"""
+    if not isinstance(payload, dict):
+        return "事件不是 JSON 对象"
+    if payload.get("object") != "chat.completion.chunk":
+        return f"object={payload.get('object')!r}"
+    extra_keys = _unexpected_keys(payload, _CHUNK_KEYS)
+    if extra_keys:
+        return f"多余字段 {extra_keys}"
+    if not isinstance(payload.get("id"), str) or not payload["id"]:
+        return "缺少 id"
+    if not isinstance(payload.get("created"), int):
+        return "created 不是整数"
+    if "model" in payload and not (isinstance(payload["model"], str) and payload["model"]):
+        return "model 为空"
+    choices = payload.get("choices")
+    if not isinstance(choices, list) or len(choices) != 1 or not isinstance(choices[0], dict):
+        return "choices 不是单元素列表"
+    choice0 = choices[0]
+    if _unexpected_keys(choice0, _CHOICE_KEYS) or choice0.get("logprobs") is not None:
+        return "choice 含多余字段"
+    if not {"index", "finish_reason"} <= choice0.keys():
+        return "choice 缺少 index 或 finish_reason"
+    delta = choice0.get("delta")
+    if not isinstance(delta, dict) or _unexpected_keys(delta, _DELTA_KEYS):
+        return "delta 不合规"
+    if event_index == 1 and not delta.get("role"):
+        return "首个事件缺少 role"
+    if choice0.get("finish_reason") == "":
+        return "finish_reason 为空字符串"
+    return None
+
+
+class SseStreamProcessor:
+    """逐个处理上游 SSE 事件，记录 [DONE] 与 finish_reason 状态。"""
+
+    def __init__(
+        self,
+        transport: BaseProxyTransport,
+        *,
+        model_name: str,
+        debug_mode: bool,
+        log,
+        passthrough: bool = False,
+    ) -> None:
+        self._transport = transport
+        self._model_name = model_name
+        self._debug_mode = debug_mode
+        self._log = log
+        self._passthrough_enabled = passthrough
+        self._passthrough = False
+        self._model_prefix = b'{"model": ' + dumps(model_name).encode() + b", "
+        self._patch_model = False
+        self.event_index = 0
+        self.passthrough_events = 0
+        self.done_sent = False
+        self.finish_reason: str | None = None
+        self.token_seen = False
+        # 刚处理的事件是否需要立即写出，不受合并窗口影响：首 token 之前（含首 token）的事件与 [DONE]
+        self.urgent = True
+
+    @property
+    def passthrough_active(self) -> bool:
+        return self._passthrough
+
+    def process(self, upstream_chunk_index: int, raw_event: bytes) -> bytes | None:
+        """返回需要写给下游的字节；返回 None 表示跳过该事件。"""
+        output = self._process_event(upstream_chunk_index, raw_event)
+        self.urgent = self.done_sent or not self.token_seen
+        if output is not None and not self.token_seen and carries_token(output):
+            self.token_seen = True
+        return output
+
+    def _process_event(self, upstream_chunk_index: int, raw_event: bytes) -> bytes | None:
+        self.event_index += 1
+        if self._passthrough:
+            output = self._passthrough_event(upstream_chunk_index, raw_event)
+            if output is not None:
+                self.passthrough_events += 1
+                return output
+
+        event_text = raw_event.decode("utf-8", errors="replace")
+        data_lines = [
+            line[len("data:") :].lstrip()
+            for line in event_text.splitlines()
+            if line.startswith("data:")
+        ]
+        if not data_lines:
+            self._log(f"evt#{self.event_index} 跳过无 data 行的事件: {event_text!r}")
+            return None
+        data_str = "\n".join(data_lines)
+
+        if self._debug_mode:
+            self._log(
+                f"UP<< evt#{self.event_index} src_chunk#{upstream_chunk_index} "
+                f"bytes={len(raw_event)} | {data_str.strip()}"
+            )
+
+        if data_str.strip() == "[DONE]":
+            self.done_sent = True
+            return DONE_BYTES
+
+        if self._passthrough_enabled and self.event_index <= PASSTHROUGH_VALIDATE_EVENTS:
+            normalized_bytes, finish_reason = self._validate_event(data_str)
+        else:
+            normalized_bytes, finish_reason = self._transport.normalize_openai_event(
+                data_str,
+                self.event_index,
+                model_name=self._model_name,
+                log=self._log,
+            )
+        if finish_reason:
+            self.finish_reason = finish_reason
+        return normalized_bytes
+
+    def _validate_event(self, data_str: str) -> tuple[bytes, str | None]:
+        """校验阶段：正常归一化，同时判断后续事件能否直接透传。"""
+        try:
+            payload = loads(data_str)
+        except ValueError:
+            payload = None
+        reason = check_passthrough_payload(payload, self.event_index)
+        if reason is not None:
+            self._passthrough_enabled = False
+            if self._debug_mode:
+                self._log(f"evt#{self.event_index} 不满足透传条件（{reason}），保持归一化")
+            return self._transport.normalize_openai_event(
+                data_str,
+                self.event_index,
+                model_name=self._model_name,
+                log=self._log,
+            )
+
+        if self.event_index == 1:
+            self._patch_model = "model" not in payload
+        elif self._patch_model != ("model" not in payload):
+            self._passthrough_enabled = False
+            if self._debug_mode:
+                self._log(f"evt#{self.event_index} 上游 model 字段时有时无，保持归一化")
+        if self._passthrough_enabled and self.event_index == PASSTHROUGH_VALIDATE_EVENTS:
+            self._passthrough = True
+            if self._debug_mode:
+                self._log(f"前 {PASSTHROUGH_VALIDATE_EVENTS} 个事件均合规，后续事件直接透传")
+        return self._transport.normalize_openai_payload(
+            payload, self.event_index, model_name=self._model_name
+        )
+
+    def _passthrough_event(  # noqa: PLR0911
+        self, upstream_chunk_index: int, raw_event: bytes
+    ) -> bytes | None:
+        """透传阶段：只做字节级检查；返回 None 表示出现异常，需回退到归一化。"""
+        if not raw_event.startswith(b"data:") or b"\n" in raw_event:
+            return self._stop_passthrough("事件不是单行 data")
+        data = raw_event[5:].lstrip(b" ")
+        if self._debug_mode:
+            self._log(
+                f"UP<< evt#{self.event_index} src_chunk#{upstream_chunk_index} "
+                f"bytes={len(raw_event)} | {data.decode('utf-8', errors='replace')} (透传)"
+            )
+        if data == b"[DONE]":
+            self.done_sent = True
+            return DONE_BYTES
+        if not (data.startswith(b"{") and data.endswith(b"}")):
+            return self._stop_passthrough("事件不是 JSON 对象")
+        if b'"chat.completion.chunk"' not in data:
+            return self._stop_passthrough("object 不是 chat.completion.chunk")
+        if b'"error"' in data:
+            return self._stop_passthrough("事件包含 error 字段")
+
+        match = _FINISH_REASON_RE.search(data)
+        if match is None:
+            return self._stop_passthrough("缺少 finish_reason")
+        if match.group(1) is not None:
+            if not match.group(1):
+                return self._stop_passthrough("finish_reason 为空字符串")
+            self.finish_reason = match.group(1).decode("utf-8", errors="replace")
+
+        if self._patch_model:
+            if b'"model"' in data:
+                return self._stop_passthrough("上游开始返回 model 字段")
+            return b"data: " + self._model_prefix + data[1:] + b"\n\n"
+        if raw_event.startswith(b"data: "):
+            return raw_event + b"\n\n"
+        return b"data: " + data + b"\n\n"
+
+    def _stop_passthrough(self, reason: str) -> None:
+        self._passthrough = False
+        self._passthrough_enabled = False
+        self._log(f"evt#{self.event_index} 透传检查未通过（{reason}），回退到归一化")
+
+    def tail(self) -> bytes | None:
+        """上游未发送 [DONE] 时返回补发的终止事件。"""
+        if self._debug_mode and self.passthrough_events:
+            self._log(f"透传事件 {self.passthrough_events} 个")
+        if self.done_sent:
+            return None
+        if self._debug_mode:
+            extra = f"，finish_reason={self.finish_reason}" if self.finish_reason else ""
+            self._log(f"未收到上游 [DONE]，已补发终止事件{extra}")
+        return DONE_BYTES
+
+    def describe_interrupt(self) -> str:
+        if self.done_sent:
+            return f"DOWN 连接提前中断，已读取上游 evt#{self.event_index} (DONE)"
+        return (
+            f"DOWN 连接提前中断，已读取上游 evt#{self.event_index} "
+            f"finish={self.finish_reason}"
+        )
+
+
+__all__ = [
+    "DONE_BYTES",
+    "PASSTHROUGH_VALIDATE_EVENTS",
+    "SseStreamProcessor",
+    "carries_token",
+    "check_passthrough_payload",
+]
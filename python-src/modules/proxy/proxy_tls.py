@@ -0,0 +1,75 @@
+"""
+本地监听端的 TLS 上下文
+同一进程内按证书文件复用服务端 SSLContext：会话缓存与会话票据密钥都属于上下文，
+代理重启后重连的客户端仍可恢复会话，跳过完整握手；证书文件未变化时也不再重新读取。
+证书文件的修改时间或大小变化时重新加载。
+"""
+
+from __future__ import annotations
+
+import os
+import ssl
+import threading
+
+# TLS 1.2 只保留前向安全的 AEAD 套件，AES-GCM 优先（有硬件加速），其次 ChaCha20
+SERVER_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20"
+# TLS 1.3 每次完整握手后下发的会话票据数量
+SESSION_TICKETS = 4
+
+_contexts: dict[tuple, tuple[tuple, ssl.SSLContext]] = {}
+_contexts_lock = threading.Lock()
+
+
+def _file_signature(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def create_server_ssl_context(
+    cert_file: str, key_file: str, *, alpn_protocols: tuple[str, ...] = ()
+) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+    context.set_ciphers(SERVER_CIPHERS)
+    context.num_tickets = SESSION_TICKETS
+    if alpn_protocols:
+        context.set_alpn_protocols(list(alpn_protocols))
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+def get_server_ssl_context(
+    cert_file: str, key_file: str, *, alpn_protocols: tuple[str, ...] = ()
+) -> tuple[ssl.SSLContext, bool]:
+    """返回进程内复用的服务端上下文，以及是否命中缓存。"""
+    key = (os.path.abspath(cert_file), os.path.abspath(key_file), alpn_protocols)
+    signature = (_file_signature(cert_file), _file_signature(key_file))
+    with _contexts_lock:
+        cached = _contexts.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1], True
+        context = create_server_ssl_context(cert_file, key_file, alpn_protocols=alpn_protocols)
+        _contexts[key] = (signature, context)
+        return context, False
+
+
+def tls_session_stats(context: ssl.SSLContext | None) -> dict[str, int]:
+    """握手与会话恢复计数：accept_good 为完成的握手数，hits 为其中恢复会话的次数。"""
+    if context is None:
+        return {}
+    stats = context.session_stats()
+    return {
+        "tls_handshakes": stats["accept_good"],
+        "tls_resumed": stats["hits"],
+        "tls_session_cache": stats["number"],
+    }
+
+
+__all__ = [
+    "SERVER_CIPHERS",
+    "SESSION_TICKETS",
+    "create_server_ssl_context",
+    "get_server_ssl_context",
+    "tls_session_stats",
+]
@@ -1,20 +1,112 @@
 from __future__ import annotations
 
 import contextlib
-import json
+import functools
 import os
 import ssl
 import time
 import uuid
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+import urllib3.poolmanager
 from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
+from modules.proxy.proxy_config import SocketTuningConfig, UpstreamPoolConfig
+from modules.proxy.proxy_disconnect import current_upstream_cancel, shutdown_socket
+from modules.proxy.proxy_json import dumps, loads
+from modules.proxy.proxy_sockopt import SocketOption, build_socket_options
+from modules.proxy.proxy_sse import DEFAULT_MAX_SSE_EVENT_SIZE, SseEventTooLarge, SseFramer
+from modules.proxy.proxy_warmup import WARMUP_TIMEOUT
 from modules.runtime.resource_manager import ResourceManager, is_packaged
 
 
-class SSLContextAdapter(HTTPAdapter):
+class _CancellableConnectionMixin:
+    """发送请求时把连接登记到当前线程的 UpstreamCancel，客户端断开时直接关闭上游套接字。"""
+
+    _handshake_sock = None
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        if current_upstream_cancel() is not None:
+            # TLS 包装会接管原套接字对象，登记它的副本，握手期间同样可以中止
+            self._handshake_sock = sock.dup()
+            self._bind_upstream_cancel(self._handshake_sock)
+        return sock
+
+    def connect(self) -> None:
+        try:
+            super().connect()
+        finally:
+            handshake_sock, self._handshake_sock = self._handshake_sock, None
+            self._bind_upstream_cancel(self.sock)
+            if handshake_sock is not None:
+                handshake_sock.close()
+
+    def request(self, *args, **kwargs) -> None:
+        # 复用的长连接不再经过 connect()，明文连接则在发送时才建立
+        self._bind_upstream_cancel(self.sock)
+        super().request(*args, **kwargs)
+
+    @staticmethod
+    def _bind_upstream_cancel(sock) -> None:
+        cancel = current_upstream_cancel()
+        if cancel is not None and sock is not None:
+            cancel.set_interrupt(functools.partial(shutdown_socket, sock))
+
+
+class _CancellableHTTPConnection(_CancellableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _CancellableHTTPSConnection(_CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CancellableHTTPConnection
+
+
+class _CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+
+_CANCELLABLE_POOL_CLASSES = {
+    "http": _CancellableHTTPConnectionPool,
+    "https": _CancellableHTTPSConnectionPool,
+}
+
+
+def _use_cancellable_pools(manager):
+    # SOCKS 代理等自带连接池类型的管理器保持不变
+    if manager.pool_classes_by_scheme is urllib3.poolmanager.pool_classes_by_scheme:
+        manager.pool_classes_by_scheme = _CANCELLABLE_POOL_CLASSES
+    return manager
+
+
+class SocketOptionsAdapter(HTTPAdapter):
+    """在新建的上游连接上设置套接字参数（替换 urllib3 默认的 TCP_NODELAY），并使用可中止的连接。"""
+
+    def __init__(self, *args, socket_options: list[SocketOption] | None = None, **kwargs):
+        self.socket_options = socket_options
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.socket_options is not None:
+            pool_kwargs.setdefault("socket_options", self.socket_options)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        _use_cancellable_pools(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self.socket_options is not None:
+            proxy_kwargs.setdefault("socket_options", self.socket_options)
+        return _use_cancellable_pools(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+
+class SSLContextAdapter(SocketOptionsAdapter):
     """支持自定义 SSLContext 的适配器，用于调整验证策略。"""
 
     def __init__(self, ssl_context, *args, **kwargs):
@@ -30,41 +122,21 @@ class SSLContextAdapter(HTTPAdapter):
         return super().proxy_manager_for(proxy, **proxy_kwargs)
 
 
-class ProxyTransport:
-    """代理传输层：HTTP 会话、SSE 解析、上游事件归一化。"""
+class BaseProxyTransport:
+    """传输层公共部分：SSE 日志、事件切分、上游事件归一化，不依赖具体 HTTP 客户端。"""
 
     def __init__(
         self,
         *,
         resource_manager: ResourceManager,
-        disable_ssl_strict_mode: bool,
         log_func=print,
+        max_sse_event_size: int = DEFAULT_MAX_SSE_EVENT_SIZE,
+        socket_config: SocketTuningConfig | None = None,
     ) -> None:
         self._resource_manager = resource_manager
         self._log = log_func
-        self._session = self._create_http_client(disable_ssl_strict_mode)
-
-    @property
-    def session(self) -> requests.Session:
-        return self._session
-
-    def close(self) -> None:
-        if self._session:
-            with contextlib.suppress(Exception):
-                self._session.close()
-
-    def _create_http_client(self, disable_ssl_strict_mode: bool) -> requests.Session:
-        session = requests.Session()
-        if disable_ssl_strict_mode:
-            try:
-                ctx = ssl.create_default_context()
-                ctx.verify_flags &= ~ssl.VERIFY_X509_STRICT
-                adapter = SSLContextAdapter(ctx)
-                session.mount("https://", adapter)
-                self._log("关闭 SSL 严格模式: 使用自定义 HTTPS 上下文")
-            except Exception as exc:  # noqa: BLE001
-                self._log(f"配置非严格 SSL 上下文失败，继续使用默认设置: {exc}")
-        return session
+        self._max_sse_event_size = max_sse_event_size
+        self._socket_options = build_socket_options(socket_config or SocketTuningConfig())
 
     def prepare_sse_log_path(self) -> str:
         base_dir = (
@@ -78,33 +150,45 @@ class ProxyTransport:
         filename = f"sse_{timestamp}_{int(time.time() * 1000)}.log"
         return os.path.join(log_dir, filename)
 
-    def extract_sse_events(
-        self, response, *, log_file=None, log
-    ) -> Generator[tuple[int, bytes]]:
-        buffer = b""
-        chunk_index = 0
-        for chunk in response.iter_content(chunk_size=None):
-            chunk_index += 1
-            if log_file:
-                try:
-                    log_file.write(chunk)
-                    log_file.flush()
-                except Exception as write_exc:  # noqa: BLE001
-                    log(f"SSE 日志写入失败，停止记录: {write_exc}")
-                    with contextlib.suppress(Exception):
-                        log_file.close()
-                    log_file = None
-            buffer += chunk
-            while True:
-                sep = buffer.find(b"\n\n")
-                if sep == -1:
-                    break
-                event = buffer[:sep]
-                buffer = buffer[sep + 2 :]
-                yield chunk_index, event
-        if buffer.strip():
-            log("警告: 上游 SSE 结束时存在未完整分隔的残留数据")
-            yield chunk_index, buffer
+    @staticmethod
+    def _write_sse_log(log_file, chunk: bytes, *, log):
+        """写入原始 SSE 数据，失败时关闭文件并返回 None。"""
+        if not log_file:
+            return None
+        try:
+            log_file.write(chunk)
+            log_file.flush()
+        except Exception as write_exc:  # noqa: BLE001
+            log(f"SSE 日志写入失败，停止记录: {write_exc}")
+            with contextlib.suppress(Exception):
+                log_file.close()
+            return None
+        return log_file
+
+    def _relaxed_ssl_context(self, disable_ssl_strict_mode: bool) -> ssl.SSLContext | None:
+        """关闭 SSL 严格模式时返回去掉 VERIFY_X509_STRICT 的上下文；未关闭或创建失败时返回 None。"""
+        if not disable_ssl_strict_mode:
+            return None
+        try:
+            ctx = ssl.create_default_context()
+            ctx.verify_flags &= ~ssl.VERIFY_X509_STRICT
+        except Exception as exc:  # noqa: BLE001
+            self._log(f"配置非严格 SSL 上下文失败，继续使用默认设置: {exc}")
+            return None
+        self._log("关闭 SSL 严格模式: 使用自定义 HTTPS 上下文")
+        return ctx
+
+    def _new_sse_framer(self) -> SseFramer:
+        return SseFramer(self._max_sse_event_size)
+
+    @staticmethod
+    def _feed_sse_framer(framer: SseFramer, chunk: bytes, *, log) -> list[bytes] | None:
+        """切分一段上游数据；事件超过上限时返回 None，调用方应停止读取。"""
+        try:
+            return framer.feed(chunk)
+        except SseEventTooLarge as exc:
+            log(f"上游 SSE 事件过大，停止读取: {exc}")
+            return None
 
     @staticmethod
     def _new_request_id() -> str:
@@ -114,11 +198,16 @@ class ProxyTransport:
         self, data_str: str, event_index: int, *, model_name: str, log
     ) -> tuple[bytes, str | None]:
         try:
-            payload = json.loads(data_str)
+            payload = loads(data_str)
         except Exception as exc:  # noqa: BLE001
             log(f"chunk#{event_index} JSON 解析失败，原样透传: {exc}")
             return f"data: {data_str}\n\n".encode(), None
+        return self.normalize_openai_payload(payload, event_index, model_name=model_name)
 
+    def normalize_openai_payload(
+        self, payload: dict, event_index: int, *, model_name: str
+    ) -> tuple[bytes, str | None]:
+        """把已解析的上游事件重建为标准 chat.completion.chunk。"""
         choices = payload.get("choices") or []
         choice0 = choices[0] if choices else {}
         raw_delta = choice0.get("delta") or {}
@@ -155,8 +244,113 @@ class ProxyTransport:
                 }
             ],
         }
-        chunk_json = json.dumps(chunk_obj, ensure_ascii=False)
+        chunk_json = dumps(chunk_obj)
         return f"data: {chunk_json}\n\n".encode(), normalized_finish
 
 
-__all__ = ["ProxyTransport", "SSLContextAdapter"]
+class ProxyTransport(BaseProxyTransport):
+    """代理传输层：基于 requests 的 HTTP 会话与 SSE 读取。"""
+
+    def __init__(
+        self,
+        *,
+        resource_manager: ResourceManager,
+        disable_ssl_strict_mode: bool,
+        log_func=print,
+        pool_config: UpstreamPoolConfig | None = None,
+        socket_config: SocketTuningConfig | None = None,
+    ) -> None:
+        super().__init__(
+            resource_manager=resource_manager, log_func=log_func, socket_config=socket_config
+        )
+        self._pool_config = pool_config or UpstreamPoolConfig()
+        self._session = self._create_http_client(disable_ssl_strict_mode)
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session
+
+    def close(self) -> None:
+        if self._session:
+            with contextlib.suppress(Exception):
+                self._session.close()
+
+    def _create_http_client(self, disable_ssl_strict_mode: bool) -> requests.Session:
+        session = requests.Session()
+        pool_kwargs = {
+            "pool_connections": self._pool_config.hosts,
+            "pool_maxsize": self._pool_config.size,
+            "pool_block": self._pool_config.block,
+            "socket_options": self._socket_options,
+        }
+        session.mount("http://", SocketOptionsAdapter(**pool_kwargs))
+        ctx = self._relaxed_ssl_context(disable_ssl_strict_mode)
+        if ctx is None:
+            session.mount("https://", SocketOptionsAdapter(**pool_kwargs))
+        else:
+            session.mount("https://", SSLContextAdapter(ctx, **pool_kwargs))
+        return session
+
+    def warm_up(self, url: str, count: int) -> int:
+        """并发发起 count 个 HEAD 请求，使连接池保留对应数量的长连接，返回成功数。"""
+        if count <= 0:
+            return 0
+
+        def ping(_index: int) -> bool:
+            try:
+                response = self._session.head(
+                    url, timeout=WARMUP_TIMEOUT, allow_redirects=False
+                )
+            except requests.exceptions.RequestException:
+                return False
+            response.close()
+            return True
+
+        with ThreadPoolExecutor(max_workers=count, thread_name_prefix="upstream-warmup") as pool:
+            return sum(pool.map(ping, range(count)))
+
+    @staticmethod
+    def set_read_timeout(response, seconds: float | None) -> bool:
+        """收到响应头之后调整套接字读取超时；urllib3 只在发送请求时按读取超时设置一次。
+
+        响应没有可调整的套接字（例如 HTTP/2 上游）时返回 False。
+        """
+        connection = getattr(getattr(response, "raw", None), "connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            return False
+        try:
+            sock.settimeout(seconds)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def interrupt_response(response) -> None:
+        """从其他线程中断正在读取的响应：urllib3 2.3+ 关闭底层套接字，唤醒阻塞的读取。"""
+        shutdown = getattr(getattr(response, "raw", None), "shutdown", None)
+        if shutdown is not None:
+            shutdown()
+        else:
+            response.close()
+
+    def extract_sse_events(
+        self, response, *, log_file=None, log
+    ) -> Generator[tuple[int, bytes]]:
+        framer = self._new_sse_framer()
+        chunk_index = 0
+        for chunk in response.iter_content(chunk_size=None):
+            chunk_index += 1
+            log_file = self._write_sse_log(log_file, chunk, log=log)
+            events = self._feed_sse_framer(framer, chunk, log=log)
+            if events is None:
+                return
+            for event in events:
+                yield chunk_index, event
+        rest = framer.flush()
+        if rest.strip():
+            log("警告: 上游 SSE 结束时存在未完整分隔的残留数据")
+            yield chunk_index, rest
+
+
+__all__ = ["BaseProxyTransport", "ProxyTransport", "SSLContextAdapter", "SocketOptionsAdapter"]
@@ -0,0 +1,63 @@
+"""
+上游连接预热
+代理启动后并发发起 HEAD 请求，让连接池提前保留若干条完成 TCP/TLS 握手的长连接；
+之后按间隔重复探测，避免空闲连接被上游的 keep-alive 超时关闭，首个请求无需再握手。
+并发请求会各自占用一条连接，因此同步（requests）与异步（httpx）客户端都只用公开接口即可预热。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable
+
+from modules.proxy.proxy_config import UpstreamPoolConfig
+from modules.proxy.proxy_stats import ProxyStats
+
+# 单次预热 / 探测请求的超时（秒）
+WARMUP_TIMEOUT = 10.0
+
+
+class UpstreamWarmer:
+    """按连接池配置执行预热与空闲探测，warm(count) 返回成功建立或复用的连接数。"""
+
+    def __init__(self, pool_config: UpstreamPoolConfig, *, log, stats: ProxyStats) -> None:
+        self._count = pool_config.prewarm
+        self._interval = pool_config.ping_interval
+        self._log = log
+        self._stats = stats
+        self._stop_event = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._count > 0
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self, warm: Callable[[int], int]) -> None:
+        """在后台线程中运行，直到 stop() 被调用。"""
+        self._report(warm(self._count), initial=True)
+        while self._interval > 0 and not self._stop_event.wait(self._interval):
+            self._report(warm(self._count), initial=False)
+
+    async def arun(self, warm: Callable[[int], Awaitable[int]]) -> None:
+        """在事件循环中运行，取消任务即停止。"""
+        self._report(await warm(self._count), initial=True)
+        while self._interval > 0 and not self._stop_event.is_set():
+            await asyncio.sleep(self._interval)
+            self._report(await warm(self._count), initial=False)
+
+    def _report(self, ready: int, *, initial: bool) -> None:
+        if self._stop_event.is_set():
+            return
+        self._stats.incr("upstream_pings", self._count)
+        if ready < self._count:
+            self._stats.incr("upstream_ping_failures", self._count - ready)
+        if initial:
+            self._log(f"上游连接预热完成: {ready}/{self._count} 条连接就绪")
+        elif ready < self._count:
+            self._log(f"上游空闲探测: {ready}/{self._count} 条连接可用")
+
+
+__all__ = ["WARMUP_TIMEOUT", "UpstreamWarmer"]
@@ -0,0 +1,377 @@
+"""
+多进程工作模式
+流式事件的 JSON 解析与改写受 GIL 限制，高并发时只能占满一个核心。
+server_processes 大于 1 时由监督者启动多个工作进程，各自以 SO_REUSEPORT 绑定同一端口，
+内核在进程间分配新连接；每个进程有独立的应用、上游连接池与准入计数。
+工作进程以 spawn 方式启动（父进程已有后台线程，fork 不安全），日志与统计经队列回传，
+由监督者写入原有日志函数；工作进程意外退出时按退避时间重启。
+停止信号通过每个进程独立的管道传递：监督者关闭写端即通知停止，监督者进程被强制结束时
+写端同样关闭，工作进程不会残留占用端口（进程间共享的 Event 在进程被杀死后可能死锁）。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import multiprocessing
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from importlib import import_module
+from multiprocessing.connection import Connection
+from multiprocessing.connection import wait as wait_sentinels
+
+from modules.runtime.error_codes import ErrorCode
+from modules.runtime.operation_result import OperationResult
+from modules.runtime.thread_manager import ThreadManager
+
+# 工作进程启动（绑定端口）的时限（秒）
+WORKER_START_TIMEOUT = 15
+# 工作进程回传统计的间隔（秒）
+WORKER_STATS_INTERVAL = 5.0
+# 意外退出后重启的初始等待与上限（秒），运行不足 WORKER_STABLE_UPTIME 秒即退出时加倍
+WORKER_RESTART_DELAY = 1.0
+WORKER_RESTART_DELAY_MAX = 30.0
+WORKER_STABLE_UPTIME = 10.0
+# 停止时在排空时限之外额外等待工作进程退出的时间（秒）
+WORKER_EXIT_GRACE = 5
+
+_MONITOR_INTERVAL = 0.5
+
+
+def reuse_port_supported() -> bool:
+    """SO_REUSEPORT 只在 Linux 上按连接做负载均衡，其他平台不启用多进程模式。"""
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+
+@dataclass(frozen=True)
+class WorkerSpec:
+    """传给工作进程的启动参数（需可 pickle）。"""
+
+    config: dict
+    hosts: tuple[str, ...]
+    port: int
+
+
+def _worker_main(index: int, spec: WorkerSpec, messages, stop_signal) -> None:
+    """工作进程入口：在进程内启动代理，等待停止信号后排空并退出。"""
+    # Ctrl+C 会发给整个进程组，由监督者统一停止工作进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # proxy_server 依赖本模块，运行时再导入
+    proxy_server_cls = import_module("modules.proxy.proxy_server").ProxyServer
+
+    def log(message: str) -> None:
+        messages.put(("log", index, message))
+
+    proxy = proxy_server_cls(spec.config, log, thread_manager=ThreadManager(), worker_index=index)
+    result = proxy.start_result(hosts=spec.hosts, port=spec.port)
+    messages.put(("started", index, result))
+    if not result.ok:
+        sys.exit(1)
+
+    # 写端关闭（停止或监督者退出）时 poll 返回 True
+    while not stop_signal.poll(WORKER_STATS_INTERVAL):
+        if not proxy.is_running():
+            log("服务器线程意外退出")
+            sys.exit(1)
+        messages.put(("stats", index, proxy.get_stats()))
+    result = proxy.stop()
+    messages.put(("stopped", index, result.details))
+
+
+@dataclass
+class WorkerState:
+    """监督者记录的单个工作进程状态。"""
+
+    index: int
+    process: multiprocessing.process.BaseProcess | None = None
+    stop_signal: Connection | None = None
+    started_at: float = 0.0
+    restarts: int = 0
+    restart_delay: float = WORKER_RESTART_DELAY
+    stats: dict[str, object] = field(default_factory=dict)
+    drain_report: dict[str, int] = field(default_factory=dict)
+
+    def snapshot(self) -> dict[str, object]:
+        process = self.process
+        return {
+            "index": self.index,
+            "pid": process.pid if process else None,
+            "alive": bool(process and process.is_alive()),
+            "restarts": self.restarts,
+        }
+
+
+def _merge_value(key: str, current, value):
+    if isinstance(current, dict) and isinstance(value, dict):
+        return _merge_stats([current, value])
+    if isinstance(current, list) and isinstance(value, list):
+        # 进行中的流逐个列出；各进程相同的列表（例如监听地址）只保留一份
+        return current if current == value else current + value
+    if isinstance(value, bool) or not isinstance(value, int) or not isinstance(current, int):
+        return current
+    if key.endswith("_max"):
+        return max(current, value)
+    return current + value
+
+
+def _merge_stats(snapshots: list[dict[str, object]]) -> dict[str, object]:
+    """整数计数按进程求和（*_max 取最大值），嵌套字典逐项合并，其余字段取第一个进程的值。"""
+    merged: dict[str, object] = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            merged[key] = _merge_value(key, merged[key], value) if key in merged else value
+    return merged
+
+
+class ProxyWorkerPool:
+    """工作进程监督者：启动、监控、重启并停止工作进程。"""
+
+    def __init__(
+        self,
+        config: dict,
+        log_func,
+        *,
+        processes: int,
+        drain_timeout: int,
+        thread_manager: ThreadManager,
+    ) -> None:
+        self._config = config
+        self._log = log_func
+        self._drain_timeout = drain_timeout
+        self._thread_manager = thread_manager
+        self._context = multiprocessing.get_context("spawn")
+        self._messages = self._context.Queue()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = [WorkerState(index) for index in range(processes)]
+        self._spec: WorkerSpec | None = None
+        self._pump_task_id: str | None = None
+        self._monitor_task_id: str | None = None
+        self._running = False
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def _spawn(self, worker: WorkerState) -> None:
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker.index, self._spec, self._messages, reader),
+            name=f"mtga-proxy-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        reader.close()
+        self._signal_stop(worker)
+        worker.stop_signal = writer
+        worker.process = process
+        worker.started_at = time.monotonic()
+        worker.stats = {}
+
+    @staticmethod
+    def _signal_stop(worker: WorkerState) -> None:
+        if worker.stop_signal is not None:
+            worker.stop_signal.close()
+            worker.stop_signal = None
+
+    def _worker_log(self, index: int, message: str) -> None:
+        self._log(f"[工作进程 {index}] {message}")
+
+    def _handle_message(self, kind: str, index: int, payload) -> OperationResult | None:
+        """处理一条工作进程消息，启动结果原样返回给调用方。"""
+        worker = self._workers[index]
+        if kind == "log":
+            self._worker_log(index, payload)
+        elif kind == "stats":
+            worker.stats = payload
+        elif kind == "stopped":
+            worker.drain_report = payload
+        elif kind == "started":
+            return payload
+        return None
+
+    def _collect_start_results(self) -> list[OperationResult]:
+        """等待全部工作进程回报启动结果，期间转发它们的日志。"""
+        results: dict[int, OperationResult] = {}
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while len(results) < len(self._workers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                kind, index, payload = self._messages.get(timeout=remaining)
+            except queue.Empty:
+                break
+            result = self._handle_message(kind, index, payload)
+            if result is not None:
+                results[index] = result
+        for worker in self._workers:
+            if worker.index not in results:
+                self._worker_log(worker.index, "启动超时")
+                results[worker.index] = OperationResult.failure(
+                    "工作进程启动超时", code=ErrorCode.UNKNOWN
+                )
+        return [results[worker.index] for worker in self._workers]
+
+    def start(self, *, hosts: tuple[str, ...], port: int) -> OperationResult:
+        self._spec = WorkerSpec(self._config, hosts, port)
+        self._log(f"多进程模式: 启动 {len(self._workers)} 个工作进程（SO_REUSEPORT）")
+        for worker in self._workers:
+            self._spawn(worker)
+
+        results = self._collect_start_results()
+        for worker, result in zip(self._workers, results, strict=True):
+            process = worker.process
+            if not result.ok and process is not None:
+                # 启动失败的进程不参与崩溃重启
+                if process.is_alive():
+                    process.terminate()
+                process.join(timeout=WORKER_EXIT_GRACE)
+                self._signal_stop(worker)
+                worker.process = None
+        started = sum(result.ok for result in results)
+        if not started:
+            self._terminate_all()
+            self._messages.close()
+            failure = next((r for r in results if r.code is not None), results[0])
+            self._log("全部工作进程启动失败")
+            return OperationResult.failure(
+                failure.message or "工作进程启动失败", code=failure.code, **failure.details
+            )
+
+        self._running = True
+        self._pump_task_id = self._thread_manager.run(
+            "proxy_worker_messages", self._pump_messages, allow_parallel=True
+        )
+        self._monitor_task_id = self._thread_manager.run(
+            "proxy_worker_monitor", self._monitor_workers, allow_parallel=True
+        )
+        self._log(f"多进程模式: {started}/{len(self._workers)} 个工作进程已就绪")
+        first_ok = next(result for result in results if result.ok)
+        return OperationResult.success(processes=started, **first_ok.details)
+
+    def _pump_messages(self) -> None:
+        while True:
+            message = self._messages.get()
+            if message is None:
+                return
+            kind, index, payload = message
+            result = self._handle_message(kind, index, payload)
+            if result is not None and not result.ok:
+                self._worker_log(index, f"重启后启动失败: {result.message}")
+
+    def _monitor_workers(self) -> None:
+        """等待工作进程退出；非停止期间的退出视为崩溃，按退避时间重启。"""
+        while not self._stopping.is_set():
+            with self._lock:
+                sentinels = {
+                    worker.process.sentinel: worker
+                    for worker in self._workers
+                    if worker.process is not None
+                }
+            ready = wait_sentinels(list(sentinels), timeout=_MONITOR_INTERVAL)
+            for sentinel in ready:
+                worker = sentinels[sentinel]
+                if self._stopping.is_set():
+                    return
+                self._restart(worker)
+
+    def _restart(self, worker: WorkerState) -> None:
+        process = worker.process
+        if process is None:
+            return
+        process.join()
+        uptime = time.monotonic() - worker.started_at
+        if uptime >= WORKER_STABLE_UPTIME:
+            worker.restart_delay = WORKER_RESTART_DELAY
+        delay = worker.restart_delay
+        self._worker_log(
+            worker.index,
+            f"进程 {process.pid} 意外退出，退出码 {process.exitcode}，{delay:.0f} 秒后重启",
+        )
+        worker.restart_delay = min(delay * 2, WORKER_RESTART_DELAY_MAX)
+        with self._lock:
+            worker.process = None
+        if self._stopping.wait(delay):
+            return
+        with self._lock:
+            self._spawn(worker)
+            worker.restarts += 1
+
+    def _terminate_all(self) -> None:
+        for worker in self._workers:
+            self._signal_stop(worker)
+            process = worker.process
+            if process is not None and process.is_alive():
+                process.terminate()
+            if process is not None:
+                process.join(timeout=WORKER_EXIT_GRACE)
+
+    def stop(self) -> OperationResult:
+        """通知全部工作进程排空并退出，超时未退出的进程被强制终止。"""
+        if not self._running:
+            return OperationResult.success()
+        self._log("正在停止全部工作进程...")
+        self._stopping.set()
+        with self._lock:
+            for worker in self._workers:
+                self._signal_stop(worker)
+        self._thread_manager.wait(self._monitor_task_id, timeout=_MONITOR_INTERVAL * 4)
+
+        deadline = time.monotonic() + self._drain_timeout + WORKER_EXIT_GRACE
+        forced = 0
+        with self._lock:
+            processes = [w.process for w in self._workers if w.process is not None]
+        for process in processes:
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                forced += 1
+                process.terminate()
+                process.join(timeout=WORKER_EXIT_GRACE)
+
+        self._messages.put(None)
+        self._thread_manager.wait(self._pump_task_id, timeout=WORKER_EXIT_GRACE)
+        with contextlib.suppress(Exception):
+            self._messages.close()
+        self._running = False
+
+        drain_report = _merge_stats([worker.drain_report for worker in self._workers])
+        if forced:
+            self._log(f"{forced} 个工作进程未能按时退出，已强制终止")
+            return OperationResult.failure(
+                "工作进程未完全停止", code=ErrorCode.UNKNOWN, **drain_report
+            )
+        self._log("全部工作进程已停止")
+        return OperationResult.success(**drain_report)
+
+    def get_stats(self) -> dict[str, object]:
+        with self._lock:
+            workers = [worker.snapshot() for worker in self._workers]
+            merged = _merge_stats([worker.stats for worker in self._workers if worker.stats])
+        counters = merged.get("counters")
+        if isinstance(counters, dict):
+            connections = counters.get("inbound_connections", 0)
+            requests = counters.get("inbound_requests", 0)
+            merged["requests_per_connection"] = (
+                round(requests / connections, 2) if connections else 0.0
+            )
+        return {
+            **merged,
+            "running": self._running,
+            "processes": len(workers),
+            "workers": workers,
+        }
+
+
+__all__ = [
+    "WORKER_RESTART_DELAY",
+    "WORKER_RESTART_DELAY_MAX",
+    "WORKER_START_TIMEOUT",
+    "WORKER_STATS_INTERVAL",
+    "ProxyWorkerPool",
+    "reuse_port_supported",
+]
@@ -15,6 +15,8 @@ class RestartProxyDeps:
     log: Callable[[str], None]
     stop_proxy_instance: Callable[..., OperationResult]
     start_proxy_instance: Callable[..., OperationResult]
+    # 可选：对运行中的实例热重载配置，失败时回退到停止后重新启动
+    reload_proxy_instance: Callable[[dict[str, Any]], OperationResult] | None = None
 
 
 @dataclass(frozen=True)
@@ -77,6 +79,11 @@ def restart_proxy_result(
     stream_mode_value = config.get("stream_mode")
     if stream_mode_value is not None:
         deps.log(f"启用强制流模式: {stream_mode_value}")
+    if deps.reload_proxy_instance is not None:
+        reload_result = deps.reload_proxy_instance(config)
+        if reload_result.ok:
+            deps.log(success_message)
+            return OperationResult.success(**reload_result.details)
     deps.stop_proxy_instance(reason="restart")
     start_result = deps.start_proxy_instance(
         config,
@@ -106,6 +113,23 @@ def restart_proxy(
     ).ok
 
 
+def reload_proxy_instance_result(
+    *,
+    config: dict[str, Any],
+    get_proxy_instance: Callable[[], Any | None],
+    log: Callable[[str], None],
+) -> OperationResult:
+    instance = get_proxy_instance()
+    if not (instance and instance.is_running()):
+        return OperationResult.failure("代理服务器未运行")
+    log("检测到代理服务器正在运行，尝试热重载配置...")
+    try:
+        return instance.reload(config)
+    except Exception as exc:  # noqa: BLE001
+        log(f"热重载配置时出错: {exc}")
+        return OperationResult.failure("热重载配置失败", code=ErrorCode.UNKNOWN)
+
+
 def stop_proxy_instance_result(
     *,
     get_proxy_instance: Callable[[], Any | None],
@@ -120,14 +144,18 @@ def stop_proxy_instance_result(
             log("检测到代理服务器正在运行，正在停止旧实例...")
         else:
             log("正在停止代理服务器...")
+        details: dict[str, Any] = {}
         try:
-            instance.stop()
+            stop_result = instance.stop()
+            if isinstance(stop_result, OperationResult):
+                # 排空结果：drained_streams / aborted_streams
+                details = stop_result.details
             log("✅ 代理服务器已停止")
         except Exception as exc:  # noqa: BLE001
             log(f"停止代理服务器时出错: {exc}")
         finally:
             set_proxy_instance(None)
-        return OperationResult.success()
+        return OperationResult.success(**details)
     if show_idle_message:
         log("代理服务器未运行")
     return OperationResult.success()
@@ -150,6 +150,11 @@ def _restart_proxy_result(
                 log_func=log_func,
                 **kwargs,
             ),
+            reload_proxy_instance=lambda cfg: proxy_orchestration.reload_proxy_instance_result(
+                config=cfg,
+                get_proxy_instance=_get_proxy_instance,
+                log=log_func,
+            ),
         ),
         success_message=success_message,
         hosts_modified=hosts_modified,
@@ -339,6 +344,19 @@ async def proxy_stop() -> dict[str, Any]:
     return build_result_payload(result, logs, "代理服务器停止完成")
 
 
+async def proxy_stats() -> dict[str, Any]:
+    logs, _log = collect_logs()
+    instance = _get_proxy_instance()
+    if not instance or not instance.is_running():
+        return build_result_payload(
+            OperationResult.failure("代理服务器未运行"),
+            logs,
+            "获取代理运行统计失败",
+        )
+    result = OperationResult.success(stats=instance.get_stats())
+    return build_result_payload(result, logs, "获取代理运行统计完成")
+
+
 async def proxy_check_network() -> dict[str, Any]:
     logs, log_func = collect_logs()
     report = check_network_environment(log_func=log_func, emit_logs=True)
@@ -386,5 +404,6 @@ async def proxy_start_all(body: ProxyStartPayload) -> dict[str, Any]:
 def register_proxy_commands(commands: Commands) -> None:
     commands.set_command("proxy_start", proxy_start)
     commands.set_command("proxy_stop", proxy_stop)
+    commands.set_command("proxy_stats", proxy_stats)
     commands.set_command("proxy_check_network", proxy_check_network)
     commands.set_command("proxy_start_all", proxy_start_all)